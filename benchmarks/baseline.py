@@ -0,0 +1,95 @@
+"""Stored benchmark baselines and regression checks.
+
+Baselines live in ``benchmarks/baselines.json``, keyed by benchmark name and
+dataset size. A result regresses when it is more than ``tolerance`` worse
+than its baseline: slower or bigger for timings and memory, lower for
+throughput (metrics ending in ``_per_s``). Differences below a small
+absolute floor are ignored, so sub-millisecond stages do not fail on
+timer noise. Baselines are machine-specific,
+so refresh them with ``--update-baseline`` on the machine that checks them.
+"""
+
+from typing import Dict, List
+import json
+import os
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+DEFAULT_TOLERANCE = 0.5
+
+# Smallest absolute change that counts, by metric unit suffix
+NOISE_FLOORS = {"_s": 0.002, "_ms": 2.0, "_mb": 16.0}
+
+Results = Dict[str, float]
+
+
+def higher_is_better(metric: str) -> bool:
+    return metric.endswith("_per_s")
+
+
+def load(bench: str, size: int, path: str = BASELINE_PATH) -> Results:
+    """Baseline results of ``bench`` at ``size`` rows, empty if none."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as baseline_file:
+        return json.load(baseline_file).get(bench, {}).get(str(size), {})
+
+
+def save(bench: str, size: int, results: Results, path: str = BASELINE_PATH) -> None:
+    """Store ``results`` as the baseline of ``bench`` at ``size`` rows."""
+    stored: Dict[str, Dict[str, Results]] = {}
+    if os.path.exists(path):
+        with open(path) as baseline_file:
+            stored = json.load(baseline_file)
+    stored.setdefault(bench, {})[str(size)] = {
+        metric: round(value, 6) for metric, value in sorted(results.items())
+    }
+    with open(path, "w") as baseline_file:
+        json.dump(stored, baseline_file, indent=2, sort_keys=True)
+        baseline_file.write("\n")
+
+
+def regressions(
+    results: Results, baseline: Results, tolerance: float = DEFAULT_TOLERANCE
+) -> List[str]:
+    """Describe every result more than ``tolerance`` worse than its baseline."""
+    found = []
+    for metric, expected in sorted(baseline.items()):
+        actual = results.get(metric)
+        if actual is None or expected <= 0:
+            continue
+        if higher_is_better(metric):
+            worse = actual < expected / (1 + tolerance)
+        else:
+            floor = next(
+                (v for unit, v in NOISE_FLOORS.items() if metric.endswith(unit)), 0.0
+            )
+            worse = actual > max(expected * (1 + tolerance), expected + floor)
+        if worse:
+            found.append(f"{metric}: {actual:.4g} vs baseline {expected:.4g}")
+    return found
+
+
+def check(
+    bench: str,
+    size: int,
+    results: Results,
+    update: bool = False,
+    tolerance: float = DEFAULT_TOLERANCE,
+) -> int:
+    """Compare against (or update) the stored baseline; return an exit code."""
+    if update:
+        save(bench, size, results)
+        print(f"Stored {bench} baseline for {size} rows")
+        return 0
+    baseline = load(bench, size)
+    if not baseline:
+        print(f"No {bench} baseline for {size} rows; run with --update-baseline")
+        return 0
+    found = regressions(results, baseline, tolerance)
+    for line in found:
+        print(f"REGRESSION {line}")
+    if not found:
+        print(
+            f"No regressions against the {bench} baseline (tolerance {tolerance:.0%})"
+        )
+    return 1 if found else 0
@@ -0,0 +1,155 @@
+"""Cold start of one worker: process start to the first byte of ``/``.
+
+Starts ``uvicorn app.main:app`` in a fresh process, connects as soon as it
+listens and times the first response byte of ``GET /``, then the same
+request again once everything is warm. Each start runs in three setups:
+
+- ``source``: no template bytecode cache and no snapshot, so the worker
+  reads the source and compiles every template
+- ``precompiled``: templates loaded from a cache filled by
+  ``python -m app.templating`` beforehand
+- ``snapshot``: precompiled templates plus a warm start from a snapshot
+
+    python -m benchmarks.bench_cold_start --rows 1000000
+    python -m benchmarks.bench_cold_start --rows 1000000 --check
+"""
+
+from typing import Dict, List, Optional
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import baseline
+from benchmarks.synthetic import write_csv
+
+SETUPS = ("source", "precompiled", "snapshot")
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def first_byte(port: int, deadline: float) -> float:
+    """Send ``GET /`` once the server listens; return when its first byte came."""
+    while True:
+        try:
+            connection = socket.create_connection(("127.0.0.1", port), timeout=60)
+            break
+        except ConnectionRefusedError:
+            if time.perf_counter() > deadline:
+                raise TimeoutError("Server did not start listening") from None
+            time.sleep(0.002)
+    with connection:
+        connection.sendall(b"GET / HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n")
+        if not connection.recv(1):
+            raise RuntimeError("Connection closed without a response")
+        return time.perf_counter()
+
+
+def start(env: Dict[str, str], timeout: float) -> Dict[str, float]:
+    """Start one worker, time its first and second responses, and stop it."""
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        first = first_byte(port, started + timeout) - started
+        request_start = time.perf_counter()
+        second = first_byte(port, request_start + timeout) - request_start
+    finally:
+        server.terminate()
+        server.wait()
+    return {"first_byte_s": first, "warm_first_byte_s": second}
+
+
+def run(path: str, repeat: int, timeout: float) -> Dict[str, float]:
+    results: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        base_env = dict(
+            os.environ,
+            DATA_SOURCE="csv",
+            DATA_PATH=path,
+            STATIC_DIR="src/app/static",
+            PYTHONPATH=os.pathsep.join(filter(None, ["src", os.getenv("PYTHONPATH")])),
+        )
+        cache_dir = os.path.join(work_dir, "templates")
+        snapshot_path = os.path.join(work_dir, "trends.snapshot")
+        subprocess.run(
+            [sys.executable, "-m", "app.templating", "--cache-dir", cache_dir],
+            env=base_env,
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        envs = {
+            "source": base_env,
+            "precompiled": dict(base_env, TEMPLATE_CACHE_DIR=cache_dir),
+            "snapshot": dict(
+                base_env, TEMPLATE_CACHE_DIR=cache_dir, SNAPSHOT_PATH=snapshot_path
+            ),
+        }
+        # Leave a snapshot behind, as a previous run would have
+        start(envs["snapshot"], timeout)
+
+        for setup in SETUPS:
+            runs: List[Dict[str, float]] = [
+                start(envs[setup], timeout) for _ in range(repeat)
+            ]
+            for metric in runs[0]:
+                results[f"{setup}.{metric}"] = statistics.median(
+                    result[metric] for result in runs
+                )
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--rows", type=int, default=0, help="Synthetic rows (default: the example)"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument(
+        "--data-dir", default=os.path.join(tempfile.gettempdir(), "trend-bench")
+    )
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=baseline.DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    if args.rows:
+        os.makedirs(args.data_dir, exist_ok=True)
+        path = os.path.join(args.data_dir, f"trends_{args.rows}.csv")
+        if not os.path.exists(path):
+            write_csv(path, args.rows)
+    else:
+        path = os.path.join("src", "app", "data", "example_data.csv")
+
+    results = run(path, args.repeat, args.timeout)
+    print(f"{'setup':>12} {'first byte ms':>14} {'warm ms':>9}")
+    for setup in SETUPS:
+        print(
+            f"{setup:>12} {results[f'{setup}.first_byte_s'] * 1000:>14.1f} "
+            f"{results[f'{setup}.warm_first_byte_s'] * 1000:>9.1f}"
+        )
+
+    if args.check or args.update_baseline:
+        sys.exit(
+            baseline.check(
+                "cold_start", args.rows, results, args.update_baseline, args.tolerance
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
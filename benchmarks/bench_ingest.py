@@ -0,0 +1,120 @@
+"""Throughput benchmark for streaming CSV ingestion.
+
+Generates synthetic exports (cached under ``--data-dir``) and ingests each
+one in a fresh child process, so peak RSS reflects a single ingest:
+
+    python -m benchmarks.bench_ingest --rows 10000 1000000 10000000
+
+``--legacy`` also times the old ``csv.DictReader`` + list-of-dicts path.
+"""
+
+from typing import Any, Dict
+import argparse
+import csv
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import write_csv
+
+NUMERIC_FIELDS = [
+    "revenue_daily_change",
+    "revenue_weekly_change",
+    "revenue_monthly_change",
+    "commission_daily_change",
+    "commission_weekly_change",
+    "commission_monthly_change",
+]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def ingest_streaming(path: str) -> Dict[str, Any]:
+    from app.ingest import read_trend_csv
+
+    start = time.perf_counter()
+    table = read_trend_csv(path).table
+    order = table.order_by("revenue_weekly_change", descending=True, absolute=True)
+    table = table.select(order)
+    elapsed = time.perf_counter() - start
+    compact = sum(c.codes.nbytes for c in table.dimensions.values())
+    compact += sum(m.nbytes for m in table.metrics.values())
+    return {"rows": len(table), "seconds": elapsed, "table_mb": compact / 2**20}
+
+
+def ingest_legacy(path: str) -> Dict[str, Any]:
+    start = time.perf_counter()
+    results = []
+    with open(path, newline="") as csvfile:
+        for row in csv.DictReader(csvfile):
+            for field in NUMERIC_FIELDS:
+                if row[field]:
+                    try:
+                        row[field] = float(row[field])
+                    except ValueError:
+                        row[field] = 0.0
+            results.append(row)
+    results.sort(key=lambda x: abs(x["revenue_weekly_change"]), reverse=True)
+    return {"rows": len(results), "seconds": time.perf_counter() - start}
+
+
+def run_child(mode: str, path: str) -> Dict[str, Any]:
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_ingest", "--child", mode, path],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000]
+    )
+    parser.add_argument(
+        "--data-dir", default=os.path.join(tempfile.gettempdir(), "trend-bench")
+    )
+    parser.add_argument("--legacy", action="store_true")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "PATH"))
+    args = parser.parse_args()
+
+    if args.child:
+        mode, path = args.child
+        result = ingest_legacy(path) if mode == "legacy" else ingest_streaming(path)
+        result["peak_rss_mb"] = peak_rss_mb()
+        print(json.dumps(result))
+        return
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    modes = ["streaming", "legacy"] if args.legacy else ["streaming"]
+    print(
+        f"{'rows':>10} {'mode':>10} {'seconds':>8} {'rows/s':>11} "
+        f"{'MB/s':>7} {'peak MB':>8} {'table MB':>8}"
+    )
+    for rows in args.rows:
+        path = os.path.join(args.data_dir, f"trends_{rows}.csv")
+        if not os.path.exists(path):
+            write_csv(path, rows)
+        size_mb = os.path.getsize(path) / 2**20
+        for mode in modes:
+            result = run_child(mode, path)
+            seconds = result["seconds"]
+            table_mb = result.get("table_mb")
+            print(
+                f"{rows:>10} {mode:>10} {seconds:>8.2f} {rows / seconds:>11,.0f} "
+                f"{size_mb / seconds:>7.1f} {result['peak_rss_mb']:>8.0f} "
+                f"{table_mb if table_mb is not None else float('nan'):>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
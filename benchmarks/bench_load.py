@@ -0,0 +1,213 @@
+"""In-process load test of every ``GET /api/trends/*`` endpoint.
+
+Starts the app (lifespan included) on a synthetic export and drives it
+through an ASGI transport, so no server or network is involved. Each
+endpoint gets ``--requests`` requests from ``--concurrency`` concurrent
+clients (or ``--duration`` seconds, whichever ends first), sent like a
+browser would with ``Accept-Encoding: gzip``. Reports p50/p99 latency
+and throughput per endpoint and the peak RSS of the process:
+
+    python -m benchmarks.bench_load --rows 100000
+    python -m benchmarks.bench_load --rows 100000 --check
+
+The stream endpoint never completes a response and the refresh endpoint
+changes the data, so neither is load tested here.
+"""
+
+from typing import Any, Dict, List, Tuple
+import argparse
+import asyncio
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+import numpy as np
+
+from benchmarks import baseline
+from benchmarks.synthetic import write_csv
+
+
+def endpoints(key: Tuple[str, str, str, str]) -> List[Tuple[str, str]]:
+    """(label, URL) of each endpoint to load, with typical parameters."""
+    country, level_1, level_2, level_3 = key
+    leaf = {"country": country, "level1": level_1, "level2": level_2}
+    return [
+        ("trends", "/api/trends"),
+        ("gainers", "/api/trends/gainers?" + urlencode({"country": country})),
+        ("losers", "/api/trends/losers?" + urlencode({"country": country})),
+        ("filter_all", "/api/trends/filter?" + urlencode({"country": country})),
+        (
+            "filter",
+            "/api/trends/filter?"
+            + urlencode({"category": level_1, "country": country}),
+        ),
+        (
+            "filter_multi",
+            "/api/trends/filter?"
+            + urlencode(
+                [
+                    ("country", country),
+                    ("country", "US"),
+                    ("where", "revenue_weekly_change>0.05"),
+                ]
+            ),
+        ),
+        (
+            "query",
+            "/api/trends/query?"
+            + urlencode(
+                [
+                    ("country", country),
+                    ("country", "US"),
+                    ("level1", level_1),
+                    ("where", "revenue_weekly_change>0.05"),
+                    ("sort", "-trend_score"),
+                    ("limit", 100),
+                ]
+            ),
+        ),
+        ("export", "/api/trends/export?" + urlencode({"country": country})),
+        ("home", "/"),
+        ("ticker", "/api/trends/ticker"),
+        ("categories", "/api/trends/categories"),
+        ("countries", "/api/trends/countries"),
+        (
+            "top",
+            "/api/trends/top?"
+            + urlencode({"metric": "trend_score", "k": 10, "country": country}),
+        ),
+        (
+            "cube",
+            "/api/trends/cube?" + urlencode({"country": country, "level1": level_1}),
+        ),
+        (
+            "history",
+            "/api/trends/history?"
+            + urlencode({**leaf, "level3": level_3, "format": "svg"}),
+        ),
+    ]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def load(
+    client: Any, url: str, requests: int, concurrency: int, duration: float
+) -> Dict[str, float]:
+    latencies: List[float] = []
+    deadline = time.perf_counter() + duration
+    remaining = iter(range(requests))
+
+    async def worker() -> None:
+        for _ in remaining:
+            if time.perf_counter() > deadline:
+                return
+            start = time.perf_counter()
+            # Read the body without decompressing it: a browser would do that
+            # in its own process, not in the server's
+            async with client.stream(
+                "GET", url, headers={"Accept-Encoding": "gzip"}
+            ) as response:
+                async for _ in response.aiter_raw():
+                    pass
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise RuntimeError(f"{url} returned {response.status_code}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    timings = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p99_ms": float(np.percentile(timings, 99)),
+        "requests_per_s": len(latencies) / elapsed,
+    }
+
+
+async def run(args: argparse.Namespace, path: str) -> Dict[str, Dict[str, float]]:
+    # Settings are read on import, so point the app at the export first
+    os.environ["DATA_SOURCE"] = "csv"
+    os.environ["DATA_PATH"] = path
+    os.environ.setdefault("STATIC_DIR", "src/app/static")
+    # Every simulated client shares one address, so no per-client limit
+    os.environ["CLIENT_RATE_PER_SECOND"] = "0"
+    import httpx
+
+    from app.database import fetch_trends
+    from app.main import app
+
+    logging.disable(logging.WARNING)
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        # Parameters from a row of the latest day, so every endpoint has data
+        table = await fetch_trends()
+        latest = table.mask(event_date=max(table.distinct("event_date")))
+        row = table[int(latest.argmax())]
+        key = (
+            row.campaign_country,
+            row.product_category_level_1,
+            row.product_category_level_2,
+            row.product_category_level_3,
+        )
+        stats = {}
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            for label, url in endpoints(key):
+                stats[label] = await load(
+                    client, url, args.requests, args.concurrency, args.duration
+                )
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument(
+        "--data-dir", default=os.path.join(tempfile.gettempdir(), "trend-bench")
+    )
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=baseline.DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    path = os.path.join(args.data_dir, f"trends_{args.rows}.csv")
+    if not os.path.exists(path):
+        write_csv(path, args.rows)
+
+    stats = asyncio.run(run(args, path))
+    rss = peak_rss_mb()
+    print(f"{'endpoint':>12} {'requests':>9} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>9}")
+    for label, result in stats.items():
+        print(
+            f"{label:>12} {result['requests']:>9.0f} {result['p50_ms']:>9.2f} "
+            f"{result['p99_ms']:>9.2f} {result['requests_per_s']:>9.0f}"
+        )
+    print(f"peak RSS {rss:.0f} MB")
+
+    if args.check or args.update_baseline:
+        results = {"peak_rss_mb": rss}
+        for label, result in stats.items():
+            for metric in ("p50_ms", "p99_ms", "requests_per_s"):
+                results[f"{label}.{metric}"] = result[metric]
+        sys.exit(
+            baseline.check(
+                "load", args.rows, results, args.update_baseline, args.tolerance
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
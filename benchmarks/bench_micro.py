@@ -0,0 +1,162 @@
+"""Micro-benchmarks of each stage between a trend export and a response.
+
+Times ingest, scoring, sorting, every per-refresh structure, filtering
+and ad-hoc queries (indexed against a full scan) and template rendering on one
+synthetic export, taking the best of ``--repeat`` runs of each:
+
+    python -m benchmarks.bench_micro --rows 1000000
+    python -m benchmarks.bench_micro --rows 1000000 --check
+
+``--check`` exits non-zero if any stage regressed against the stored
+baseline (see ``benchmarks/baseline.py``); ``--update-baseline`` stores the
+run as the new baseline.
+"""
+
+from typing import Callable, Dict
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks import baseline
+from benchmarks.synthetic import write_csv
+
+
+def best_of(repeat: int, func: Callable[[], object]) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(path: str, repeat: int) -> Dict[str, float]:
+    from app.config import settings
+    from app.cube import CategoryCube
+    from app.database import SORT_COLUMN
+    from app.index import PartitionIndex
+    from app.ingest import read_trend_csv
+    from app.main import templates
+    from app.query import BitmapIndex, TrendQuery, parse_range
+    from app.scoring import ScoringRules, score_trends
+    from app.store import TrendTable
+    from app.topk import TopK, top_indices
+
+    rules = ScoringRules.from_settings(settings)
+    raw = read_trend_csv(path).table
+    scored = score_trends(raw, rules)
+    table = scored.select(scored.order_by(SORT_COLUMN, descending=True, absolute=True))
+    index = PartitionIndex.build(table)
+    top = TopK(table, max_k=settings.top_k_max)
+    country, category = "UK", "electronics"
+
+    def full_scan() -> None:
+        where = table.mask(campaign_country=country, product_category_level_1=category)
+        table.rows(table.ranked("trend_score", ascending=False, where=where))
+        table.rows(table.ranked("trend_score", ascending=True, where=where))
+
+    def indexed() -> None:
+        index.gainers(category, country)
+        index.losers(category, country)
+
+    # Two countries, one category and two metric ranges
+    bitmaps = BitmapIndex.build(table)
+    query = TrendQuery.create(
+        {"campaign_country": [country, "US"], "product_category_level_1": [category]},
+        [
+            parse_range("revenue_weekly_change>0.2"),
+            parse_range("commission_monthly_change<0"),
+        ],
+    )
+
+    def query_scan() -> None:
+        where = table.mask(campaign_country=country) | table.mask(campaign_country="US")
+        where &= table.mask(product_category_level_1=category)
+        where &= table.metric("revenue_weekly_change") > 0.2
+        where &= table.metric("commission_monthly_change") < 0
+        np.flatnonzero(where)
+
+    grid = templates.get_template("layouts/trends_grid.html")
+    ticker = templates.get_template("ticker.html")
+
+    stages: Dict[str, Callable[[], object]] = {
+        "ingest": lambda: read_trend_csv(path),
+        "score": lambda: score_trends(raw, rules),
+        "sort": lambda: scored.select(
+            scored.order_by(SORT_COLUMN, descending=True, absolute=True)
+        ),
+        # A fresh table object, so the fingerprint is not already cached
+        "version": lambda: TrendTable(table.dimensions, table.metrics).version,
+        "index_build": lambda: PartitionIndex.build(table),
+        "topk_build": lambda: TopK(table, max_k=settings.top_k_max),
+        "cube_build": lambda: CategoryCube.build(table),
+        "filter_scan": full_scan,
+        "filter_index": indexed,
+        "bitmap_build": lambda: BitmapIndex.build(table),
+        "query_scan": query_scan,
+        "query_bitmap": lambda: bitmaps.rows(query),
+        # A scoped top-K selection on first use; later uses are memoized
+        "top_scoped": lambda: top_indices(
+            table.metric("revenue_weekly_change"),
+            settings.top_k_max,
+            largest=True,
+            where=table.mask(
+                campaign_country=country, product_category_level_1=category
+            ),
+        ),
+        "render_grid": lambda: grid.render(
+            gainers=index.gainers(category, country),
+            losers=index.losers(category, country),
+        ),
+        "render_ticker": lambda: ticker.render(
+            trends=sum(top.top("revenue_weekly_change", 5), [])
+        ),
+    }
+    results = {}
+    for name, func in stages.items():
+        # Ingest is seconds at 1M rows, so it is not worth repeating as often
+        results[f"{name}_s"] = best_of(
+            min(repeat, 3) if name == "ingest" else repeat, func
+        )
+    results["rows_per_s"] = len(raw) / results["ingest_s"]
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--data-dir", default=os.path.join(tempfile.gettempdir(), "trend-bench")
+    )
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=baseline.DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    path = os.path.join(args.data_dir, f"trends_{args.rows}.csv")
+    if not os.path.exists(path):
+        write_csv(path, args.rows)
+
+    results = run(path, args.repeat)
+    print(f"{'stage':>16} {'ms':>10}")
+    for metric, value in results.items():
+        if not baseline.higher_is_better(metric):
+            print(f"{metric[:-2]:>16} {value * 1000:>10.2f}")
+    print(f"{'ingest rows/s':>16} {results['rows_per_s']:>10,.0f}")
+
+    if args.check or args.update_baseline:
+        sys.exit(
+            baseline.check(
+                "micro", args.rows, results, args.update_baseline, args.tolerance
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
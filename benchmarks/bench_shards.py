@@ -0,0 +1,122 @@
+"""Sharded ingest: one export split into shards, parsed by 1..N processes.
+
+Splits a synthetic export into ``--shards`` CSV files (cached under
+``--data-dir``), then times ``ShardedSource.load`` from cold with each
+worker count, and an incremental reload where no shard changed. ``single``
+is the same rows read as one file by ``CSVSource``, for reference:
+
+    python -m benchmarks.bench_shards --rows 1000000 --shards 32
+    python -m benchmarks.bench_shards --rows 1000000 --shards 32 --check
+
+The speedup is bounded by the cores the process may use (``nproc``).
+"""
+
+from typing import Dict, List, Optional
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from app.sources import CSVSource, ShardedSource, default_workers
+from benchmarks import baseline
+from benchmarks.synthetic import write_csv
+
+
+def write_shards(path: str, directory: str, shards: int) -> List[str]:
+    """Split a CSV export into ``shards`` files of about equal row counts."""
+    with open(path, newline="") as csvfile:
+        header = csvfile.readline()
+        lines = csvfile.readlines()
+    os.makedirs(directory, exist_ok=True)
+    size = -(-len(lines) // shards)
+    paths = []
+    for number in range(shards):
+        shard_path = os.path.join(directory, f"part-{number:04d}.csv")
+        with open(shard_path, "w", newline="") as out:
+            out.write(header)
+            out.writelines(lines[number * size : (number + 1) * size])
+        paths.append(shard_path)
+    return paths
+
+
+def timed(load) -> float:
+    start = time.perf_counter()
+    load()
+    return time.perf_counter() - start
+
+
+def run(
+    path: str, directory: str, rows: int, workers: List[int], repeat: int
+) -> Dict[str, float]:
+    results: Dict[str, float] = {}
+    seconds = statistics.median(timed(CSVSource(path).load) for _ in range(repeat))
+    results["single.rows_per_s"] = rows / seconds
+    for count in workers:
+        seconds = statistics.median(
+            timed(ShardedSource(directory, workers=count).load) for _ in range(repeat)
+        )
+        results[f"workers_{count}.rows_per_s"] = rows / seconds
+    source = ShardedSource(directory, workers=max(workers))
+    source.load()
+    # A duration, not a throughput: it reads no rows, and the noise floor of
+    # timings keeps a fraction of a millisecond from failing the check
+    results["unchanged.refresh_s"] = statistics.median(
+        timed(lambda: source.load_since("")) for _ in range(repeat)
+    )
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--shards", type=int, default=32)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        help="Worker counts to time (default: 1, 2, 4, ... up to the cores)",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--data-dir", default=os.path.join(tempfile.gettempdir(), "trend-bench")
+    )
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=baseline.DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    workers = args.workers
+    if not workers:
+        cores = default_workers()
+        workers = sorted({1, cores} | {2**i for i in range(8) if 2**i < cores})
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    path = os.path.join(args.data_dir, f"trends_{args.rows}.csv")
+    if not os.path.exists(path):
+        write_csv(path, args.rows)
+    directory = os.path.join(args.data_dir, f"shards_{args.rows}_{args.shards}")
+    if not os.path.isdir(directory):
+        write_shards(path, directory, args.shards)
+
+    results = run(path, directory, args.rows, workers, args.repeat)
+    single = results["single.rows_per_s"]
+    print(f"{default_workers()} cores, {args.shards} shards of {args.rows} rows")
+    print(f"{'load':>12} {'rows/s':>12} {'speedup':>8}")
+    for key, rows_per_s in results.items():
+        if baseline.higher_is_better(key):
+            name = key.rsplit(".", 1)[0]
+            print(f"{name:>12} {rows_per_s:>12,.0f} {rows_per_s / single:>7.2f}x")
+    print(f"refresh with no shard changed: {results['unchanged.refresh_s']:.4f}s")
+
+    if args.check or args.update_baseline:
+        sys.exit(
+            baseline.check(
+                "shards", args.rows, results, args.update_baseline, args.tolerance
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Fetch latency of each trend data source, without a live warehouse.
+
+Writes the same synthetic export as CSV, Parquet (if pyarrow is installed)
+and a SQLite stand-in warehouse, then times a cold and a warm load from
+each. ``--latency`` adds a simulated round trip per warehouse page, which
+shows how page size trades round trips against per-page work:
+
+    python -m benchmarks.bench_sources --rows 1000000 --latency 0.05
+"""
+
+from typing import Dict, Iterator, List, Optional, Tuple
+import argparse
+import os
+import tempfile
+import time
+
+from app.sources import (
+    ClientPool,
+    CSVSource,
+    Page,
+    ParquetSource,
+    SQLiteClient,
+    TrendSource,
+    WarehouseSource,
+)
+from benchmarks.synthetic import write_csv, write_parquet, write_sqlite
+
+
+class LatentClient(SQLiteClient):
+    """SQLite client that sleeps like a remote warehouse would."""
+
+    def __init__(self, path: str, latency: float):
+        time.sleep(latency)  # Connection and authentication
+        super().__init__(path)
+        self.latency = latency
+
+    def query_pages(
+        self,
+        sql: str,
+        page_size: int,
+        timeout: float,
+        params: Optional[Dict[str, str]] = None,
+    ) -> Iterator[Page]:
+        for page in super().query_pages(sql, page_size, timeout, params):
+            time.sleep(self.latency)
+            yield page
+
+
+def time_loads(source: TrendSource, repeat: int = 2) -> Tuple[int, List[float]]:
+    timings, rows = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = source.load().rows_loaded
+        timings.append(time.perf_counter() - start)
+    source.close()
+    return rows, timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument(
+        "--page-sizes", type=int, nargs="+", default=[10_000, 50_000, 200_000]
+    )
+    parser.add_argument(
+        "--data-dir", default=os.path.join(tempfile.gettempdir(), "trend-bench")
+    )
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    csv_path = os.path.join(args.data_dir, f"trends_{args.rows}.csv")
+    if not os.path.exists(csv_path):
+        write_csv(csv_path, args.rows)
+    sqlite_path = os.path.join(args.data_dir, f"trends_{args.rows}.db")
+    if not os.path.exists(sqlite_path):
+        write_sqlite(sqlite_path, csv_path)
+
+    sources: List[Tuple[str, TrendSource]] = [("csv", CSVSource(csv_path))]
+    try:
+        parquet_path = os.path.join(args.data_dir, f"trends_{args.rows}.parquet")
+        if not os.path.exists(parquet_path):
+            write_parquet(parquet_path, csv_path)
+        sources.append(("parquet", ParquetSource(parquet_path)))
+    except ImportError:
+        print("pyarrow not installed, skipping Parquet")
+    for page_size in args.page_sizes:
+        pool = ClientPool(lambda: LatentClient(sqlite_path, args.latency))
+        label = f"warehouse/{page_size}"
+        sources.append((label, WarehouseSource(pool, "trends", page_size=page_size)))
+
+    print(f"{'source':>18} {'rows':>10} {'cold s':>8} {'warm s':>8} {'rows/s':>11}")
+    for label, source in sources:
+        rows, (cold, warm) = time_loads(source)
+        print(f"{label:>18} {rows:>10} {cold:>8.2f} {warm:>8.2f} {rows / warm:>11,.0f}")
+
+
+if __name__ == "__main__":
+    main()
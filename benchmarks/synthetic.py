@@ -0,0 +1,165 @@
+"""Synthetic trend data shaped like ``src/app/data/example_data.csv``.
+
+Rows are the cross product of days x countries x the real category
+hierarchy from the example export, walking back one day at a time from the
+example's ``event_date`` until the requested row count is reached.
+``--categories`` grows the hierarchy beyond the example's 325 leaves by
+adding numbered leaves under its level 2 categories, for taxonomies closer
+to a full product catalogue:
+
+    python -m benchmarks.synthetic --rows 1000000 /tmp/trends_1m.csv
+    python -m benchmarks.synthetic --rows 5000000 --categories 5000 /tmp/t.csv
+"""
+
+from datetime import date, timedelta
+from typing import Iterator, List, Tuple
+import argparse
+import csv
+import os
+import sqlite3
+
+import numpy as np
+
+from app.store import COLUMNS
+
+EXAMPLE_CSV = os.path.join(
+    os.path.dirname(__file__), "..", "src", "app", "data", "example_data.csv"
+)
+LATEST_DAY = date(2025, 2, 9)
+
+# The example's three markets first, then the wider network
+COUNTRIES = [
+    "US", "UK", "AUSTRALIA", "CANADA", "GERMANY", "FRANCE", "SPAIN", "ITALY",
+    "NETHERLANDS", "BELGIUM", "SWEDEN", "NORWAY", "DENMARK", "FINLAND",
+    "IRELAND", "POLAND", "AUSTRIA", "SWITZERLAND", "PORTUGAL", "JAPAN",
+    "SOUTH KOREA", "SINGAPORE", "INDIA", "BRAZIL", "MEXICO", "ARGENTINA",
+    "NEW ZEALAND", "SOUTH AFRICA", "UNITED ARAB EMIRATES", "SAUDI ARABIA",
+]  # fmt: skip
+
+
+def example_categories(count: int = 0) -> List[Tuple[str, str, str]]:
+    """Distinct (level 1, level 2, level 3) triples from the example export.
+
+    With ``count`` above the example's number of leaves, numbered leaves are
+    added round-robin under the example's level 2 categories until there
+    are ``count``.
+    """
+    with open(EXAMPLE_CSV, newline="") as csvfile:
+        triples = sorted(
+            {
+                (
+                    row["product_category_level_1"],
+                    row["product_category_level_2"],
+                    row["product_category_level_3"],
+                )
+                for row in csv.DictReader(csvfile)
+            }
+        )
+    parents = sorted({triple[:2] for triple in triples})
+    for extra in range(max(count - len(triples), 0)):
+        level_1, level_2 = parents[extra % len(parents)]
+        number = extra // len(parents) + 1
+        triples.append((level_1, level_2, f"{level_2} {number}"))
+    return triples
+
+
+def generate_lines(
+    rows: int,
+    countries: int = len(COUNTRIES),
+    seed: int = 0,
+    chunk: int = 100_000,
+    categories: int = 0,
+) -> Iterator[str]:
+    """Yield CSV text (header first) in chunks of up to ``chunk`` rows."""
+    rng = np.random.default_rng(seed)
+    leaves = [
+        ",".join(_quote(v) for v in triple) for triple in example_categories(categories)
+    ]
+    markets = COUNTRIES[:countries]
+    keys = [f"{country},{triple}" for country in markets for triple in leaves]
+
+    yield ",".join(COLUMNS) + "\n"
+    written = 0
+    day = LATEST_DAY
+    while written < rows:
+        count = min(len(keys), rows - written)
+        prefix = day.isoformat() + ","
+        # Heavy-tailed changes, roughly like the real daily/weekly/monthly spread
+        metrics = np.round(rng.standard_t(3, size=(count, 6)) * 0.3, 4)
+        for start in range(0, count, chunk):
+            stop = min(start + chunk, count)
+            yield "".join(
+                f"{prefix}{keys[i]},{m[0]},{m[1]},{m[2]},{m[3]},{m[4]},{m[5]}\n"
+                for i, m in zip(range(start, stop), metrics[start:stop].tolist())
+            )
+        written += count
+        day -= timedelta(days=1)
+
+
+def write_csv(
+    path: str,
+    rows: int,
+    countries: int = len(COUNTRIES),
+    seed: int = 0,
+    categories: int = 0,
+) -> str:
+    """Write a synthetic export with ``rows`` data rows and return its path."""
+    with open(path, "w", newline="") as out:
+        for text in generate_lines(
+            rows, countries=countries, seed=seed, categories=categories
+        ):
+            out.write(text)
+    return path
+
+
+def write_sqlite(path: str, csv_path: str, table: str = "trends") -> str:
+    """Load a synthetic export into a SQLite stand-in warehouse table."""
+    from app.ingest import read_trend_csv
+
+    trends = read_trend_csv(csv_path).table
+    columns = [trends.dimensions[name].decode() for name in trends.dimensions]
+    columns += [values.tolist() for values in trends.metrics.values()]
+    if os.path.exists(path):
+        os.remove(path)
+    with sqlite3.connect(path) as connection:
+        connection.execute(f"CREATE TABLE {table} ({', '.join(COLUMNS)})")
+        connection.executemany(
+            f"INSERT INTO {table} VALUES ({', '.join('?' * len(COLUMNS))})",
+            zip(*columns),
+        )
+    connection.close()
+    return path
+
+
+def write_parquet(path: str, csv_path: str) -> str:
+    """Convert a synthetic export to Parquet (requires pyarrow)."""
+    import pyarrow.csv as pacsv  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+
+    pq.write_table(pacsv.read_csv(csv_path), path)
+    return path
+
+
+def _quote(value: str) -> str:
+    return f'"{value}"' if "," in value else value
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--countries", type=int, default=len(COUNTRIES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--categories", type=int, default=0)
+    args = parser.parse_args()
+    write_csv(
+        args.path,
+        args.rows,
+        countries=args.countries,
+        seed=args.seed,
+        categories=args.categories,
+    )
+
+
+if __name__ == "__main__":
+    main()
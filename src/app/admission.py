@@ -0,0 +1,252 @@
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional, Tuple
+import asyncio
+import math
+import time
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app import metrics, timing
+from app.config import Settings
+
+# Health checks and metrics scrapes are never limited, so a loaded worker
+# still reports in; static assets are cheap and cached by the browser
+PRIORITY_PATHS = ("/health", "/metrics")
+EXEMPT_PREFIXES = ("/static/",)
+
+# Long-lived server-sent event stream, bounded by the broadcaster instead
+STREAM_PATHS = ("/api/trends/stream",)
+
+# HTMX fragments the page is built from, kept apart from the JSON API so a
+# flood of API calls does not stall page loads
+FRAGMENT_PATHS = (
+    "/",
+    "/share-modal",
+    "/api/trends/gainers",
+    "/api/trends/losers",
+    "/api/trends/categories",
+    "/api/trends/countries",
+    "/api/trends/filter",
+    "/api/trends/ticker",
+)
+
+
+class Lane:
+    """Concurrency limit with a bounded wait queue for one class of endpoints.
+
+    Up to ``concurrency`` requests run at once; up to ``queue_depth`` more
+    wait, first come first served, for at most ``queue_timeout`` seconds.
+    A freed slot is handed straight to the oldest waiter.
+    """
+
+    def __init__(
+        self, name: str, concurrency: int, queue_depth: int, queue_timeout: float
+    ):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_depth = queue_depth
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: Deque["asyncio.Future[None]"] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> Optional[str]:
+        """Take a slot, waiting if needed; return why not if the request is shed."""
+        if self.in_flight < self.concurrency and not self._waiters:
+            self.in_flight += 1
+            return None
+        if len(self._waiters) >= self.queue_depth:
+            return "queue_full"
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        metrics.ADMISSION_QUEUED_TOTAL.labels(self.name).inc()
+        metrics.ADMISSION_WAITING.labels(self.name).inc()
+        try:
+            with timing.phase("queue"):
+                await asyncio.wait_for(future, self.queue_timeout)
+            return None
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as the wait ended
+                self.release()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return "queue_timeout"
+        finally:
+            metrics.ADMISSION_WAITING.labels(self.name).dec()
+            if future in self._waiters:
+                self._waiters.remove(future)
+
+    def release(self) -> None:
+        """Free a slot, handing it to the oldest request still waiting."""
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+
+class TokenBuckets:
+    """Per-client token buckets refilled at ``rate`` tokens per second.
+
+    Only the ``max_clients`` most recently seen clients are tracked; a
+    forgotten client starts again with a full bucket.
+    """
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, client: str, now: Optional[float] = None) -> float:
+        """Take a token for ``client``; return 0, or seconds until one is free."""
+        now = time.monotonic() if now is None else now
+        tokens, updated = self._buckets.pop(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[client] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+@dataclass
+class AdmissionController:
+    """Lanes per endpoint class and per-client rate limits of one worker."""
+
+    lanes: Dict[str, Lane]
+    buckets: Optional[TokenBuckets] = None
+    retry_after: float = 1.0
+    forwarded_hops: int = 0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "AdmissionController":
+        timeout = settings.admission_queue_timeout_seconds
+        return cls(
+            lanes={
+                "api": Lane(
+                    "api",
+                    settings.admission_api_concurrency,
+                    settings.admission_api_queue,
+                    timeout,
+                ),
+                "fragment": Lane(
+                    "fragment",
+                    settings.admission_fragment_concurrency,
+                    settings.admission_fragment_queue,
+                    timeout,
+                ),
+            },
+            buckets=(
+                TokenBuckets(settings.client_rate_per_second, settings.client_burst)
+                if settings.client_rate_per_second > 0
+                else None
+            ),
+            retry_after=settings.admission_retry_after_seconds,
+            forwarded_hops=settings.forwarded_hops,
+        )
+
+    def classify(self, path: str) -> Optional[str]:
+        """Lane of a request path; None for priority and exempt paths."""
+        if path in PRIORITY_PATHS or path.startswith(EXEMPT_PREFIXES):
+            return None
+        if path in STREAM_PATHS:
+            return "stream"
+        if path in FRAGMENT_PATHS:
+            return "fragment"
+        return "api"
+
+
+def client_address(scope: Scope, forwarded_hops: int = 0) -> str:
+    """Address a client is rate limited by.
+
+    Behind ``forwarded_hops`` proxies that each append the address they
+    saw to X-Forwarded-For, that is the entry the outermost one appended;
+    anything before it was sent by the client and cannot be trusted.
+    Otherwise, or without the header, it is the connecting address.
+    """
+    if forwarded_hops > 0:
+        forwarded = [
+            value.decode("latin-1")
+            for name, value in scope.get("headers", ())
+            if name == b"x-forwarded-for"
+        ]
+        hops = [hop.strip() for hop in ",".join(forwarded).split(",") if hop.strip()]
+        if len(hops) >= forwarded_hops:
+            return hops[-forwarded_hops]
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def _rejection(status_code: int, detail: str, retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        {"detail": detail},
+        status_code=status_code,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class AdmissionMiddleware:
+    """Shed load before it queues up in the worker.
+
+    A client over its token bucket gets 429; a request whose lane is full
+    and whose queue is full (or that waited too long) gets 503. Both carry
+    ``Retry-After``. Slots are held until the response is fully sent.
+    """
+
+    def __init__(self, app: ASGIApp, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"]
+        root_path = scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path) :] or "/"
+        lane_name = self.controller.classify(path)
+        if lane_name is None:
+            await self.app(scope, receive, send)
+            return
+
+        buckets = self.controller.buckets
+        if buckets is not None:
+            wait = buckets.take(client_address(scope, self.controller.forwarded_hops))
+            if wait:
+                metrics.ADMISSION_SHED.labels(lane_name, "rate_limited").inc()
+                response = _rejection(429, "Too many requests", wait)
+                await response(scope, receive, send)
+                return
+
+        lane = self.controller.lanes.get(lane_name)
+        if lane is None:
+            await self.app(scope, receive, send)
+            return
+        reason = await lane.acquire()
+        if reason is not None:
+            metrics.ADMISSION_SHED.labels(lane_name, reason).inc()
+            response = _rejection(
+                503, "Server busy, try again shortly", self.controller.retry_after
+            )
+            await response(scope, receive, send)
+            return
+        metrics.ADMISSION_IN_FLIGHT.labels(lane_name).inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            metrics.ADMISSION_IN_FLIGHT.labels(lane_name).dec()
+            lane.release()
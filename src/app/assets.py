@@ -0,0 +1,326 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import time
+
+import anyio
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import PlainTextResponse, Response
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app import metrics
+from app.config import settings
+
+# Relative to the working directory, like the templates
+STATIC_DIR = "src/app/static"
+MANIFEST_NAME = "manifest.json"
+
+# Only text formats are worth compressing; images are compressed already
+COMPRESSIBLE_SUFFIXES = (".css", ".js", ".svg", ".html", ".json", ".txt", ".xml")
+
+# Precompressed variants, most preferred first, and their file suffixes
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+# A fingerprinted name always has the same content, so browsers keep it for
+# a year; a plain name is revalidated against its ETag on every use
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+
+def fingerprint(data: bytes) -> str:
+    """Short content hash of an asset."""
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def fingerprinted_name(path: str, digest: str) -> str:
+    """``css/styles.css`` -> ``css/styles.<digest>.css``."""
+    stem, suffix = os.path.splitext(path)
+    return f"{stem}.{digest}{suffix}"
+
+
+def _write(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """``data`` compressed as small as the encoding allows."""
+    if encoding == "br":
+        import brotli  # type: ignore
+
+        return brotli.compress(data, quality=11)
+    # A fixed mtime keeps the output identical between builds
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def build_assets(source_dir: str, out_dir: str) -> Dict[str, str]:
+    """Copy assets under fingerprinted names, with compressed variants.
+
+    Text assets also get ``.br`` and ``.gz`` files next to them, where those
+    are smaller. The mapping from plain to fingerprinted names is returned
+    and written to ``manifest.json``, last, so a reader never sees a
+    manifest naming files that are not there yet.
+    """
+    manifest: Dict[str, str] = {}
+    for root, _, files in os.walk(source_dir):
+        for file_name in sorted(files):
+            source_path = os.path.join(root, file_name)
+            path = os.path.relpath(source_path, source_dir).replace(os.sep, "/")
+            with open(source_path, "rb") as f:
+                data = f.read()
+            name = fingerprinted_name(path, fingerprint(data))
+            target = os.path.join(out_dir, name)
+            _write(target, data)
+            if path.endswith(COMPRESSIBLE_SUFFIXES):
+                for encoding, suffix in ENCODINGS:
+                    compressed = compress(data, encoding)
+                    if len(compressed) < len(data):
+                        _write(target + suffix, compressed)
+            manifest[path] = name
+    _write(
+        os.path.join(out_dir, MANIFEST_NAME),
+        json.dumps(manifest, indent=2, sort_keys=True).encode(),
+    )
+    return manifest
+
+
+def load_manifest(build_dir: str) -> Dict[str, str]:
+    """Plain to fingerprinted asset names of a build; empty if there is none."""
+    try:
+        with open(os.path.join(build_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """Content codings of an ``Accept-Encoding`` header and their q-values."""
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    return accepted
+
+
+def pick_encoding(accept_encoding: str, available: Iterable[str]) -> Optional[str]:
+    """Most preferred of the ``available`` encodings the client accepts."""
+    accepted = accepted_encodings(accept_encoding)
+    for encoding in available:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+@dataclass
+class Asset:
+    """One servable file and its precompressed variants."""
+
+    path: str
+    media_type: str
+    etag: str
+    immutable: bool
+    # Encoding -> file, most preferred first
+    variants: Dict[str, str]
+
+
+class StaticAssets:
+    """ASGI app serving static assets, precompressed where the client allows.
+
+    With a build from ``build_assets`` in ``build_dir``, fingerprinted names
+    are served with ``Cache-Control: immutable`` and plain names still work,
+    revalidated by ETag; ``url`` maps plain names to fingerprinted ones for
+    templates. Without one, ``directory`` is served as is. Bodies are kept
+    in memory, least recently used first out, up to ``memory_bytes``.
+    """
+
+    def __init__(
+        self,
+        directory: str = STATIC_DIR,
+        build_dir: Optional[str] = None,
+        memory_bytes: int = 16 * 1024 * 1024,
+    ):
+        self.manifest = load_manifest(build_dir) if build_dir else {}
+        self.memory_bytes = memory_bytes
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_used = 0
+        self._assets: Dict[str, Asset] = {}
+        if self.manifest:
+            assert build_dir is not None
+            for path, name in self.manifest.items():
+                self._add(path, os.path.join(build_dir, name), name, False)
+                self._add(name, os.path.join(build_dir, name), name, True)
+        else:
+            for root, _, files in os.walk(directory):
+                for file_name in files:
+                    file_path = os.path.join(root, file_name)
+                    path = os.path.relpath(file_path, directory).replace(os.sep, "/")
+                    self._add(path, file_path, None, False)
+
+    def _add(
+        self, path: str, file_path: str, name: Optional[str], immutable: bool
+    ) -> None:
+        if name is None:
+            stat = os.stat(file_path)
+            digest = f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+        else:
+            digest = os.path.splitext(name)[0].rsplit(".", 1)[-1]
+        media_type, _ = mimetypes.guess_type(path)
+        self._assets[path] = Asset(
+            path=file_path,
+            media_type=media_type or "application/octet-stream",
+            etag=digest,
+            immutable=immutable,
+            variants={
+                encoding: file_path + suffix
+                for encoding, suffix in ENCODINGS
+                if os.path.exists(file_path + suffix)
+            },
+        )
+
+    def url(self, path: str) -> str:
+        """Name to link ``path`` by: its fingerprinted name if it was built."""
+        return self.manifest.get(path, path)
+
+    async def _read(self, file_path: str) -> Tuple[bytes, str]:
+        body = self._memory.get(file_path)
+        if body is not None:
+            self._memory.move_to_end(file_path)
+            return body, "memory"
+
+        def read() -> bytes:
+            with open(file_path, "rb") as f:
+                return f.read()
+
+        body = await anyio.to_thread.run_sync(read)
+        if len(body) <= self.memory_bytes and file_path not in self._memory:
+            self._memory[file_path] = body
+            self._memory_used += len(body)
+            while self._memory_used > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_used -= len(evicted)
+        return body, "disk"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        assert scope["type"] == "http"
+        path = _route_path(scope).lstrip("/")
+        asset = self._assets.get(path)
+        if scope["method"] not in ("GET", "HEAD"):
+            response: Response = PlainTextResponse(
+                "Method Not Allowed", status_code=405, headers={"Allow": "GET, HEAD"}
+            )
+        elif asset is None:
+            response = PlainTextResponse("Not Found", status_code=404)
+        else:
+            response = await self._respond(asset, scope)
+        await response(scope, receive, send)
+
+    async def _respond(self, asset: Asset, scope: Scope) -> Response:
+        request_headers = {
+            key.decode("latin-1"): value.decode("latin-1")
+            for key, value in scope["headers"]
+        }
+        encoding = pick_encoding(
+            request_headers.get("accept-encoding", ""), asset.variants
+        )
+        etag = f'"{asset.etag}-{encoding}"' if encoding else f'"{asset.etag}"'
+        headers = {
+            "ETag": etag,
+            "Cache-Control": (
+                IMMUTABLE_CACHE_CONTROL if asset.immutable else REVALIDATE_CACHE_CONTROL
+            ),
+        }
+        if asset.variants:
+            headers["Vary"] = "Accept-Encoding"
+
+        if_none_match = request_headers.get("if-none-match", "")
+        if etag in (tag.strip() for tag in if_none_match.split(",")):
+            metrics.STATIC_RESPONSES.labels(
+                encoding or "identity", "not_modified"
+            ).inc()
+            return Response(status_code=304, headers=headers)
+
+        file_path = asset.variants[encoding] if encoding else asset.path
+        body, source = await self._read(file_path)
+        metrics.STATIC_RESPONSES.labels(encoding or "identity", source).inc()
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        if scope["method"] == "HEAD":
+            headers["Content-Length"] = str(len(body))
+            return Response(
+                status_code=200, headers=headers, media_type=asset.media_type
+            )
+        return Response(body, headers=headers, media_type=asset.media_type)
+
+
+def _route_path(scope: Scope) -> str:
+    """Request path below the mount point the app is served from."""
+    path = scope["path"]
+    root_path = scope.get("root_path", "")
+    if root_path and path.startswith(root_path):
+        return path[len(root_path) :]
+    return path
+
+
+class SelectiveGZipMiddleware(GZipMiddleware):
+    """``GZipMiddleware`` that leaves paths under ``exclude_prefixes`` alone.
+
+    Static assets are compressed once at build time, or not compressible at
+    all, so they are never gzipped per request.
+    """
+
+    def __init__(
+        self, app: ASGIApp, exclude_prefixes: Sequence[str] = ("/static/",), **kwargs
+    ):
+        super().__init__(app, **kwargs)
+        self.exclude_prefixes = tuple(exclude_prefixes)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and _route_path(scope).startswith(
+            self.exclude_prefixes
+        ):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Fingerprint and precompress the static assets"
+    )
+    parser.add_argument("--source", default=STATIC_DIR)
+    parser.add_argument(
+        "--out", default=settings.static_build_dir, help="Default: STATIC_BUILD_DIR"
+    )
+    args = parser.parse_args(argv)
+    if not args.out:
+        parser.error("--out or STATIC_BUILD_DIR is required")
+
+    start_time = time.perf_counter()
+    manifest = build_assets(args.source, args.out)
+    print(
+        f"Built {len(manifest)} assets into {args.out} "
+        f"in {time.perf_counter() - start_time:.3f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
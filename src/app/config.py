@@ -17,5 +17,97 @@ class Settings(BaseSettings):
 
     excluded_categories: list[str] = ["religious & ceremonial"]
 
+    # Largest k served by /api/trends/top
+    top_k_max: int = 50
+
+    # Rendered HTML fragment cache
+    fragment_cache_size: int = 256
+
+    # Compiled template bytecode shared by the workers, filled at build time
+    # by `python -m app.templating` (off if empty)
+    template_cache_dir: str = ""
+
+    # Fingerprinted, precompressed static assets built by
+    # `python -m app.assets` (the plain static directory if empty), and the
+    # memory kept for asset bodies per worker
+    static_build_dir: str = ""
+    static_memory_bytes: int = 16 * 1024 * 1024
+
+    # Largest page of rows served by /api/trends?limit=
+    api_page_max: int = 10_000
+
+    # Encoded /api/trends/export downloads kept on disk per dataset version
+    # and filter, shared by the workers (default: trend_exports in the temp
+    # directory), least recently downloaded first out past the byte budget
+    # (off if 0)
+    export_cache_dir: str = ""
+    export_cache_bytes: int = 1024 * 1024 * 1024
+
+    # Admission control, per worker: requests running at once and waiting
+    # per endpoint class (JSON API, HTMX fragments) before shedding with
+    # 503, and a per-client token bucket answered with 429 (off if 0).
+    # /health and /metrics are never limited. Behind FORWARDED_HOPS proxies
+    # that each append to X-Forwarded-For (1 on Heroku), clients are told
+    # apart by the address the outermost proxy saw
+    admission_api_concurrency: int = 8
+    admission_api_queue: int = 32
+    admission_fragment_concurrency: int = 32
+    admission_fragment_queue: int = 128
+    admission_queue_timeout_seconds: float = 5.0
+    admission_retry_after_seconds: float = 1.0
+    client_rate_per_second: float = 20.0
+    client_burst: float = 60.0
+    forwarded_hops: int = 0
+
+    # Where trends are loaded from: csv, parquet, sqlite, shards or bigquery.
+    # DATA_PATH defaults to the bundled example CSV for the csv source; for
+    # shards it is a directory or glob of CSV / Parquet files, parsed by up
+    # to INGEST_WORKERS processes (0: one per core)
+    data_source: str = "csv"
+    data_path: str = ""
+    ingest_workers: int = 0
+    data_table: str = "trends"
+    source_pool_size: int = 2
+    source_page_size: int = 50000
+    source_timeout_seconds: float = 60.0
+
+    # "incremental" refreshes merge only rows from the latest cached
+    # event_date onwards; "full" reloads the whole source every time
+    refresh_mode: str = "incremental"
+
+    # Serve expired data while one background task refreshes it, for at
+    # most this long past expiry before requests wait for fresh data
+    stale_while_revalidate: bool = True
+    max_stale_seconds: float = 3600.0
+
+    # Server-sent ticker and grid updates, checked for every few seconds
+    push_enabled: bool = True
+    push_check_seconds: float = 15.0
+    push_heartbeat_seconds: float = 25.0
+    push_max_subscribers: int = 1000
+
+    # Daily change metrics kept per category for history charts, saved to
+    # HISTORY_PATH (.npy + .json) so they survive restarts (off if empty)
+    history_retention_days: int = 90
+    history_path: str = ""
+
+    # Memory-mapped snapshot shared by the workers on a host (off if empty)
+    snapshot_path: str = ""
+
+    # The workers sharing COORDINATION_PATH (default: SNAPSHOT_PATH; each on
+    # its own if both are empty) elect a leader through a file lock to run
+    # the daily refresh, delayed by up to REFRESH_JITTER_SECONDS, and learn
+    # of each new version from a file they check every few seconds. A failed
+    # daily refresh is retried with jittered exponential backoff
+    coordination_path: str = ""
+    refresh_poll_seconds: float = 5.0
+    refresh_jitter_seconds: float = 60.0
+    refresh_retries: int = 3
+    refresh_backoff_seconds: float = 30.0
+    refresh_backoff_max_seconds: float = 600.0
+
     class Config:
         case_sensitive = False
+
+
+settings = Settings()
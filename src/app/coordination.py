@@ -0,0 +1,279 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import IO, Awaitable, Callable, List, Optional, Tuple
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import random
+import time
+
+from app import metrics
+from app.store import TrendTable
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLock:
+    """Exclusive file lock held by the leading worker for as long as it runs.
+
+    The lock is taken without blocking, so the other workers stay followers
+    and try again later. The kernel drops it when the leader exits, however
+    it exits, and the next follower to try takes over.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file: Optional[IO[str]] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._file is not None
+
+    def try_acquire(self) -> bool:
+        """Take the lock if no other process holds it; return whether we lead."""
+        if self._file is not None:
+            return True
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        lock_file = open(self.path, "a+")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        # Which process leads, for whoever looks at the file
+        lock_file.truncate(0)
+        lock_file.write(f"{os.getpid()}\n")
+        lock_file.flush()
+        self._file = lock_file
+        return True
+
+    def release(self) -> None:
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+@dataclass(frozen=True)
+class VersionStamp:
+    """The dataset version a refresh produced, as announced to the workers."""
+
+    version: str
+    refreshed: datetime
+    rows: int
+    pid: int
+
+
+class VersionFile:
+    """Small file announcing the latest refreshed version to every worker.
+
+    It is replaced atomically on each write, so ``poll`` only has to stat
+    it to notice a new version and never reads a half-written one.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._identity: Optional[Tuple[int, int, int]] = None
+
+    def write(self, table: TrendTable) -> VersionStamp:
+        """Announce ``table``'s version."""
+        stamp = VersionStamp(
+            version=table.version,
+            refreshed=datetime.now(),
+            rows=len(table),
+            pid=os.getpid(),
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(
+                {
+                    "version": stamp.version,
+                    "refreshed": stamp.refreshed.isoformat(),
+                    "rows": stamp.rows,
+                    "pid": stamp.pid,
+                },
+                f,
+            )
+        os.replace(temp_path, self.path)
+        # Our own announcement is not news to us
+        self._identity = self._stat()
+        return stamp
+
+    def _stat(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def poll(self) -> Optional[VersionStamp]:
+        """The announced version if the file changed since the last poll."""
+        identity = self._stat()
+        if identity is None or identity == self._identity:
+            return None
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            stamp = VersionStamp(
+                version=data["version"],
+                refreshed=datetime.fromisoformat(data["refreshed"]),
+                rows=data["rows"],
+                pid=data["pid"],
+            )
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable version file {self.path}: {str(e)}")
+            return None
+        self._identity = identity
+        return stamp
+
+
+def backoff_delays(
+    retries: int,
+    base: float,
+    cap: float,
+    uniform: Callable[[], float] = random.random,
+) -> List[float]:
+    """Seconds to wait before each retry: doubling up to ``cap``, fully jittered.
+
+    Each delay is drawn from [0, min(cap, base * 2**attempt)), so workers
+    on different hosts that failed together do not retry together.
+    """
+    return [uniform() * min(cap, base * 2**attempt) for attempt in range(retries)]
+
+
+class RefreshCoordinator:
+    """Elects the worker that refreshes and tells the others about new versions.
+
+    With a ``path``, the workers sharing it compete for ``<path>.leader``;
+    only the leader runs scheduled refreshes, and every refresh made through
+    the coordinator is announced in ``<path>.version``. Followers poll that
+    file on each ``tick`` and hand new versions to ``follow``. Without a
+    path the worker is on its own and always leads.
+
+    Args:
+        path: Base path of the lock and version files, shared by the workers
+        refresh: Refresh the trends, raising on failure; called with whether
+            to force it and whether to merge incrementally (None: default)
+        follow: Catch up with a version another worker announced
+        retries: Retries of a failed scheduled refresh
+        backoff: Delay before the first retry, doubled for each next one
+        backoff_max: Longest delay between retries
+    """
+
+    def __init__(
+        self,
+        path: Optional[str],
+        refresh: Callable[[bool, Optional[bool]], Awaitable[TrendTable]],
+        follow: Callable[[VersionStamp], Awaitable[None]],
+        retries: int = 3,
+        backoff: float = 30.0,
+        backoff_max: float = 600.0,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ):
+        self.lock = LeaderLock(f"{path}.leader") if path else None
+        self.versions = VersionFile(f"{path}.version") if path else None
+        self._refresh = refresh
+        self._follow = follow
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self._sleep = sleep
+
+    @property
+    def is_leader(self) -> bool:
+        return self.lock is None or self.lock.is_leader
+
+    def elect(self) -> bool:
+        """Try to become the leader, if no worker is; return whether we lead."""
+        if self.lock is None:
+            return True
+        was_leader = self.lock.is_leader
+        leader = self.lock.try_acquire()
+        if leader and not was_leader:
+            logger.info(f"Worker {os.getpid()} is now the refresh leader")
+        metrics.REFRESH_LEADER.set(int(leader))
+        return leader
+
+    def resign(self) -> None:
+        """Give up the lead, e.g. on shutdown, so another worker takes over."""
+        if self.lock is not None:
+            self.lock.release()
+        metrics.REFRESH_LEADER.set(0)
+
+    async def tick(self) -> None:
+        """Take over a vacant lead, or follow the leader's latest announcement."""
+        try:
+            if self.elect() or self.versions is None:
+                return
+            stamp = self.versions.poll()
+            if stamp is not None:
+                logger.info(
+                    f"Worker {stamp.pid} announced version {stamp.version} "
+                    f"with {stamp.rows} rows"
+                )
+                await self._follow(stamp)
+                record_version(stamp.version)
+        except Exception as e:
+            logger.error(f"Error following refreshes: {str(e)}", exc_info=True)
+
+    async def scheduled_refresh(self) -> Optional[TrendTable]:
+        """Refresh on schedule if this worker leads, retrying with backoff."""
+        if not self.elect():
+            return None
+        try:
+            return await self.refresh("scheduled", retries=self.retries)
+        except Exception as e:
+            logger.error(
+                f"Scheduled refresh failed after {self.retries} retries: {str(e)}"
+            )
+            return None
+
+    async def refresh(
+        self,
+        trigger: str,
+        force: bool = True,
+        incremental: Optional[bool] = None,
+        retries: int = 0,
+    ) -> TrendTable:
+        """Refresh, retrying ``retries`` times, and announce the new version.
+
+        Raises:
+            Exception: Whatever the last attempt raised
+        """
+        delays = backoff_delays(retries, self.backoff, self.backoff_max)
+        for attempt in range(retries + 1):
+            start = time.perf_counter()
+            try:
+                table = await self._refresh(force, incremental)
+            except Exception as e:
+                metrics.REFRESH_SECONDS.labels(trigger, "failure").observe(
+                    time.perf_counter() - start
+                )
+                if attempt == retries:
+                    raise
+                metrics.REFRESH_RETRIES.labels(trigger).inc()
+                logger.warning(
+                    f"{trigger.capitalize()} refresh failed ({str(e)}); "
+                    f"retrying in {delays[attempt]:.1f}s"
+                )
+                await self._sleep(delays[attempt])
+                continue
+            metrics.REFRESH_SECONDS.labels(trigger, "success").observe(
+                time.perf_counter() - start
+            )
+            if table:
+                if self.versions is not None:
+                    self.versions.write(table)
+                record_version(table.version)
+            return table
+        raise AssertionError("unreachable")
+
+
+def record_version(version: str) -> None:
+    """Export the version this worker last refreshed to or followed."""
+    metrics.REFRESH_VERSION.clear()
+    metrics.REFRESH_VERSION.labels(version).set(1)
+    metrics.REFRESH_LAST_SUCCESS.set(time.time())
@@ -0,0 +1,172 @@
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+from app.index import ALL_CATEGORIES, RANK_METRIC
+from app.scoring import SCORE_COLUMN
+from app.store import TrendTable
+
+# Dimensions of the cube; categories are a hierarchy under each country
+CUBE_COLUMNS: Tuple[str, ...] = (
+    "campaign_country",
+    "product_category_level_1",
+    "product_category_level_2",
+    "product_category_level_3",
+)
+
+# (country, level 1, level 2, level 3), "all" where rolled up
+NodeKey = Tuple[str, str, str, str]
+
+
+class CategoryCube:
+    """Mean changes per country and category node, with "all" roll-ups.
+
+    Every node is a country (or "all" countries) and a category path of
+    depth 0 to 3 with the deeper levels rolled up to "all", e.g.
+    ("UK", "electronics", "all", "all"). Aggregates for every node are
+    computed once per refresh with one grouped pass per roll-up level, so
+    looking up a node and its children is a dictionary lookup.
+
+    Only rows from the latest ``event_date`` are aggregated, so merged
+    history does not blend into today's averages.
+    """
+
+    def __init__(
+        self,
+        keys: List[NodeKey],
+        counts: np.ndarray,
+        gainers: np.ndarray,
+        losers: np.ndarray,
+        means: Dict[str, np.ndarray],
+        rank_metric: str,
+        event_date: Optional[str] = None,
+    ):
+        self.keys = keys
+        self.counts = counts
+        self.gainers = gainers
+        self.losers = losers
+        self.means = means
+        self.rank_metric = rank_metric
+        self.event_date = event_date
+        self.positions: Dict[NodeKey, int] = {key: i for i, key in enumerate(keys)}
+
+        # Children of each node, best ranked first
+        ranking = np.argsort(-means[rank_metric], kind="stable").tolist()
+        self.children: Dict[NodeKey, List[NodeKey]] = {}
+        for position in ranking:
+            key = keys[position]
+            depth = _depth(key)
+            if depth:
+                parent = key[:depth] + (ALL_CATEGORIES,) * (4 - depth)
+                self.children.setdefault(parent, []).append(key)  # type: ignore[arg-type]
+
+    @classmethod
+    def build(cls, table: TrendTable) -> "CategoryCube":
+        """Aggregate the latest day of ``table`` at every roll-up level."""
+        metrics = list(table.metrics)
+        rank_metric = SCORE_COLUMN if SCORE_COLUMN in table.metrics else RANK_METRIC
+        event_date = max(table.distinct("event_date"), default=None)
+        rows = (
+            np.flatnonzero(table.mask(event_date=event_date))
+            if event_date is not None
+            else np.arange(0)
+        )
+        columns = [table.dimensions[name] for name in CUBE_COLUMNS]
+        codes = [column.codes[rows] for column in columns]
+        values = np.stack([table.metric(name)[rows] for name in metrics])
+        ranked = table.metric(rank_metric)[rows]
+
+        keys: List[NodeKey] = []
+        parts: Dict[str, List[np.ndarray]] = {"counts": [], "gainers": [], "losers": []}
+        sums: List[np.ndarray] = []
+        for all_countries in (False, True):
+            for depth in range(4):
+                # Group by the country (unless rolled up) and the first
+                # ``depth`` category levels
+                grouped = ([] if all_countries else [0]) + list(range(1, depth + 1))
+                composite = np.zeros(len(rows), dtype=np.int64)
+                for position in grouped:
+                    composite = composite * len(columns[position].values)
+                    composite += codes[position]
+                _, first, inverse = np.unique(
+                    composite, return_index=True, return_inverse=True
+                )
+                groups = len(first)
+                for row in first.tolist():
+                    key = [ALL_CATEGORIES] * 4
+                    for position in grouped:
+                        column = columns[position]
+                        key[position] = column.values[codes[position][row]]
+                    keys.append(tuple(key))  # type: ignore[arg-type]
+                parts["counts"].append(np.bincount(inverse, minlength=groups))
+                parts["gainers"].append(
+                    np.bincount(inverse, weights=ranked > 0, minlength=groups)
+                )
+                parts["losers"].append(
+                    np.bincount(inverse, weights=ranked < 0, minlength=groups)
+                )
+                sums.append(
+                    np.stack(
+                        [
+                            np.bincount(inverse, weights=metric, minlength=groups)
+                            for metric in values
+                        ]
+                    )
+                )
+
+        counts = np.concatenate(parts["counts"])
+        with np.errstate(invalid="ignore"):
+            averages = np.concatenate(sums, axis=1) / counts
+        return cls(
+            keys=keys,
+            counts=counts,
+            gainers=np.concatenate(parts["gainers"]).astype(np.int64),
+            losers=np.concatenate(parts["losers"]).astype(np.int64),
+            means=dict(zip(metrics, averages)),
+            rank_metric=rank_metric,
+            event_date=event_date,
+        )
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.positions
+
+    def node(self, key: NodeKey) -> Dict[str, Any]:
+        """Aggregates of one node.
+
+        Raises:
+            KeyError: If no rows fall under the node
+        """
+        position = self.positions[key]
+        country, level_1, level_2, level_3 = key
+        return {
+            "country": country,
+            "level1": level_1,
+            "level2": level_2,
+            "level3": level_3,
+            "count": int(self.counts[position]),
+            "gainers": int(self.gainers[position]),
+            "losers": int(self.losers[position]),
+            "mean": {
+                metric: float(values[position]) for metric, values in self.means.items()
+            },
+        }
+
+    def drill_down(self, key: NodeKey) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """A node and its children one category level down, best first.
+
+        Raises:
+            KeyError: If no rows fall under the node
+        """
+        return self.node(key), [
+            self.node(child) for child in self.children.get(key, [])
+        ]
+
+
+def _depth(key: NodeKey) -> int:
+    """Number of category levels a node key is grouped by."""
+    depth = 0
+    while depth < 3 and key[depth + 1] != ALL_CATEGORIES:
+        depth += 1
+    return depth
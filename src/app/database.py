@@ -1,11 +1,24 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
-import csv
+from typing import Optional, Tuple
+import asyncio
 import logging
-import os
+import threading
+import time
 
-# from .queries import main_trend_query
+from app import metrics, timing
+from app.config import settings
+from app.coordination import RefreshCoordinator, VersionStamp
+from app.cube import CategoryCube
+from app.history import HistoryStore
+from app.index import PartitionIndex
+from app.ingest import IngestResult
+from app.query import BitmapIndex
+from app.scoring import SCORE_COLUMN, ScoringRules, score_trends
+from app.snapshot import SharedSnapshot
+from app.sources import create_source
+from app.store import TrendTable
+from app.topk import TopK
 
 logger = logging.getLogger(__name__)
 
@@ -14,8 +27,12 @@ logger = logging.getLogger(__name__)
 class CacheData:
     """Data structure for cached items."""
 
-    data: List[Dict[str, Any]]
+    data: TrendTable
     timestamp: datetime
+    index: PartitionIndex
+    top: Optional[TopK] = None
+    cube: Optional[CategoryCube] = None
+    bitmaps: Optional[BitmapIndex] = None
 
 
 class InMemoryCache:
@@ -33,15 +50,87 @@ class InMemoryCache:
             and datetime.now() - self._cache.timestamp <= self.expiry_time
         )
 
-    def get(self) -> Optional[List[Dict[str, Any]]]:
+    def get(self) -> Optional[TrendTable]:
         """Get cached data if valid."""
         if not self.is_valid or self._cache is None:
             return None
         return self._cache.data
 
-    def set(self, data: List[Dict[str, Any]]) -> None:
-        """Set new cache data."""
-        self._cache = CacheData(data=data, timestamp=datetime.now())
+    def latest(self) -> Optional[TrendTable]:
+        """Get the most recently cached data, however old."""
+        return self._cache.data if self._cache is not None else None
+
+    def get_stale(self, max_staleness: timedelta) -> Optional[TrendTable]:
+        """Get cached data that expired less than ``max_staleness`` ago."""
+        if self._cache is None:
+            return None
+        if datetime.now() - self._cache.timestamp > self.expiry_time + max_staleness:
+            return None
+        return self._cache.data
+
+    def get_index(self) -> Optional[PartitionIndex]:
+        """Get the partition index of the cached data if valid."""
+        if not self.is_valid or self._cache is None:
+            return None
+        return self._cache.index
+
+    def index_for(self, data: TrendTable) -> Optional[PartitionIndex]:
+        """Get the partition index of ``data`` if it is cached, even if expired."""
+        if self._cache is None or self._cache.data is not data:
+            return None
+        return self._cache.index
+
+    def top_for(self, data: TrendTable) -> Optional[TopK]:
+        """Get the top-K selections of ``data`` if it is cached, even if expired."""
+        if self._cache is None or self._cache.data is not data:
+            return None
+        return self._cache.top
+
+    def cube_for(self, data: TrendTable) -> Optional[CategoryCube]:
+        """Get the category cube of ``data`` if it is cached, even if expired."""
+        if self._cache is None or self._cache.data is not data:
+            return None
+        return self._cache.cube
+
+    def bitmaps_for(self, data: TrendTable) -> Optional[BitmapIndex]:
+        """Get the bitmap index of ``data`` if it is cached, even if expired."""
+        if self._cache is None or self._cache.data is not data:
+            return None
+        return self._cache.bitmaps
+
+    def set(self, data: TrendTable, timestamp: Optional[datetime] = None) -> None:
+        """Set new cache data and build its indexes, top-K and cube.
+
+        Args:
+            data: Trends table to cache
+            timestamp: When the data was loaded, defaults to now
+        """
+        if self._cache is not None and self._cache.data is data:
+            # Unchanged data, e.g. an empty delta: only renew the timestamp
+            index, top, cube = self._cache.index, self._cache.top, self._cache.cube
+            bitmaps = self._cache.bitmaps
+        else:
+            metrics.CACHE_RECORDS.set(len(data))
+            # Fingerprint the data here rather than on the first request
+            _ = data.version
+            index = PartitionIndex.build(data)
+            top = TopK(data, max_k=settings.top_k_max)
+            cube = CategoryCube.build(data)
+            bitmaps = BitmapIndex.build(data)
+        self._cache = CacheData(
+            data=data,
+            timestamp=timestamp or datetime.now(),
+            index=index,
+            top=top,
+            cube=cube,
+            bitmaps=bitmaps,
+        )
+
+    def age(self) -> float:
+        """Seconds since the cached data was loaded, or 0 if nothing is cached."""
+        if self._cache is None:
+            return 0.0
+        return (datetime.now() - self._cache.timestamp).total_seconds()
 
     def clear(self) -> None:
         """Clear cache data."""
@@ -50,101 +139,463 @@ class InMemoryCache:
 
 # Initialize the in-memory cache
 cache = InMemoryCache()
+metrics.CACHE_AGE.set_function(cache.age)
+
+# Cached tables are kept sorted by the absolute change in this metric
+SORT_COLUMN = "revenue_weekly_change"
+
+# The refresh running in a worker thread, whether it is forced and whether
+# it is incremental
+_refresh: Optional[Tuple["asyncio.Task[TrendTable]", bool, bool]] = None
+
+# Attaching to a snapshot another worker published, running in a worker
+# thread; the lock keeps attaches from refresh threads from doubling up
+_attach: Optional["asyncio.Task[None]"] = None
+_attach_lock = threading.Lock()
+
+# Exclusions, clamps and weights applied once to every loaded row
+scoring_rules = ScoringRules.from_settings(settings)
+
+# Source the trends are (re)loaded from
+source = create_source(settings)
+
+# Daily metrics of every category, recorded from each dataset version
+history = (
+    HistoryStore.open(settings.history_path, settings.history_retention_days)
+    if settings.history_path
+    else HistoryStore(settings.history_retention_days)
+)
 
-"""
-Example BigQuery implementation for production use:
+# Snapshot file shared with the other workers on this host, if configured
+shared_snapshot = (
+    SharedSnapshot(settings.snapshot_path) if settings.snapshot_path else None
+)
 
-from google.cloud import bigquery
-from google.oauth2 import service_account
-import json
 
-@lru_cache(maxsize=1)
-def get_bigquery_client() -> bigquery.Client:
+def read_source(
+    since: Optional[str] = None, basis: Optional[str] = None
+) -> IngestResult:
+    """Read (all, or since a watermark) and score rows from the source.
+
+    Streaming ingest parses while it reads, so the parse time the ingest
+    measured is split out of the total.
+
+    Args:
+        since: Latest ``event_date`` of the data being merged into
+        basis: Fingerprint of the source that data was loaded from, if known
+    """
+    start = time.perf_counter()
+    if since is None:
+        result = source.load()
+    else:
+        result = source.load_since(since, basis=basis)
+    elapsed = time.perf_counter() - start
+    timing.observe(
+        "read", elapsed - result.parse_seconds, metrics.REFRESH_PHASE_SECONDS
+    )
+    timing.observe("parse", result.parse_seconds, metrics.REFRESH_PHASE_SECONDS)
+    with timing.phase("score", metrics.REFRESH_PHASE_SECONDS):
+        return replace(result, table=score_trends(result.table, scoring_rules))
+
+
+def sort_trends(table: TrendTable) -> TrendTable:
+    """Sort a table by absolute value of revenue_weekly_change."""
+    with timing.phase("sort", metrics.REFRESH_PHASE_SECONDS):
+        return table.select(table.order_by(SORT_COLUMN, descending=True, absolute=True))
+
+
+def load_trends() -> TrendTable:
+    """Read and score the trends source, sorted by weekly revenue change."""
+    # Stream the source into typed column buffers
+    return sort_trends(read_source().table)
+
+
+def merge_trends(base: TrendTable) -> TrendTable:
+    """Merge the rows from the latest ``event_date`` in ``base`` onwards into it.
+
+    The latest day is read again so rows that were still being filled in
+    when it was last loaded are replaced. A source that knows which rows
+    it held before also reports them, so rows it changed or deleted are
+    dropped from ``base`` whatever their date, or returns everything.
+    """
+    watermark = max(base.distinct("event_date"), default="")
+    if SCORE_COLUMN not in base.metrics:
+        # E.g. a snapshot published before scoring was added
+        base = score_trends(base, scoring_rules)
+    info = shared_snapshot.info if shared_snapshot else None
+    result = read_source(since=watermark, basis=info.source if info else None)
+    delta = result.table
+    if result.complete:
+        logger.info(f"Replacing {len(base)} rows with {len(delta)} rows")
+        return sort_trends(delta)
+    if result.removed is not None:
+        base = base.without(result.removed)
+    logger.info(f"Merging {len(delta)} rows since {watermark} into {len(base)} rows")
+    # Sorted merge of the delta into the already sorted table
+    with timing.phase("sort", metrics.REFRESH_PHASE_SECONDS):
+        return base.upsert(delta, order_by=SORT_COLUMN, descending=True, absolute=True)
+
+
+def reload_trends(incremental: bool = False) -> TrendTable:
+    """Load the trends afresh, or merge the latest rows into the cached ones."""
+    base = cache.latest()
+    if incremental and base:
+        return merge_trends(base)
+    return load_trends()
+
+
+def cache_trends(table: TrendTable, timestamp: Optional[datetime] = None) -> None:
+    """Cache a table, building its index, top-K selections and cube."""
+    with timing.phase("cache_set", metrics.REFRESH_PHASE_SECONDS):
+        cache.set(table, timestamp=timestamp)
+
+
+def record_history(table: TrendTable, save: bool = False) -> None:
+    """Record ``table`` in the history, saving it if ``save`` and configured."""
     try:
-        # First try Heroku-style environment credentials
-        if 'BQ_CREDENTIALS' in os.environ:
-            credentials_info = json.loads(os.environ['BQ_CREDENTIALS'])
-            credentials = service_account.Credentials.from_service_account_info(credentials_info)
-        
-        # Then try local file-based credentials
-        elif os.path.exists('bq.json'):
-            credentials = service_account.Credentials.from_service_account_file('bq.json')
-        
-        # Finally try environment variable path
-        elif 'GOOGLE_APPLICATION_CREDENTIALS' in os.environ:
-            credentials = service_account.Credentials.from_service_account_file(
-                os.environ['GOOGLE_APPLICATION_CREDENTIALS']
-            )
-        
-        else:
-            raise ValueError(
-                "No BigQuery credentials found. Either set BQ_CREDENTIALS environment variable, "
-                "provide a bq.json file in the root directory, "
-                "or set GOOGLE_APPLICATION_CREDENTIALS environment variable."
-            )
-        
-        return bigquery.Client(credentials=credentials, project=credentials.project_id)
+        with timing.phase("history", metrics.REFRESH_PHASE_SECONDS):
+            history.record(table)
+            if save and settings.history_path:
+                history.save(settings.history_path)
     except Exception as e:
-        logger.error(f"Error creating BigQuery client: {str(e)}", exc_info=True)
-        raise
-"""
-
-
-def convert_numeric_values(row: Dict[str, Any]) -> Dict[str, Any]:
-    """Convert string numeric values to float."""
-    numeric_fields = [
-        "revenue_daily_change",
-        "revenue_weekly_change",
-        "revenue_monthly_change",
-        "commission_daily_change",
-        "commission_weekly_change",
-        "commission_monthly_change",
-    ]
-    for field in numeric_fields:
-        if field in row and row[field]:
-            try:
-                row[field] = float(row[field])
-            except (ValueError, TypeError):
-                row[field] = 0.0
-    return row
-
-
-async def fetch_trends(force_refresh: bool = False) -> List[Dict[str, Any]]:
-    """Fetch trends data from local CSV with in-memory caching."""
-    try:
+        # History is best effort and must not fail a refresh
+        logger.error(f"Error recording trend history: {str(e)}", exc_info=True)
+
+
+def attach_shared_snapshot() -> None:
+    """Cache the shared snapshot if another worker has published a new one.
+
+    Indexing the attached table takes a while on large datasets, so call
+    this from a worker thread (see ``attach_published_snapshot``).
+    """
+    if shared_snapshot is None:
+        return
+    with _attach_lock:
+        attached = shared_snapshot.poll()
+        if attached is not None:
+            table, info = attached
+            # Expire together with every other worker attached to this snapshot
+            cache_trends(table, timestamp=info.created)
+            record_history(table)
+
+
+async def attach_published_snapshot(wait: bool = False) -> None:
+    """Attach a newly published snapshot in a worker thread.
+
+    Concurrent callers share one attach. While it runs, callers holding
+    valid cached data go on serving it unless ``wait``; the others wait
+    for the new data.
+    """
+    global _attach
+    if shared_snapshot is None:
+        return
+    loop = asyncio.get_running_loop()
+    if _attach is None or _attach.done() or _attach.get_loop() is not loop:
+        if not shared_snapshot.changed():
+            return
+        _attach = loop.create_task(asyncio.to_thread(attach_shared_snapshot))
+    if wait or not cache.get():
+        # Shielded so a disconnecting client does not cancel the shared attach
+        await asyncio.shield(_attach)
+
+
+def refresh_trends(
+    force_refresh: bool = False, incremental: bool = False
+) -> TrendTable:
+    """Reload the trends source and cache the result.
+
+    With a shared snapshot configured, only one worker at a time reloads;
+    the others wait for it and attach to the snapshot it publishes.
+
+    Args:
+        force_refresh: Reload even if another worker just refreshed
+        incremental: Merge only the rows since the cached data's latest
+            ``event_date`` (a full load if nothing is cached yet)
+    """
+    if shared_snapshot is None:
+        table = reload_trends(incremental)
+        if table:
+            cache_trends(table)
+            record_history(table, save=True)
+        return table
+
+    with shared_snapshot.lock():
         if not force_refresh:
+            # Another worker may have refreshed while we waited for the lock
+            attach_shared_snapshot()
             cached_data = cache.get()
             if cached_data:
-                logger.info("Found cached data")
+                logger.info("Attached snapshot refreshed by another worker")
                 return cached_data
+        elif incremental:
+            # Merge into the newest published data, not an older local copy
+            attach_shared_snapshot()
+
+        return reload_and_publish(shared_snapshot, incremental)
+
+
+def reload_and_publish(snapshot: SharedSnapshot, incremental: bool) -> TrendTable:
+    """Reload the trends and publish them; call with the snapshot lock held."""
+    # Taken before reading, so a change made mid-read is caught next time
+    fingerprint = source.fingerprint()
+    table = reload_trends(incremental)
+    if table:
+        with timing.phase("publish", metrics.REFRESH_PHASE_SECONDS):
+            table, info = snapshot.publish(table, source=fingerprint)
+        cache_trends(table, timestamp=info.created)
+        # Saved under the snapshot lock, so one worker writes at a time
+        record_history(table, save=True)
+    return table
+
+
+def warm_start() -> bool:
+    """Cache the snapshot left by a previous run or worker, if it is intact.
+
+    The snapshot's checksum is verified before it is used. It is then
+    served as fresh until ``revalidate_trends`` has checked it against the
+    source, which also records it in the history off the boot path.
+    Returns whether a snapshot was cached.
+    """
+    if shared_snapshot is None:
+        return False
+    attached = shared_snapshot.poll(verify=True)
+    if attached is None:
+        return False
+    table, info = attached
+    cache_trends(table)
+    logger.info(
+        f"Warm start from snapshot {info.version} with {info.rows} rows "
+        f"created {info.created.isoformat(timespec='seconds')}"
+    )
+    return True
+
+
+def revalidate_trends(since: datetime, incremental: bool = False) -> TrendTable:
+    """Reload the warm-started trends if the source changed since the snapshot.
 
-        logger.info(
-            "Reading from local CSV" + (" (forced refresh)" if force_refresh else "")
+    Workers booting together revalidate one at a time under the snapshot
+    lock, so only the first reloads and the others attach to what it
+    published. A source without a fingerprint counts as changed unless the
+    snapshot was published after ``since``.
+
+    Args:
+        since: When this worker started
+        incremental: Merge only the rows since the snapshot's latest
+            ``event_date`` instead of reloading everything
+    """
+    if shared_snapshot is None:
+        raise RuntimeError("Revalidating requires a shared snapshot")
+    with shared_snapshot.lock():
+        attach_shared_snapshot()
+        info = shared_snapshot.info
+        fingerprint = source.fingerprint()
+        if info is not None and (
+            (fingerprint is not None and info.source == fingerprint)
+            or info.created >= since
+        ):
+            logger.info(f"Snapshot {info.version} is current with {source}")
+            table = cache.latest() or TrendTable.empty()
+            record_history(table)
+            return table
+        logger.info(f"{source} changed since the snapshot was written; reloading")
+        return reload_and_publish(shared_snapshot, incremental)
+
+
+def _log_refresh_failure(task: "asyncio.Task[TrendTable]") -> None:
+    if not task.cancelled() and task.exception() is not None:
+        metrics.REFRESH_FAILURES.inc()
+        logger.error(
+            f"Error refreshing trends: {str(task.exception())}",
+            exc_info=task.exception(),
         )
 
-        # Read from local CSV file
-        csv_path = os.path.join(os.path.dirname(__file__), "data", "example_data.csv")
-        results = []
 
-        with open(csv_path, "r", newline="") as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                # Convert numeric string values to float
-                processed_row = convert_numeric_values(row)
-                results.append(processed_row)
+async def _start_refresh(
+    force_refresh: bool = False, incremental: bool = False
+) -> "asyncio.Task[TrendTable]":
+    """Start a refresh in a worker thread, or join the one already running.
 
-        if not results:
-            logger.warning("CSV file contained no results")
-            return []
+    Concurrent callers share a single refresh. A forced refresh only joins
+    a forced one that reads at least as much of the source; otherwise it
+    waits for the running refresh to finish and then starts its own.
+    """
+    global _refresh
+    loop = asyncio.get_running_loop()
+    while _refresh is not None:
+        task, forced, partial = _refresh
+        if task.done() or task.get_loop() is not loop:
+            _refresh = None
+        elif not force_refresh or (forced and (incremental or not partial)):
+            metrics.REFRESHES_COALESCED.inc()
+            return task
+        else:
+            await asyncio.wait([task])
 
-        # Sort results by absolute value of revenue_weekly_change
-        results.sort(key=lambda x: abs(x.get("revenue_weekly_change", 0)), reverse=True)
+    task = asyncio.create_task(
+        asyncio.to_thread(refresh_trends, force_refresh, incremental)
+    )
+    task.add_done_callback(_log_refresh_failure)
+    _refresh = (task, force_refresh, incremental)
+    return task
 
-        cache.set(results)
-        logger.info(f"Successfully cached {len(results)} records in memory")
 
-        return results
+def start_revalidation(since: datetime) -> "asyncio.Task[TrendTable]":
+    """Revalidate a warm start in a worker thread (see ``revalidate_trends``).
 
-    except Exception as e:
-        logger.error(f"Error in fetch_trends: {str(e)}", exc_info=True)
-        return []
+    Forced refreshes started meanwhile wait for it to finish.
+    """
+    global _refresh
+    incremental = settings.refresh_mode == "incremental"
+    task = asyncio.create_task(asyncio.to_thread(revalidate_trends, since, incremental))
+    task.add_done_callback(_log_refresh_failure)
+    _refresh = (task, False, incremental)
+    return task
+
+
+async def fetch_trends(
+    force_refresh: bool = False, incremental: Optional[bool] = None
+) -> TrendTable:
+    """Fetch trends data from the configured source with in-memory caching.
+
+    Once the cache expires, the expired data keeps being served (up to
+    ``settings.max_stale_seconds`` past expiry) while a single background
+    refresh reloads it off the event loop.
+
+    Args:
+        force_refresh: Refresh even if the cached data has not expired
+        incremental: Merge only new rows into the cached data instead of
+            reloading everything; defaults to ``settings.refresh_mode``
+    """
+    if incremental is None:
+        incremental = settings.refresh_mode == "incremental"
+    with timing.phase("fetch"):
+        try:
+            if not force_refresh:
+                await attach_published_snapshot()
+                cached_data = cache.get()
+                if cached_data:
+                    logger.info("Found cached data")
+                    metrics.CACHE_REQUESTS.labels("hit").inc()
+                    return cached_data
+
+                if settings.stale_while_revalidate:
+                    stale_data = cache.get_stale(
+                        timedelta(seconds=settings.max_stale_seconds)
+                    )
+                    if stale_data:
+                        metrics.CACHE_REQUESTS.labels("stale").inc()
+                        metrics.STALE_SERVES.inc()
+                        await _start_refresh(incremental=incremental)
+                        return stale_data
+
+            logger.info(
+                f"Reading from {source}"
+                + (" (forced refresh)" if force_refresh else "")
+            )
+            metrics.CACHE_REQUESTS.labels("miss").inc()
+
+            # Shielded so a disconnecting client does not cancel a shared refresh
+            table = await asyncio.shield(
+                await _start_refresh(force_refresh, incremental)
+            )
+
+            if not table:
+                logger.warning(f"{source} contained no results")
+                return TrendTable.empty()
+
+            logger.info(f"Successfully cached {len(table)} records in memory")
+
+            return table
+
+        except Exception as e:
+            logger.error(f"Error in fetch_trends: {str(e)}", exc_info=True)
+            return TrendTable.empty()
+
+
+async def refresh_now(
+    force_refresh: bool = True, incremental: Optional[bool] = None
+) -> TrendTable:
+    """Refresh the trends and wait for the result, raising if the refresh fails.
+
+    Unlike ``fetch_trends``, which serves what it can, errors reach the
+    caller so it can retry. Without ``force_refresh``, valid cached data is
+    returned as is.
+    """
+    if incremental is None:
+        incremental = settings.refresh_mode == "incremental"
+    if not force_refresh:
+        await attach_published_snapshot()
+        cached_data = cache.get()
+        if cached_data:
+            return cached_data
+    return await asyncio.shield(await _start_refresh(force_refresh, incremental))
+
+
+async def follow_version(stamp: VersionStamp) -> None:
+    """Catch up with a version another worker refreshed to and announced.
+
+    The refreshing worker published it as the shared snapshot, if there is
+    one, so attaching is enough; otherwise the source is read here.
+    """
+    await attach_published_snapshot(wait=True)
+    cached_data = cache.latest()
+    if cached_data is not None and cached_data.version == stamp.version:
+        return
+    await refresh_now()
+
+
+async def fetch_trend_index(force_refresh: bool = False) -> PartitionIndex:
+    """Fetch the (category, country) partition index of the current trends."""
+    trends_data = await fetch_trends(force_refresh=force_refresh)
+    index = cache.index_for(trends_data)
+    if index is None:
+        # The refresh failed or was not cached, so index what we were given
+        index = PartitionIndex.build(trends_data)
+    return index
+
+
+def trend_top(trends_data: TrendTable) -> TopK:
+    """The top-K selections of ``trends_data``, made unless it is the cached data."""
+    top = cache.top_for(trends_data)
+    if top is None:
+        top = TopK(trends_data, max_k=settings.top_k_max)
+    return top
+
+
+async def fetch_trend_top() -> TopK:
+    """Fetch the top-K selections of the current trends."""
+    return trend_top(await fetch_trends())
+
+
+async def fetch_trend_cube() -> CategoryCube:
+    """Fetch the country and category cube of the current trends."""
+    trends_data = await fetch_trends()
+    cube = cache.cube_for(trends_data)
+    if cube is None:
+        cube = CategoryCube.build(trends_data)
+    return cube
+
+
+def trend_bitmaps(trends_data: TrendTable) -> BitmapIndex:
+    """The bitmap index of ``trends_data``, built unless it is the cached data."""
+    bitmaps = cache.bitmaps_for(trends_data)
+    if bitmaps is None:
+        bitmaps = BitmapIndex.build(trends_data)
+    return bitmaps
+
+
+async def fetch_trend_bitmaps() -> BitmapIndex:
+    """Fetch the per-value bitmap index of the current trends."""
+    return trend_bitmaps(await fetch_trends())
+
+
+# Elects the worker that runs scheduled refreshes and announces new versions
+# to the other workers on the host
+coordinator = RefreshCoordinator(
+    settings.coordination_path or settings.snapshot_path or None,
+    refresh=refresh_now,
+    follow=follow_version,
+    retries=settings.refresh_retries,
+    backoff=settings.refresh_backoff_seconds,
+    backoff_max=settings.refresh_backoff_max_seconds,
+)
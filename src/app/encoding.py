@@ -0,0 +1,83 @@
+from typing import Iterator, Optional, Sequence, Tuple
+import base64
+import binascii
+
+import orjson
+
+from app.store import TrendTable
+
+# Rows encoded per chunk of a streamed NDJSON response
+NDJSON_CHUNK_ROWS = 5_000
+
+
+def parse_fields(fields: Optional[str], columns: Sequence[str]) -> Tuple[str, ...]:
+    """Columns selected by a comma-separated ``fields`` parameter, in order.
+
+    Returns every column if ``fields`` is empty.
+
+    Raises:
+        ValueError: If a field is not a column
+    """
+    if not fields:
+        return tuple(columns)
+    selected = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [name for name in selected if name not in columns]
+    if unknown or not selected:
+        raise ValueError(
+            f"Unknown fields: {', '.join(unknown)}; choose from {', '.join(columns)}"
+        )
+    return selected
+
+
+def encode_cursor(version: str, offset: int) -> str:
+    """Opaque cursor for the rows of dataset ``version`` from ``offset`` on."""
+    token = f"{version}:{offset}".encode("ascii")
+    return base64.urlsafe_b64encode(token).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """Dataset version and row offset of a cursor.
+
+    Raises:
+        ValueError: If the cursor was not made by ``encode_cursor``
+    """
+    try:
+        token = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        version, offset = token.decode("ascii").rsplit(":", 1)
+        position = int(offset)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError(f"Invalid cursor: {cursor}") from None
+    if position < 0:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return version, position
+
+
+def encode_json(
+    table: TrendTable,
+    columns: Optional[Sequence[str]] = None,
+    start: int = 0,
+    stop: Optional[int] = None,
+) -> bytes:
+    """Rows ``start:stop`` of ``table`` as a JSON array of objects."""
+    return orjson.dumps(table.to_records(columns, start, stop))
+
+
+def iter_ndjson(
+    table: TrendTable,
+    columns: Optional[Sequence[str]] = None,
+    start: int = 0,
+    stop: Optional[int] = None,
+    chunk_rows: int = NDJSON_CHUNK_ROWS,
+) -> Iterator[bytes]:
+    """Rows ``start:stop`` of ``table`` as newline-delimited JSON, in chunks.
+
+    Only one chunk of rows is materialized at a time.
+    """
+    stop = len(table) if stop is None else min(stop, len(table))
+    for chunk_start in range(start, stop, chunk_rows):
+        records = table.to_records(
+            columns, chunk_start, min(chunk_start + chunk_rows, stop)
+        )
+        yield b"".join(
+            orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE) for record in records
+        )
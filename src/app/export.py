@@ -0,0 +1,264 @@
+from typing import Iterable, Iterator, List, Optional, Sequence
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import zlib
+
+import numpy as np
+
+from app.store import TrendTable
+
+logger = logging.getLogger(__name__)
+
+# Rows encoded per CSV chunk and per Parquet row group
+EXPORT_CHUNK_ROWS = 50_000
+
+# Bytes read at a time from a cached export
+EXPORT_READ_BYTES = 1024 * 1024
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+DEFAULT_EXPORT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "trend_exports")
+
+
+def csv_quote(value: str) -> str:
+    """``value`` as a CSV field, quoted only if it has to be."""
+    if any(character in value for character in ',"\r\n'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def iter_csv(
+    table: TrendTable,
+    columns: Optional[Sequence[str]] = None,
+    chunk_rows: int = EXPORT_CHUNK_ROWS,
+) -> Iterator[bytes]:
+    """``table`` as CSV with a header line, in chunks of ``chunk_rows`` rows.
+
+    Dimension values are quoted once per distinct value and looked up by
+    code, so no row is ever built as a dict.
+    """
+    names = table.columns if columns is None else tuple(columns)
+    quoted = {
+        name: np.array([csv_quote(value) for value in column.values], dtype=object)
+        for name, column in table.dimensions.items()
+        if name in names
+    }
+    yield (",".join(names) + "\n").encode("utf-8")
+    for start in range(0, len(table), chunk_rows):
+        rows = slice(start, start + chunk_rows)
+        fields: List[List[str]] = []
+        for name in names:
+            if name in quoted:
+                fields.append(quoted[name][table.dimensions[name].codes[rows]].tolist())
+            else:
+                fields.append(list(map(repr, table.metrics[name][rows].tolist())))
+        lines = map(",".join, zip(*fields))
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class _Chunks(io.RawIOBase):
+    """Write-only file collecting what is written until it is drained."""
+
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:  # type: ignore[override]
+        chunk = bytes(data)
+        self._chunks.append(chunk)
+        self._position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_parquet(
+    table: TrendTable,
+    columns: Optional[Sequence[str]] = None,
+    row_group_rows: int = EXPORT_CHUNK_ROWS,
+) -> Iterator[bytes]:
+    """``table`` as a Parquet file, one row group at a time (requires pyarrow).
+
+    Dimensions are written as dictionary columns straight from their codes
+    and metrics from their arrays without copying.
+
+    Raises:
+        RuntimeError: If pyarrow is not installed (raised on the call, not
+            once streaming has started)
+    """
+    try:
+        import pyarrow as pa  # type: ignore
+        import pyarrow.parquet as pq  # type: ignore
+    except ImportError as e:
+        raise RuntimeError(
+            "Exporting Parquet requires pyarrow: pip install 'app[parquet]'"
+        ) from e
+
+    names = table.columns if columns is None else tuple(columns)
+    dictionaries = {
+        name: pa.array(column.values, type=pa.string())
+        for name, column in table.dimensions.items()
+        if name in names
+    }
+
+    def batch(rows: slice) -> "pa.Table":
+        arrays = []
+        for name in names:
+            if name in dictionaries:
+                codes = table.dimensions[name].codes[rows].astype(np.int32, copy=False)
+                arrays.append(pa.DictionaryArray.from_arrays(codes, dictionaries[name]))
+            else:
+                arrays.append(pa.array(table.metrics[name][rows]))
+        return pa.Table.from_arrays(arrays, names=list(names))
+
+    def chunks() -> Iterator[bytes]:
+        sink = _Chunks()
+        first = batch(slice(0, row_group_rows))
+        with pq.ParquetWriter(sink, first.schema) as writer:
+            writer.write_table(first)
+            yield sink.drain()
+            for start in range(row_group_rows, len(table), row_group_rows):
+                writer.write_table(batch(slice(start, start + row_group_rows)))
+                yield sink.drain()
+        yield sink.drain()
+
+    return chunks()
+
+
+def export_chunks(
+    table: TrendTable, format: str, columns: Optional[Sequence[str]] = None
+) -> Iterator[bytes]:
+    """``table`` encoded as ``format`` ("csv" or "parquet"), in chunks."""
+    if format == "parquet":
+        return iter_parquet(table, columns)
+    return iter_csv(table, columns)
+
+
+def gzip_chunks(chunks: Iterable[bytes], compresslevel: int = 6) -> Iterator[bytes]:
+    """``chunks`` as one gzip stream, compressed as they come."""
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def gunzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Decompress a gzip stream chunk by chunk, for clients without gzip."""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    yield decompressor.flush()
+
+
+def read_chunks(path: str, size: int = EXPORT_READ_BYTES) -> Iterator[bytes]:
+    """A file's bytes, ``size`` at a time."""
+    with open(path, "rb") as f:
+        while chunk := f.read(size):
+            yield chunk
+
+
+def export_key(*parts: object) -> str:
+    """Cache key of an export, e.g. of its dataset version, filter and format."""
+    return hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+
+class ExportCache:
+    """Encoded exports on disk, shared by the workers on a host.
+
+    An export is written to a temporary file while it is first streamed
+    and renamed into place once complete, so a later download only sends
+    the file; CSV is stored gzip-compressed, ready to send as is. The
+    least recently downloaded exports are deleted once the directory holds
+    more than ``max_bytes``.
+    """
+
+    def __init__(self, directory: str = DEFAULT_EXPORT_CACHE_DIR, max_bytes: int = 0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{key}.{suffix}")
+
+    def get(self, key: str, suffix: str) -> Optional[str]:
+        """Path of a complete cached export, marked as just used; None if absent."""
+        path = self.path(key, suffix)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def store(self, key: str, suffix: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Pass ``chunks`` through, writing them to the cache as they go.
+
+        The export is only cached if every chunk was consumed, so a download
+        cut short leaves nothing behind.
+        """
+        if not self.enabled:
+            yield from chunks
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key, suffix)
+        temp_file = tempfile.NamedTemporaryFile(
+            dir=self.directory, prefix=f".{key}.", suffix=".tmp", delete=False
+        )
+        complete = False
+        try:
+            with temp_file:
+                for chunk in chunks:
+                    temp_file.write(chunk)
+                    yield chunk
+            os.replace(temp_file.name, path)
+            complete = True
+        finally:
+            if not complete:
+                os.remove(temp_file.name)
+        self.prune()
+
+    def prune(self) -> None:
+        """Delete the least recently used exports until within ``max_bytes``."""
+        try:
+            entries = [
+                entry
+                for entry in os.scandir(self.directory)
+                if entry.is_file() and not entry.name.startswith(".")
+            ]
+        except FileNotFoundError:
+            return
+        stats = sorted(
+            ((entry.stat(), entry.path) for entry in entries),
+            key=lambda item: item[0].st_mtime_ns,
+        )
+        total = sum(stat.st_size for stat, _ in stats)
+        for stat, path in stats:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= stat.st_size
+            logger.info(f"Evicted cached export {os.path.basename(path)}")
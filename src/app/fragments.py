@@ -0,0 +1,98 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable, Optional, Tuple
+import gzip
+import hashlib
+import threading
+
+
+@dataclass(frozen=True)
+class Fragment:
+    """A rendered HTML fragment (or other response body) stored gzip-compressed."""
+
+    body: bytes
+    etag: str
+    media_type: str = "text/html"
+
+    @classmethod
+    def from_html(cls, html: str, compresslevel: int = 9) -> "Fragment":
+        """Compress rendered HTML and derive a strong ETag from its content."""
+        return cls.from_bytes(html.encode("utf-8"), compresslevel=compresslevel)
+
+    @classmethod
+    def from_bytes(
+        cls, raw: bytes, media_type: str = "text/html", compresslevel: int = 9
+    ) -> "Fragment":
+        """Compress an encoded body and derive a strong ETag from its content."""
+        etag = '"' + hashlib.blake2b(raw, digest_size=16).hexdigest() + '"'
+        # mtime=0 keeps the compressed bytes identical across workers
+        return cls(
+            body=gzip.compress(raw, compresslevel, mtime=0),
+            etag=etag,
+            media_type=media_type,
+        )
+
+    @property
+    def gzip_etag(self) -> str:
+        """ETag of the gzip-encoded representation."""
+        return self.etag[:-1] + '-gzip"'
+
+    def decompressed(self) -> bytes:
+        """Return the uncompressed body for clients without gzip support."""
+        return gzip.decompress(self.body)
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """Check an If-None-Match header against either representation."""
+        return etag_matches(if_none_match, self.etag, self.gzip_etag)
+
+
+def etag_matches(if_none_match: Optional[str], *etags: str) -> bool:
+    """Check an If-None-Match header (a list, ``W/`` tags or ``*``) against ETags."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return any(etag in tags for etag in etags)
+
+
+class FragmentCache:
+    """Bounded LRU cache of rendered fragments.
+
+    Keys start with the dataset version, so a data refresh naturally stops
+    hitting old entries and they age out under LRU eviction.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[Hashable, ...], Fragment]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Tuple[Hashable, ...]) -> Optional[Fragment]:
+        """Return a cached fragment and mark it as recently used."""
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return fragment
+
+    def set(self, key: Tuple[Hashable, ...], fragment: Fragment) -> None:
+        """Store a fragment, evicting the least recently used if full."""
+        with self._lock:
+            self._entries[key] = fragment
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop every cached fragment."""
+        with self._lock:
+            self._entries.clear()
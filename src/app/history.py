@@ -0,0 +1,269 @@
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple, cast
+import json
+import logging
+import os
+import threading
+import numpy as np
+
+from app.store import METRIC_COLUMNS, TrendTable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETENTION_DAYS = 90
+
+# (campaign_country, level 1, level 2, level 3)
+HistoryKey = Tuple[str, str, str, str]
+KEY_COLUMNS: Tuple[str, ...] = (
+    "campaign_country",
+    "product_category_level_1",
+    "product_category_level_2",
+    "product_category_level_3",
+)
+
+
+def _day_numbers(values: Tuple[str, ...]) -> np.ndarray:
+    """Proleptic ordinal of each ISO date string, or -1 if it is not a date."""
+    days = np.full(len(values), -1, dtype=np.int64)
+    for code, value in enumerate(values):
+        try:
+            days[code] = date.fromisoformat(value).toordinal()
+        except ValueError:
+            pass
+    return days
+
+
+def downsample(values: np.ndarray, points: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Average ``values`` into at most ``points`` equal-width buckets.
+
+    Missing values (NaN) are ignored; a bucket with no values stays NaN.
+
+    Returns:
+        The index of the last value in each bucket and the bucket means
+    """
+    if len(values) <= points:
+        return np.arange(len(values)), values
+    starts = np.linspace(0, len(values), points + 1).astype(np.intp)[:-1]
+    present = ~np.isnan(values)
+    totals = np.add.reduceat(np.where(present, values, 0.0), starts)
+    counts = np.add.reduceat(present.astype(np.int64), starts)
+    with np.errstate(invalid="ignore"):
+        means = totals / counts
+    ends = np.append(starts[1:], len(values)) - 1
+    return ends, means
+
+
+def sparkline_path(values: np.ndarray, width: float, height: float) -> str:
+    """SVG path data drawing ``values`` across a ``width`` x ``height`` box.
+
+    The line is broken at missing values rather than drawn across them.
+    """
+    present = ~np.isnan(values)
+    if not present.any():
+        return ""
+    low, high = values[present].min(), values[present].max()
+    span = (high - low) or 1.0
+    xs = np.linspace(0, width, len(values)) if len(values) > 1 else np.zeros(1)
+    ys = height - (values - low) / span * height
+    commands = []
+    run = 0
+    for x, y, ok in zip(xs.tolist(), ys.tolist(), present.tolist()):
+        if ok:
+            commands.append(f"{'L' if run else 'M'}{x:.1f},{y:.1f}")
+            run += 1
+        elif run == 1:
+            # A zero-length segment draws a lone value as a dot
+            commands.append("l0,0")
+        if not ok:
+            run = 0
+    if run == 1:
+        commands.append("l0,0")
+    return " ".join(commands)
+
+
+class HistoryStore:
+    """Daily change metrics per (country, level 1, level 2, level 3).
+
+    Each key owns a ring buffer of ``retention_days`` daily slots holding
+    the six change metrics as float32, so memory stays fixed per key no
+    matter how often the data is refreshed. Slot ``day % retention_days``
+    holds a day's values; a slot is reused (and cleared) once its day
+    falls out of the retention window. Missing days are NaN.
+    """
+
+    def __init__(self, retention_days: int = DEFAULT_RETENTION_DAYS):
+        if retention_days < 1:
+            raise ValueError("retention_days must be at least 1")
+        self.retention_days = retention_days
+        self.keys: Dict[HistoryKey, int] = {}
+        self._lock = threading.Lock()
+        # Day held by each slot, -1 for none
+        self._days = np.full(retention_days, -1, dtype=np.int64)
+        self._values = np.full(
+            (0, retention_days, len(METRIC_COLUMNS)), np.nan, dtype=np.float32
+        )
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @property
+    def latest_day(self) -> Optional[date]:
+        """Most recent day recorded, if any."""
+        latest = int(self._days.max())
+        return date.fromordinal(latest) if latest >= 0 else None
+
+    def _grow(self, needed: int) -> None:
+        capacity = len(self._values)
+        if needed <= capacity:
+            return
+        grown = np.full(
+            (max(needed, capacity * 2, 64),) + self._values.shape[1:],
+            np.nan,
+            dtype=np.float32,
+        )
+        grown[:capacity] = self._values
+        self._values = grown
+
+    def record(self, table: TrendTable) -> int:
+        """Store the change metrics of every row, by key and ``event_date``.
+
+        Rows older than the retention window (relative to the newest day
+        seen) or whose ``event_date`` is not an ISO date are ignored; a row
+        for a day already stored overwrites it.
+
+        Returns:
+            The number of rows recorded
+        """
+        if not len(table):
+            return 0
+        with self._lock:
+            return self._record(table)
+
+    def _record(self, table: TrendTable) -> int:
+        event_dates = table.dimensions["event_date"]
+        row_days = _day_numbers(event_dates.values)[event_dates.codes]
+        valid = row_days >= 0
+        if not valid.any():
+            return 0
+        latest = max(int(row_days[valid].max()), int(self._days.max()))
+        rows = np.flatnonzero(valid & (row_days > latest - self.retention_days))
+        if not len(rows):
+            return 0
+        row_days = row_days[rows]
+
+        # Reclaim the slots of days that left the window
+        for day in np.unique(row_days).tolist():
+            slot = day % self.retention_days
+            if self._days[slot] != day:
+                self._values[:, slot, :] = np.nan
+                self._days[slot] = day
+
+        # One composite code per distinct key, then one dictionary lookup each
+        columns = [table.dimensions[name] for name in KEY_COLUMNS]
+        composite = np.zeros(len(rows), dtype=np.int64)
+        for column in columns:
+            composite = composite * len(column.values) + column.codes[rows]
+        _, first, inverse = np.unique(composite, return_index=True, return_inverse=True)
+        key_ids = np.empty(len(first), dtype=np.int64)
+        for position, row in enumerate(rows[first].tolist()):
+            key = cast(HistoryKey, tuple(c.values[c.codes[row]] for c in columns))
+            key_ids[position] = self.keys.setdefault(key, len(self.keys))
+        self._grow(len(self.keys))
+
+        metrics = np.stack([table.metric(name)[rows] for name in METRIC_COLUMNS], 1)
+        self._values[key_ids[inverse], row_days % self.retention_days] = metrics
+        return len(rows)
+
+    def series(
+        self, key: HistoryKey, metric: str, days: Optional[int] = None
+    ) -> Tuple[List[date], np.ndarray]:
+        """Daily values of ``metric`` for ``key`` over the last ``days`` days.
+
+        Days run up to the newest day recorded for any key; days without a
+        value are NaN.
+
+        Raises:
+            KeyError: If the key was never recorded, no day has been
+                recorded or the metric is unknown
+        """
+        position = METRIC_COLUMNS.index(metric) if metric in METRIC_COLUMNS else -1
+        if position < 0:
+            raise KeyError(metric)
+        days = min(days or self.retention_days, self.retention_days)
+        with self._lock:
+            key_id = self.keys[key]
+            latest = int(self._days.max())
+            if latest < 0:
+                raise KeyError(key)
+            day_numbers = np.arange(latest - days + 1, latest + 1)
+            slots = day_numbers % self.retention_days
+            values = self._values[key_id, slots, position].astype(np.float64)
+            values[self._days[slots] != day_numbers] = np.nan
+        start = date.fromordinal(int(day_numbers[0]))
+        return [start + timedelta(days=i) for i in range(days)], values
+
+    def save(self, path: str) -> None:
+        """Write the store to ``path`` (.npy values plus a .json key list).
+
+        Both files are written next to their targets and renamed over them;
+        the values are written first, so the key list never names rows
+        that are missing from them.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._save(path)
+
+    def _save(self, path: str) -> None:
+        header = {
+            "retention_days": self.retention_days,
+            "days": self._days.tolist(),
+            "keys": [list(key) for key in self.keys],
+        }
+        targets = [(f"{path}.npy", None), (f"{path}.json", header)]
+        for target, content in targets:
+            temp_path = f"{target}.{os.getpid()}.tmp"
+            try:
+                with open(temp_path, "wb") as out:
+                    if content is None:
+                        np.save(out, self._values[: len(self.keys)])
+                    else:
+                        out.write(json.dumps(content).encode("utf-8"))
+                os.replace(temp_path, target)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+    @classmethod
+    def open(
+        cls, path: str, retention_days: int = DEFAULT_RETENTION_DAYS
+    ) -> "HistoryStore":
+        """Load a store saved with ``save``, or start an empty one.
+
+        The values are memory-mapped copy-on-write, so pages are only read
+        when a series is requested and recording never touches the file
+        until the store is saved again. A store saved with a different
+        retention is ignored.
+        """
+        store = cls(retention_days)
+        try:
+            with open(f"{path}.json", "rb") as header_file:
+                header = json.loads(header_file.read().decode("utf-8"))
+            values = np.load(f"{path}.npy", mmap_mode="c")
+        except FileNotFoundError:
+            return store
+        except ValueError as e:
+            logger.warning(f"Ignoring unreadable history {path}: {str(e)}")
+            return store
+        if header["retention_days"] != retention_days or len(values) < len(
+            header["keys"]
+        ):
+            logger.warning(f"Ignoring history {path} saved with other settings")
+            return store
+        store._days = np.asarray(header["days"], dtype=np.int64)
+        store.keys = {
+            cast(HistoryKey, tuple(key)): i for i, key in enumerate(header["keys"])
+        }
+        store._values = values
+        logger.info(f"Opened history of {len(store)} keys from {path}")
+        return store
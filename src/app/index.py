@@ -0,0 +1,104 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from app.scoring import SCORE_COLUMN
+from app.store import TrendRow, TrendTable
+
+ALL_CATEGORIES = "all"
+# Ranks tables that have not been scored
+RANK_METRIC = "revenue_weekly_change"
+
+
+@dataclass(frozen=True)
+class Partition:
+    """Pre-sorted gainer and loser row indices for one (category, country)."""
+
+    gainers: np.ndarray
+    losers: np.ndarray
+
+
+EMPTY_PARTITION = Partition(
+    gainers=np.empty(0, dtype=np.intp), losers=np.empty(0, dtype=np.intp)
+)
+
+
+def _group(
+    order: np.ndarray, keys: np.ndarray, labels: Dict[int, Tuple[str, str]]
+) -> Dict[Tuple[str, str], np.ndarray]:
+    """Split ranked row indices into per-key runs, preserving rank order."""
+    if not len(order):
+        return {}
+    grouped = order[np.argsort(keys[order], kind="stable")]
+    unique_keys, starts = np.unique(keys[grouped], return_index=True)
+    return {
+        labels[key]: run
+        for key, run in zip(unique_keys.tolist(), np.split(grouped, starts[1:]))
+    }
+
+
+class PartitionIndex:
+    """Gainers and losers for every (category or "all", country) pair.
+
+    Built once per data refresh so the grid and card endpoints only do a
+    dictionary lookup instead of re-filtering and re-sorting the dataset.
+    """
+
+    def __init__(self, table: TrendTable, partitions: Dict[Tuple[str, str], Partition]):
+        self.table = table
+        self.partitions = partitions
+
+    @classmethod
+    def build(cls, table: TrendTable, metric: Optional[str] = None) -> "PartitionIndex":
+        """Rank the table once and bucket the ranking by category and country.
+
+        Ranks by ``trend_score`` when the table has been scored, otherwise
+        by the raw weekly revenue change.
+        """
+        if metric is None:
+            metric = SCORE_COLUMN if SCORE_COLUMN in table.metrics else RANK_METRIC
+        countries = table.dimensions["campaign_country"]
+        categories = table.dimensions["product_category_level_1"]
+
+        width = len(categories.values) + 1
+        # Code ``width - 1`` stands for "all categories"
+        by_category = countries.codes.astype(np.int64) * width + categories.codes
+        by_country = countries.codes.astype(np.int64) * width + (width - 1)
+        labels = {
+            country_code * width + category_code: (category, country)
+            for country_code, country in enumerate(countries.values)
+            for category_code, category in enumerate(
+                categories.values + (ALL_CATEGORIES,)
+            )
+        }
+
+        buckets: Dict[str, Dict[Tuple[str, str], np.ndarray]] = {}
+        for side, ascending in (("gainers", False), ("losers", True)):
+            order = table.ranked(metric, ascending=ascending)
+            buckets[side] = _group(order, by_category, labels)
+            buckets[side].update(_group(order, by_country, labels))
+
+        partitions = {
+            key: Partition(
+                gainers=buckets["gainers"].get(key, EMPTY_PARTITION.gainers),
+                losers=buckets["losers"].get(key, EMPTY_PARTITION.losers),
+            )
+            for key in buckets["gainers"].keys() | buckets["losers"].keys()
+        }
+        return cls(table, partitions)
+
+    def lookup(self, category: str, country: str) -> Partition:
+        """Return the partition for a pair, or an empty one if it has no rows."""
+        return self.partitions.get((category, country), EMPTY_PARTITION)
+
+    def gainers(
+        self, category: str, country: str, limit: Optional[int] = None
+    ) -> List[TrendRow]:
+        """Rows with a positive change, largest first."""
+        return self.table.rows(self.lookup(category, country).gainers[:limit])
+
+    def losers(
+        self, category: str, country: str, limit: Optional[int] = None
+    ) -> List[TrendRow]:
+        """Rows with a negative change, most negative first."""
+        return self.table.rows(self.lookup(category, country).losers[:limit])
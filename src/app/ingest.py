@@ -0,0 +1,359 @@
+from array import array
+from dataclasses import dataclass, field
+from itertools import chain, islice, repeat
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    TextIO,
+    Tuple,
+)
+import csv
+import io
+import logging
+import re
+import time
+import numpy as np
+
+from app.store import (
+    DIMENSION_COLUMNS,
+    METRIC_COLUMNS,
+    DictionaryColumn,
+    TrendTable,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 65536
+DEFAULT_MAX_ERRORS = 100
+
+# Quoted CSV field; doubled quotes inside it are escaped quotes
+_QUOTED = re.compile(r'"((?:[^"]|"")*)"')
+# Stand-ins for separators inside quoted fields while a chunk is split
+_UNPROTECTED = str.maketrans({"\x00": ",", "\x01": "\n"})
+
+
+class IngestSchemaError(ValueError):
+    """Raised when a source is missing required trend columns."""
+
+
+@dataclass(frozen=True)
+class IngestError:
+    """A rejected input row.
+
+    ``row`` is the 1-based data row number (the header is not counted), or
+    0 for an error about a whole file. ``source`` names the file the row is
+    in when a load reads several.
+    """
+
+    row: int
+    reason: str
+    column: Optional[str] = None
+    value: Optional[str] = None
+    source: Optional[str] = None
+
+
+@dataclass
+class IngestResult:
+    """Outcome of ingesting a source into a ``TrendTable``.
+
+    ``parse_seconds`` is the time spent turning raw rows into columns; the
+    rest of the ingest was spent reading the source.
+
+    An incremental load may also return ``removed``: rows loaded before
+    that the source no longer holds as they were (only their dimensions
+    are set). They are dropped before ``table`` is merged in. ``complete``
+    means ``table`` holds every row, so it replaces the data instead.
+    """
+
+    table: TrendTable
+    rows_read: int
+    error_count: int = 0
+    errors: List[IngestError] = field(default_factory=list)
+    parse_seconds: float = 0.0
+    removed: Optional[TrendTable] = None
+    complete: bool = False
+
+    @property
+    def rows_loaded(self) -> int:
+        return len(self.table)
+
+
+class _Encoder:
+    """Dictionary-encodes one dimension column, value by value.
+
+    ``codes`` is keyed by raw field tokens, which may still carry the
+    stand-ins used while splitting quoted fields; ``values`` holds the
+    decoded strings in code order.
+    """
+
+    def __init__(self) -> None:
+        self.codes: Dict[str, int] = {}
+        self.values: Dict[str, int] = {}
+
+    def encode(self, tokens: Sequence[str]) -> List[int]:
+        """Codes of ``tokens``, assigning the next free code to each new value."""
+        try:
+            return list(map(self.codes.__getitem__, tokens))
+        except KeyError:
+            pass
+        # New values get codes in order of first appearance
+        for token in dict.fromkeys(tokens):
+            if token not in self.codes:
+                value = token.translate(_UNPROTECTED)
+                self.codes[token] = self.values.setdefault(value, len(self.values))
+        return list(map(self.codes.__getitem__, tokens))
+
+
+class TrendTableBuilder:
+    """Accumulates trend rows into compact typed buffers.
+
+    Dimension values are dictionary-encoded into int32 buffers and metrics
+    go straight into float64 buffers as each chunk arrives, so memory grows
+    with the final columnar size rather than with per-row Python objects.
+    """
+
+    def __init__(self, max_errors: int = DEFAULT_MAX_ERRORS):
+        self.max_errors = max_errors
+        self.rows_read = 0
+        self.parse_seconds = 0.0
+        self.error_count = 0
+        self.errors: List[IngestError] = []
+        self._encoders = [_Encoder() for _ in DIMENSION_COLUMNS]
+        self._codes = [array("i") for _ in DIMENSION_COLUMNS]
+        self._metrics = [array("d") for _ in METRIC_COLUMNS]
+
+    def reject(self, row: int, reason: str, **details: Optional[str]) -> None:
+        """Record a malformed row, keeping at most ``max_errors`` details."""
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append(IngestError(row=row, reason=reason, **details))
+
+    def append_columns(
+        self,
+        dimensions: Sequence[Sequence[str]],
+        metrics: Sequence[Sequence[str]],
+        row_numbers: Sequence[int],
+    ) -> None:
+        """Append one chunk given as column-major string values.
+
+        Rows whose metrics are empty, missing (None), unparsable or
+        non-finite are rejected and reported (using ``row_numbers``) instead
+        of being loaded as 0.0.
+        """
+        start = time.perf_counter()
+        count = len(dimensions[0]) if dimensions else 0
+        self.rows_read += count
+        parsed = np.empty((len(METRIC_COLUMNS), count), dtype=np.float64)
+        keep = np.ones(count, dtype=bool)
+
+        for position, values in enumerate(metrics):
+            try:
+                parsed[position] = np.fromiter(
+                    map(float, values), dtype=np.float64, count=count
+                )
+            except (TypeError, ValueError):
+                # Slow path: find the offending rows in this chunk only
+                for offset, value in enumerate(values):
+                    try:
+                        parsed[position, offset] = float(value)
+                    except (TypeError, ValueError):
+                        parsed[position, offset] = np.nan
+            bad = ~np.isfinite(parsed[position])
+            for offset in np.flatnonzero(bad & keep).tolist():
+                self.reject(
+                    row_numbers[offset],
+                    "invalid number",
+                    column=METRIC_COLUMNS[position],
+                    value=str(values[offset]),
+                )
+            keep &= ~bad
+
+        if keep.all():
+            selected: Iterable[int] = range(count)
+        else:
+            selected = np.flatnonzero(keep).tolist()
+
+        for encoder, codes, tokens in zip(self._encoders, self._codes, dimensions):
+            if isinstance(selected, range):
+                codes.extend(encoder.encode(tokens))
+            else:
+                codes.extend(encoder.encode([tokens[i] for i in selected]))
+        for buffer, column in zip(self._metrics, parsed):
+            buffer.frombytes(column[keep].tobytes())
+        self.parse_seconds += time.perf_counter() - start
+
+    def build(self) -> TrendTable:
+        """Wrap the buffers as a table without copying them."""
+        dimensions = {
+            name: DictionaryColumn(
+                codes=np.frombuffer(codes, dtype=np.int32),
+                values=tuple(encoder.values),
+            )
+            for name, encoder, codes in zip(
+                DIMENSION_COLUMNS, self._encoders, self._codes
+            )
+        }
+        metrics = {
+            name: np.frombuffer(values, dtype=np.float64)
+            for name, values in zip(METRIC_COLUMNS, self._metrics)
+        }
+        return TrendTable(dimensions, metrics)
+
+    def result(self) -> IngestResult:
+        """Finish building and summarise the ingest."""
+        return IngestResult(
+            table=self.build(),
+            rows_read=self.rows_read,
+            error_count=self.error_count,
+            errors=self.errors,
+            parse_seconds=self.parse_seconds,
+        )
+
+
+def _protect(match: "re.Match[str]") -> str:
+    field = match.group(1)
+    if '""' in field:
+        field = field.replace('""', '"')
+    return field.replace(",", "\x00").replace("\n", "\x01")
+
+
+def _text_chunks(lines: TextIO, size: int) -> Iterator[str]:
+    """Yield blocks of about ``size`` complete CSV records."""
+    while True:
+        block = list(islice(lines, size))
+        if not block:
+            return
+        text = "".join(block)
+        # Keep reading while a quoted field spans the end of the block
+        while text.count('"') % 2:
+            line = lines.readline()
+            if not line:
+                break
+            text += line
+        if not text.endswith("\n"):
+            text += "\n"
+        yield text
+
+
+def _split_columns(text: str, width: int) -> Optional[List[List[str]]]:
+    """Split a block of regular records straight into columns.
+
+    Returns None when the block needs row-by-row handling, e.g. ragged or
+    blank rows.
+    """
+    if '"' in text:
+        text = _QUOTED.sub(_protect, text)
+    if "\r" in text:
+        text = text.replace("\r", "")
+    records = text.split("\n")
+    records.pop()  # Empty string after the final newline
+    # Check each record, not just the total: a long row and a short row
+    # would otherwise shift every field between them into the wrong column
+    if set(map(str.count, records, repeat(","))) != {width - 1}:
+        return None
+    fields = ",".join(records).split(",")
+    return [fields[position::width] for position in range(width)]
+
+
+def _read_rows(
+    text: str, width: int, first_row: int, builder: "TrendTableBuilder"
+) -> Tuple[List[List[str]], List[int], int]:
+    """Parse a block with the csv module, rejecting rows of the wrong width.
+
+    Returns the columns of the good rows, their row numbers, and how many
+    records the block held (a quoted field may span lines).
+    """
+    rows, numbers = [], []
+    offset = -1
+    for offset, row in enumerate(csv.reader(io.StringIO(text))):
+        if len(row) == width:
+            rows.append(row)
+            numbers.append(first_row + offset)
+        elif any(row):
+            builder.rows_read += 1
+            builder.reject(
+                first_row + offset, f"expected {width} fields, found {len(row)}"
+            )
+    return [list(column) for column in zip(*rows)], numbers, offset + 1
+
+
+def read_trend_rows(
+    lines: TextIO,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_errors: int = DEFAULT_MAX_ERRORS,
+    builder: Optional[TrendTableBuilder] = None,
+) -> IngestResult:
+    """Parse fixed-schema trend CSV text in chunks into a ``TrendTable``.
+
+    Regular blocks are split directly into columns without building a list
+    per row; blocks with ragged or blank rows go through the csv module so
+    each bad row can be reported.
+
+    Args:
+        lines: Open text stream positioned at the header row
+        chunk_size: Rows parsed per vectorized chunk
+        max_errors: Maximum number of rejected rows reported in detail
+        builder: Optional builder to append to instead of a new one
+
+    Raises:
+        IngestSchemaError: If the header lacks any required column
+    """
+    header = next(csv.reader([lines.readline()]), [])
+    header = [name.strip() for name in header]
+    missing = [c for c in chain(DIMENSION_COLUMNS, METRIC_COLUMNS) if c not in header]
+    if missing:
+        raise IngestSchemaError(f"Missing required columns: {', '.join(missing)}")
+
+    width = len(header)
+    dimension_positions = [header.index(c) for c in DIMENSION_COLUMNS]
+    metric_positions = [header.index(c) for c in METRIC_COLUMNS]
+    builder = builder or TrendTableBuilder(max_errors=max_errors)
+
+    first_row = 1
+    for text in _text_chunks(lines, chunk_size):
+        start = time.perf_counter()
+        columns = _split_columns(text, width)
+        if columns is not None:
+            count = len(columns[0])
+            row_numbers: Sequence[int] = range(first_row, first_row + count)
+        else:
+            columns, row_numbers, count = _read_rows(text, width, first_row, builder)
+        builder.parse_seconds += time.perf_counter() - start
+        if row_numbers:
+            builder.append_columns(
+                [columns[p] for p in dimension_positions],
+                [columns[p] for p in metric_positions],
+                row_numbers,
+            )
+        first_row += count
+
+    return builder.result()
+
+
+def read_trend_csv(
+    path: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_errors: int = DEFAULT_MAX_ERRORS,
+) -> IngestResult:
+    """Stream a trend CSV file into a ``TrendTable``."""
+    with open(path, "r", newline="") as csvfile:
+        result = read_trend_rows(csvfile, chunk_size=chunk_size, max_errors=max_errors)
+    log_ingest(path, result)
+    return result
+
+
+def log_ingest(source: str, result: IngestResult) -> None:
+    """Log a summary of an ingest, including rejected rows."""
+    if result.error_count:
+        logger.warning(
+            f"Rejected {result.error_count} of {result.rows_read} rows from {source}"
+        )
+        for error in result.errors[:5]:
+            detail = f" {error.column}={error.value!r}" if error.column else ""
+            where = f"{error.source} " if error.source else ""
+            logger.warning(f"  {where}row {error.row}: {error.reason}{detail}")
+    logger.info(f"Ingested {result.rows_loaded} rows from {source}")
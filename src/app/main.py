@@ -1,25 +1,65 @@
 # app/main.py
 from contextlib import asynccontextmanager
+from datetime import datetime
 from fastapi import FastAPI, Request, Response
-from fastapi.templating import Jinja2Templates
-from fastapi import HTTPException, status
-from fastapi.staticfiles import StaticFiles
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
-from apscheduler.schedulers.asyncio import AsyncIOScheduler  # type: ignore
-from typing import List, Dict, Any
-from functools import lru_cache
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
+from fastapi.responses import FileResponse, StreamingResponse
+from typing import Any, AsyncIterator, Callable, Dict, List, Literal, Optional, Tuple
+from urllib.parse import quote, urlencode
 from prometheus_fastapi_instrumentator import Instrumentator
+import asyncio
 import time
 
-from app.database import fetch_trends, cache
+from app import metrics, timing
+from app.admission import AdmissionController, AdmissionMiddleware
+from app.assets import SelectiveGZipMiddleware, StaticAssets, pick_encoding
+from app.config import settings
+from app.database import (
+    fetch_trends,
+    fetch_trend_index,
+    fetch_trend_top,
+    fetch_trend_cube,
+    fetch_trend_bitmaps,
+    trend_bitmaps,
+    trend_top,
+    cache,
+    coordinator,
+    history,
+    start_revalidation,
+    warm_start,
+)
+from app.encoding import (
+    decode_cursor,
+    encode_cursor,
+    encode_json,
+    iter_ndjson,
+    parse_fields,
+)
+from app.export import (
+    DEFAULT_EXPORT_CACHE_DIR,
+    EXPORT_MEDIA_TYPES,
+    ExportCache,
+    export_chunks,
+    export_key,
+    gunzip_chunks,
+    gzip_chunks,
+    read_chunks,
+)
+from app.fragments import Fragment, FragmentCache, etag_matches
+from app.history import downsample, sparkline_path
+from app.index import ALL_CATEGORIES, PartitionIndex
+from app.push import Broadcaster, BroadcasterFull, encode_event
+from app.query import TrendQuery, parse_range, parse_sort
+from app.scoring import SCORE_COLUMN
+from app.store import METRIC_COLUMNS, TrendTable
+from app.templating import create_templates, precompile
+from app.topk import TopK
 
 import logging
 import os
+import numpy as np
 
 # Initialize logging with more detail for production
 logging.basicConfig(
@@ -31,11 +71,8 @@ logger = logging.getLogger(__name__)
 uvicorn_logger = logging.getLogger("uvicorn.error")
 uvicorn_logger.setLevel(logging.ERROR)
 
-# Setup rate limiter
-limiter = Limiter(key_func=get_remote_address)
-
-# Setup scheduler
-scheduler = AsyncIOScheduler()
+# Scheduler of the daily refresh and push checks, created on startup
+scheduler: Any = None
 
 # Get environment variables
 FORCE_CACHE_REFRESH = os.getenv("FORCE_CACHE_REFRESH", "false").lower() == "true"
@@ -45,21 +82,61 @@ ALLOWED_HOSTS = os.getenv("ALLOWED_HOSTS", "*").split(",")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global scheduler
     try:
-        # Perform initial data fetch
-        logger.info("Initiating first BigQuery fetch...")
-        initial_data = await fetch_trends(force_refresh=FORCE_CACHE_REFRESH)
+        # Compile (or load the precompiled bytecode of) every template now,
+        # so the first request does not
+        precompile(templates)
+
+        # Serve the snapshot left by a previous run straight away and check
+        # it against the source in the background; otherwise load the source
+        start_time = time.perf_counter()
+        booted = datetime.now()
+        if not FORCE_CACHE_REFRESH and warm_start():
+            start = "warm"
+            start_revalidation(booted)
+            initial_data = cache.latest() or await fetch_trends()
+        else:
+            start = "cold"
+            logger.info(f"Initiating first fetch from {settings.data_source}...")
+            initial_data = await fetch_trends(force_refresh=FORCE_CACHE_REFRESH)
+        startup_time = time.perf_counter() - start_time
+        metrics.STARTUP_SECONDS.labels(start).set(startup_time)
         if not initial_data:
             logger.error("Initial data fetch returned empty result")
         else:
             logger.info(
-                f"Successfully fetched initial data with {len(initial_data)} records"
+                f"{start.capitalize()} start with {len(initial_data)} records "
+                f"in {startup_time:.3f}s"
             )
 
-        # Schedule daily data fetch at midnight
+        # Only the serving process needs the scheduler, so importing the app
+        # (tests, tooling) does not pay for it
+        from apscheduler.schedulers.asyncio import AsyncIOScheduler  # type: ignore
+
+        scheduler = AsyncIOScheduler()
+
+        # Schedule daily data fetch at midnight (incremental unless
+        # REFRESH_MODE=full), run by whichever worker leads; the others
+        # follow the version it announces
+        coordinator.elect()
         scheduler.add_job(
-            fetch_trends, "cron", hour=0, minute=0, kwargs={"force_refresh": True}
+            coordinator.scheduled_refresh,
+            "cron",
+            hour=0,
+            minute=0,
+            jitter=settings.refresh_jitter_seconds,
         )
+        if coordinator.versions is not None:
+            scheduler.add_job(
+                coordinator.tick, "interval", seconds=settings.refresh_poll_seconds
+            )
+
+        # Push new dataset versions to connected clients
+        if settings.push_enabled:
+            scheduler.add_job(
+                publish_trends, "interval", seconds=settings.push_check_seconds
+            )
         scheduler.start()
         logger.info("Scheduler started successfully")
 
@@ -69,8 +146,9 @@ async def lifespan(app: FastAPI):
         logger.error(f"Startup error: {str(e)}", exc_info=True)
         raise
     finally:
-        if scheduler.running:
+        if scheduler is not None and scheduler.running:
             scheduler.shutdown()
+        coordinator.resign()
 
 
 app = FastAPI(
@@ -83,13 +161,40 @@ app = FastAPI(
     root_path=os.getenv("ROOT_PATH", ""),
 )
 
-# Mount static files
+# Mount static files, fingerprinted and precompressed if they were built
 static_dir = os.getenv("STATIC_DIR", "src/app/static")
-app.mount("/static", StaticFiles(directory=static_dir), name="static_files")
+static_assets = StaticAssets(
+    static_dir,
+    build_dir=settings.static_build_dir or None,
+    memory_bytes=settings.static_memory_bytes,
+)
+app.mount("/static", static_assets, name="static_files")
+
+
+def url_for(name: str, **path_params: Any) -> str:
+    """``app.url_path_for``, linking static assets by fingerprinted name."""
+    if name == "static_files":
+        path_params["path"] = static_assets.url(path_params["path"])
+    return app.url_path_for(name, **path_params)
+
 
 # Configure templates with custom functions
-templates = Jinja2Templates(directory="src/app/templates")
-templates.env.globals["url_for"] = app.url_path_for
+templates = create_templates(cache_dir=settings.template_cache_dir)
+templates.env.globals["url_for"] = url_for
+
+# Rendered HTMX fragments, keyed by dataset version and query
+fragment_cache = FragmentCache(max_entries=settings.fragment_cache_size)
+
+# Encoded exports on disk, shared by the workers on the host
+export_cache = ExportCache(
+    settings.export_cache_dir or DEFAULT_EXPORT_CACHE_DIR,
+    max_bytes=settings.export_cache_bytes,
+)
+
+# Clients of this worker subscribed to pushed ticker and grid updates
+broadcaster: Broadcaster[TrendQuery] = Broadcaster(
+    max_subscribers=settings.push_max_subscribers
+)
 
 # Add middleware
 app.add_middleware(
@@ -100,30 +205,105 @@ app.add_middleware(
     allow_headers=["*"],
 )
 app.add_middleware(TrustedHostMiddleware, allowed_hosts=ALLOWED_HOSTS)
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+# Static assets are compressed at build time and exports when first
+# encoded, not per request
+app.add_middleware(
+    SelectiveGZipMiddleware,
+    exclude_prefixes=("/static/", "/api/trends/export"),
+    minimum_size=1000,
+)
+# Outside compression, so shed requests cost as little as possible
+admission = AdmissionController.from_settings(settings)
+app.add_middleware(AdmissionMiddleware, controller=admission)
 
 # Setup metrics
 Instrumentator().instrument(app).expose(app)
 
 
-# Exception handlers
-@app.exception_handler(RateLimitExceeded)
-async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
-    return _rate_limit_exceeded_handler(request, exc)
-
-
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
-    start_time = time.time()
+    phases = timing.start_request()
+    start_time = time.perf_counter()
     response = await call_next(request)
-    process_time = time.time() - start_time
+    process_time = time.perf_counter() - start_time
     response.headers["X-Process-Time"] = str(process_time)
+    response.headers["Server-Timing"] = timing.server_timing(phases, process_time)
+    # The matched route's path template, so the label set stays bounded
+    route = request.scope.get("route")
+    if route is not None:
+        for name, seconds in phases:
+            metrics.REQUEST_PHASE_SECONDS.labels(route.path, name).observe(seconds)
     return response
 
 
+def get_fragment(
+    template_name: str,
+    version: str,
+    params: tuple,
+    context: Callable[[], Dict[str, Any]],
+) -> Fragment:
+    """Render a fragment once per dataset version and query parameters.
+
+    Args:
+        template_name: Template to render on a cache miss
+        version: Dataset version the fragment is rendered from
+        params: Query parameters that select the fragment's content
+        context: Builds the template context, only called on a cache miss
+    """
+    key = (version, template_name, *params)
+    fragment = fragment_cache.get(key)
+    if fragment is None:
+        metrics.FRAGMENT_CACHE_REQUESTS.labels("miss").inc()
+        with timing.phase("filter"):
+            values = context()
+        with timing.phase("render"):
+            html = templates.get_template(template_name).render(**values)
+        with timing.phase("gzip"):
+            fragment = Fragment.from_html(html)
+        fragment_cache.set(key, fragment)
+    else:
+        metrics.FRAGMENT_CACHE_REQUESTS.labels("hit").inc()
+    return fragment
+
+
+def render_fragment(
+    request: Request,
+    template_name: str,
+    version: str,
+    params: tuple,
+    context: Callable[[], Dict[str, Any]],
+) -> Response:
+    """Serve a cached fragment (see ``get_fragment``).
+
+    The gzip-compressed bytes are served with a strong ETag; requests
+    carrying a matching If-None-Match get a 304 Not Modified.
+    """
+    return fragment_response(
+        request, get_fragment(template_name, version, params, context)
+    )
+
+
+def fragment_response(request: Request, fragment: Fragment) -> Response:
+    """Serve a fragment pre-gzipped, or as a 304 if the client has it."""
+    accepts_gzip = "gzip" in request.headers.get("accept-encoding", "")
+    headers = {
+        "ETag": fragment.gzip_etag if accepts_gzip else fragment.etag,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if fragment.matches(request.headers.get("if-none-match")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if accepts_gzip:
+        # GZipMiddleware leaves responses with a Content-Encoding untouched
+        headers["Content-Encoding"] = "gzip"
+        return Response(fragment.body, media_type=fragment.media_type, headers=headers)
+    return Response(
+        fragment.decompressed(), media_type=fragment.media_type, headers=headers
+    )
+
+
 # Enhanced health check endpoint
 @app.get("/health")
-@limiter.exempt
 async def health_check():
     try:
         # Check if we can fetch data
@@ -147,82 +327,326 @@ async def health_check():
 
 @app.get("/")
 async def home(request: Request):
-    """Render the home page with initial data."""
-    trends_data = await fetch_trends()
-    filtered_data = await filter_trend_data(trends_data, "all", "US")
+    """Render the home page with its grid, filters and ticker filled in.
 
-    gainers = get_sorted_trends(filtered_data, ascending=False)
-    losers = get_sorted_trends(filtered_data, ascending=True)
+    Rendered once per dataset version, like the fragments, so a page view
+    needs no further request for its data.
+    """
+    trends_index = await fetch_trend_index()
+    version = trends_index.table.version
+    return render_fragment(
+        request, "index.html", version, (), lambda: home_context(trends_index)
+    )
 
-    return templates.TemplateResponse(
-        "index.html", {"request": request, "gainers": gainers, "losers": losers}
+
+def paginate(
+    request: Request,
+    version: str,
+    total: int,
+    limit: Optional[int],
+    cursor: Optional[str],
+) -> Tuple[int, int, Dict[str, str]]:
+    """Rows ``start:stop`` of a page and its ``X-Total-Count`` and ``Link`` headers.
+
+    Raises:
+        HTTPException: 400 for an invalid cursor, 410 for one of an older
+            dataset version
+    """
+    start = 0
+    if cursor is not None:
+        try:
+            cursor_version, start = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        if cursor_version != version:
+            raise HTTPException(
+                status_code=status.HTTP_410_GONE,
+                detail="The trends were refreshed; start again without a cursor",
+            )
+    stop = total if limit is None else min(start + limit, total)
+    headers = {"X-Total-Count": str(total)}
+    if stop < total and limit is not None:
+        next_url = request.url.include_query_params(cursor=encode_cursor(version, stop))
+        headers["Link"] = f'<{next_url}>; rel="next"'
+    return start, stop, headers
+
+
+def resolve_format(request: Request, format: Optional[str]) -> str:
+    """The requested format, else "ndjson" if the Accept header asks for it."""
+    if format is None:
+        accept = request.headers.get("accept", "")
+        format = "ndjson" if "application/x-ndjson" in accept else "json"
+    return format
+
+
+# Full-dataset JSON bodies being encoded, so concurrent misses share one
+_encoding: Dict[str, "asyncio.Task[Fragment]"] = {}
+
+
+def encode_trends_body(trends_data: TrendTable) -> Fragment:
+    """Every row as a JSON array, gzip-compressed once per dataset version."""
+    # Level 6: level 9 is several times slower on a body this size
+    return Fragment.from_bytes(
+        encode_json(trends_data), "application/json", compresslevel=6
     )
 
 
+async def get_trends_body(trends_data: TrendTable) -> Fragment:
+    """The cached full-dataset body, encoded off the event loop on a miss."""
+    key = (trends_data.version, "trends.json")
+    body = fragment_cache.get(key)
+    if body is not None:
+        metrics.FRAGMENT_CACHE_REQUESTS.labels("hit").inc()
+        return body
+    metrics.FRAGMENT_CACHE_REQUESTS.labels("miss").inc()
+    task = _encoding.get(trends_data.version)
+    if task is None:
+        task = asyncio.create_task(asyncio.to_thread(encode_trends_body, trends_data))
+        _encoding[trends_data.version] = task
+        task.add_done_callback(lambda _: _encoding.pop(trends_data.version, None))
+    with timing.phase("serialize"):
+        body = await asyncio.shield(task)
+    fragment_cache.set(key, body)
+    return body
+
+
 @app.get("/api/trends")
-async def get_trends():
-    logger.info("Fetching trends data...")
+async def get_trends(
+    request: Request,
+    fields: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=settings.api_page_max),
+    cursor: Optional[str] = None,
+    format: Optional[Literal["json", "ndjson"]] = None,
+):
+    """Get the trend rows, sorted by absolute weekly revenue change.
+
+    Without parameters the whole dataset is served from a pre-encoded,
+    pre-gzipped body cached per dataset version (with an ETag).
+
+    Args:
+        fields: Comma-separated columns to include (default: all)
+        limit: Rows per page; a ``Link: rel="next"`` header carries the
+            cursor of the next page
+        cursor: Cursor of the page to get, from a previous ``Link`` header
+        format: "ndjson" streams one object per line (also selected by
+            ``Accept: application/x-ndjson``); default "json"
+    """
     trends_data = await fetch_trends()
-    if not trends_data:
-        logger.error("No trends data returned from fetch")
-        return []
-    logger.info(f"Successfully retrieved {len(trends_data)} trend records")
-    return trends_data
-
-
-async def filter_trend_data(
-    trends_data: List[Dict[str, Any]], category: str = "all", country: str = "US"
-) -> List[Dict[str, Any]]:
-    """Filter trends data by category and country."""
-    filtered_data = trends_data
-    if category != "all":
-        filtered_data = [
-            t for t in filtered_data if t["product_category_level_1"] == category
-        ]
-    return [t for t in filtered_data if t["campaign_country"] == country]
-
-
-def get_sorted_trends(
-    trends_data: List[Dict[str, Any]], ascending: bool = True
-) -> List[Dict[str, Any]]:
-    """Sort trends by weekly revenue change."""
-
-    def filter_func(x):
-        return (
-            x["revenue_weekly_change"] < 0
-            if ascending
-            else x["revenue_weekly_change"] > 0
+    try:
+        columns = parse_fields(fields, trends_data.columns)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)
         )
-
-    return sorted(
-        [t for t in trends_data if filter_func(t)],
-        key=lambda x: x["revenue_weekly_change"],
-        reverse=not ascending,
+    start, stop, headers = paginate(
+        request, trends_data.version, len(trends_data), limit, cursor
     )
+    if resolve_format(request, format) == "ndjson":
+        # A sync iterator, so Starlette encodes each chunk in a worker thread
+        return StreamingResponse(
+            iter_ndjson(trends_data, columns, start, stop),
+            media_type="application/x-ndjson",
+            headers=headers,
+        )
+    if fields is None and limit is None and cursor is None:
+        response = fragment_response(request, await get_trends_body(trends_data))
+        response.headers.update(headers)
+        return response
+    with timing.phase("serialize"):
+        body = encode_json(trends_data, columns, start, stop)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def parse_query(
+    equals: Dict[str, List[str]], where: List[str], sort: Optional[str] = None
+) -> TrendQuery:
+    """Build a ``TrendQuery`` from request parameters.
+
+    Raises:
+        HTTPException: 422 for an invalid range filter or sort metric
+    """
+    try:
+        column, descending = parse_sort(sort)
+        ranges = [parse_range(expression) for expression in where]
+        return TrendQuery.create(equals, ranges, column, descending)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)
+        )
 
 
-@lru_cache(maxsize=100)
-def get_cached_trend_key(category: str, country: str, trend_type: str) -> str:
-    """Generate a cache key for trends filtering.
+@app.get("/api/trends/query")
+async def query_trends(
+    request: Request,
+    country: List[str] = Query([]),
+    level1: List[str] = Query([]),
+    level2: List[str] = Query([]),
+    level3: List[str] = Query([]),
+    event_date: List[str] = Query([]),
+    where: List[str] = Query([]),
+    sort: Optional[str] = None,
+    fields: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=settings.api_page_max),
+    cursor: Optional[str] = None,
+    format: Optional[Literal["json", "ndjson"]] = None,
+):
+    """Query the trend rows with multi-valued and range filters.
+
+    Repeat a dimension to match any of its values (``country=US&country=UK``);
+    rows must match every dimension given and every ``where``. Answered from
+    the bitmap index built when the data is refreshed.
 
     Args:
-        category: Product category
-        country: Country code
-        trend_type: Either 'gainers' or 'losers'
+        country: Campaign countries
+        level1: Level 1 product categories
+        level2: Level 2 product categories
+        level3: Level 3 product categories
+        event_date: Event dates
+        where: Range filters on a ``*_change`` metric or ``trend_score``,
+            e.g. ``revenue_weekly_change>0.2`` (or ``>20%``), with > >= < <= =
+        sort: Metric to sort by, ``-metric`` for descending (default: the
+            order of ``/api/trends``)
+        fields: Comma-separated columns to include (default: all)
+        limit: Rows per page, as for ``/api/trends``
+        cursor: Cursor of the page to get, from a previous ``Link`` header
+        format: "json" (default) or "ndjson", as for ``/api/trends``
+    """
+    query = parse_query(
+        {
+            "campaign_country": country,
+            "product_category_level_1": level1,
+            "product_category_level_2": level2,
+            "product_category_level_3": level3,
+            "event_date": event_date,
+        },
+        where,
+        sort,
+    )
+    trends_bitmaps = await fetch_trend_bitmaps()
+    trends_data = trends_bitmaps.table
+    try:
+        columns = parse_fields(fields, trends_data.columns)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)
+        )
+    with timing.phase("filter"):
+        rows = trends_bitmaps.rows(query)
+    start, stop, headers = paginate(
+        request, trends_data.version, len(rows), limit, cursor
+    )
+    page = trends_data.select(rows[start:stop])
+    if resolve_format(request, format) == "ndjson":
+        return StreamingResponse(
+            iter_ndjson(page, columns),
+            media_type="application/x-ndjson",
+            headers=headers,
+        )
+    with timing.phase("serialize"):
+        body = encode_json(page, columns)
+    return Response(body, media_type="application/json", headers=headers)
+
 
-    Returns:
-        Cache key string
+@app.get("/api/trends/export")
+async def export_trends(
+    request: Request,
+    country: List[str] = Query([]),
+    level1: List[str] = Query([]),
+    level2: List[str] = Query([]),
+    level3: List[str] = Query([]),
+    event_date: List[str] = Query([]),
+    where: List[str] = Query([]),
+    sort: Optional[str] = None,
+    fields: Optional[str] = None,
+    format: Literal["csv", "parquet"] = "csv",
+):
+    """Download the trend rows matching the filters as a CSV or Parquet file.
+
+    Takes the filters of ``/api/trends/query``. The file is streamed in
+    chunks straight from the cached columns while it is written to the
+    export cache, so later downloads of the same dataset version, filters
+    and format only send the file.
+
+    Args:
+        fields: Comma-separated columns to include (default: all)
+        format: "csv" (default) or "parquet"
     """
-    return f"{category}:{country}:{trend_type}"
+    query = parse_query(
+        {
+            "campaign_country": country,
+            "product_category_level_1": level1,
+            "product_category_level_2": level2,
+            "product_category_level_3": level3,
+            "event_date": event_date,
+        },
+        where,
+        sort,
+    )
+    trends_bitmaps = await fetch_trend_bitmaps()
+    trends_data = trends_bitmaps.table
+    try:
+        columns = parse_fields(fields, trends_data.columns)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)
+        )
+
+    # CSV is cached and sent gzip-compressed, unless the client cannot
+    # take it; Parquet is compressed already
+    compressed = format == "csv"
+    send_gzip = compressed and (
+        pick_encoding(request.headers.get("accept-encoding", ""), ("gzip",)) is not None
+    )
+    key = export_key(trends_data.version, query, columns, format)
+    headers = {
+        "ETag": f'"{key}-gzip"' if send_gzip else f'"{key}"',
+        "Content-Disposition": (
+            f'attachment; filename="trends-{trends_data.version[:12]}.{format}"'
+        ),
+    }
+    if compressed:
+        headers["Vary"] = "Accept-Encoding"
+    if send_gzip:
+        headers["Content-Encoding"] = "gzip"
+    media_type = EXPORT_MEDIA_TYPES[format]
+    suffix = "csv.gz" if compressed else format
+    # Either encoding is the same file, as with the fragments
+    if etag_matches(request.headers.get("if-none-match"), f'"{key}"', f'"{key}-gzip"'):
+        metrics.EXPORT_REQUESTS.labels(format, "not_modified").inc()
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    path = export_cache.get(key, suffix)
+    if path is not None:
+        metrics.EXPORT_REQUESTS.labels(format, "hit").inc()
+        if compressed and not send_gzip:
+            return StreamingResponse(
+                gunzip_chunks(read_chunks(path)), media_type=media_type, headers=headers
+            )
+        return FileResponse(path, media_type=media_type, headers=headers)
+
+    metrics.EXPORT_REQUESTS.labels(format, "miss").inc()
+    if query != TrendQuery():
+        with timing.phase("filter"):
+            trends_data = trends_data.select(trends_bitmaps.rows(query))
+    try:
+        chunks = export_chunks(trends_data, format, columns)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=str(e))
+    if compressed and (send_gzip or export_cache.enabled):
+        chunks = export_cache.store(key, suffix, gzip_chunks(chunks))
+        if not send_gzip:
+            chunks = gunzip_chunks(chunks)
+    else:
+        chunks = export_cache.store(key, suffix, chunks)
+    # A sync iterator, so Starlette encodes each chunk in a worker thread
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
 
 
 @app.get("/api/trends/gainers")
 async def get_gainers(request: Request, category: str = "all", country: str = "US"):
     """Get trending products with positive revenue change."""
-    _ = get_cached_trend_key(category, country, "gainers")  # Cache the key combination
-    trends_data = await fetch_trends()
-    filtered_data = await filter_trend_data(trends_data, category, country)
-    gainers = get_sorted_trends(filtered_data, ascending=False)
+    trends_index = await fetch_trend_index()
+    with timing.phase("filter"):
+        gainers = trends_index.gainers(category, country, limit=1)
     return templates.TemplateResponse(
         "components/cards/trend_card.html",
         {"request": request, "trend": gainers[0] if gainers else None},
@@ -232,10 +656,9 @@ async def get_gainers(request: Request, category: str = "all", country: str = "U
 @app.get("/api/trends/losers")
 async def get_losers(request: Request, category: str = "all", country: str = "US"):
     """Get trending products with negative revenue change."""
-    _ = get_cached_trend_key(category, country, "losers")  # Cache the key combination
-    trends_data = await fetch_trends()
-    filtered_data = await filter_trend_data(trends_data, category, country)
-    losers = get_sorted_trends(filtered_data, ascending=True)
+    trends_index = await fetch_trend_index()
+    with timing.phase("filter"):
+        losers = trends_index.losers(category, country, limit=1)
     return templates.TemplateResponse(
         "components/cards/trend_card.html",
         {"request": request, "trend": losers[0] if losers else None},
@@ -243,21 +666,34 @@ async def get_losers(request: Request, category: str = "all", country: str = "US
 
 
 @app.post("/api/trends/refresh")
-async def refresh_trends(force: bool = False):
+async def refresh_trends(
+    force: bool = False, mode: Optional[Literal["full", "incremental"]] = None
+):
     """
     Force refresh the trends data cache
 
+    The worker that gets the request refreshes, and announces the new
+    version so the other workers on the host follow it.
+
     Args:
-        force (bool): If True, bypass cache and fetch fresh data from BigQuery
+        force (bool): If True, bypass cache and fetch fresh data from the source
+        mode (str): "incremental" merges only rows from the latest cached
+            event_date onwards, "full" reloads everything (default:
+            REFRESH_MODE)
     """
     try:
-        if force:
+        refresh_mode = mode or settings.refresh_mode
+        if force and refresh_mode == "full":
             cache.clear()
-        trends_data = await fetch_trends(force_refresh=force)
+        trends_data = await coordinator.refresh(
+            "manual", force=force, incremental=refresh_mode == "incremental"
+        )
         return {
             "message": "Cache refreshed successfully",
             "force_refresh": force,
+            "mode": refresh_mode,
             "records_count": len(trends_data),
+            "version": trends_data.version,
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -267,48 +703,389 @@ async def refresh_trends(force: bool = False):
 async def get_categories(request: Request):
     """Get unique categories from trends data."""
     trends_data = await fetch_trends()
-    categories = sorted(set(t["product_category_level_1"] for t in trends_data))
-    return templates.TemplateResponse(
-        "categories.html", {"request": request, "categories": categories}
+    return render_fragment(
+        request,
+        "categories.html",
+        trends_data.version,
+        (),
+        lambda: {"categories": trends_data.distinct("product_category_level_1")},
     )
 
 
-@app.get("/api/trends/filter")
-async def filter_trends(request: Request, category: str = "all", country: str = "US"):
-    """Filter trends by category and country."""
-    trends_data = await fetch_trends()
-    filtered_data = await filter_trend_data(trends_data, category, country)
+def filter_query(
+    category: List[str] = Query([ALL_CATEGORIES]),
+    country: List[str] = Query(["US"]),
+    level2: List[str] = Query([]),
+    level3: List[str] = Query([]),
+    where: List[str] = Query([]),
+) -> TrendQuery:
+    """The grid filter selected by the filter and stream endpoints' parameters.
 
-    gainers = get_sorted_trends(filtered_data, ascending=False)
-    losers = get_sorted_trends(filtered_data, ascending=True)
+    Args:
+        category: Level 1 categories, or "all"
+        country: Campaign countries, or "all"
+        level2: Level 2 categories (default: all)
+        level3: Level 3 categories (default: all)
+        where: Range filters, as for ``/api/trends/query``
+    """
+    return parse_query(
+        {
+            "product_category_level_1": category,
+            "campaign_country": country,
+            "product_category_level_2": level2,
+            "product_category_level_3": level3,
+        },
+        where,
+    )
 
-    return templates.TemplateResponse(
+
+def filter_params(query: TrendQuery) -> List[Tuple[str, str]]:
+    """Parameters that select ``query`` on the filter and stream endpoints."""
+    params = []
+    for name, column in (
+        ("category", "product_category_level_1"),
+        ("country", "campaign_country"),
+    ):
+        params += [(name, value) for value in query.values(column) or (ALL_CATEGORIES,)]
+    for name, column in (
+        ("level2", "product_category_level_2"),
+        ("level3", "product_category_level_3"),
+    ):
+        params += [(name, value) for value in query.values(column)]
+    params += [("where", str(predicate)) for predicate in query.ranges]
+    return params
+
+
+def grid_context(trends_index: PartitionIndex, query: TrendQuery) -> Dict[str, Any]:
+    """Gainers and losers of a grid filter.
+
+    A single category and country is looked up in the partition index;
+    anything else is answered by the bitmap index.
+    """
+    pair = query.partition()
+    if pair is not None:
+        return {
+            "gainers": trends_index.gainers(*pair),
+            "losers": trends_index.losers(*pair),
+        }
+    trends_bitmaps = trend_bitmaps(trends_index.table)
+    return {
+        "gainers": trends_bitmaps.ranked(query, ascending=False),
+        "losers": trends_bitmaps.ranked(query, ascending=True),
+    }
+
+
+def grid_fragment(trends_index: PartitionIndex, query: TrendQuery) -> Fragment:
+    """The gainers and losers grid for one filter."""
+    return get_fragment(
         "layouts/trends_grid.html",
-        {"request": request, "gainers": gainers, "losers": losers},
+        trends_index.table.version,
+        (query,),
+        lambda: grid_context(trends_index, query),
     )
 
 
+def ticker_context(trends_top: TopK) -> Dict[str, Any]:
+    """The top five gainers and losers for the ticker."""
+    # Top 5 gainers and top 5 losers
+    gainers, losers = trends_top.top("revenue_weekly_change", 5)
+
+    # Combine and shuffle to mix gainers and losers
+    return {"trends": gainers + losers}
+
+
+def ticker_fragment(trends_top: TopK) -> Fragment:
+    """The ticker, rendered once per dataset version."""
+    return get_fragment(
+        "ticker.html", trends_top.table.version, (), lambda: ticker_context(trends_top)
+    )
+
+
+def stream_context(query: TrendQuery, version: str) -> Dict[str, Any]:
+    """What a grid response needs to subscribe the push stream to ``query``."""
+    return {
+        "push_enabled": settings.push_enabled,
+        "stream_params": urlencode(filter_params(query), quote_via=quote),
+        "version": version,
+    }
+
+
+async def publish_trends() -> None:
+    """Push the ticker and each subscribed grid once per new dataset version.
+
+    Runs on an interval in every worker. Fetching also keeps the cache
+    refreshing while clients only listen to the stream.
+    """
+    try:
+        trends_index = await fetch_trend_index()
+        version = trends_index.table.version
+        if version == broadcaster.version:
+            return
+        broadcaster.version = version
+        if not len(broadcaster):
+            return
+
+        trends_top = await fetch_trend_top()
+        ticker = ticker_fragment(trends_top).decompressed().decode("utf-8")
+        sent = broadcaster.broadcast("ticker", ticker, version)
+        for query in broadcaster.scopes():
+            grid = grid_fragment(trends_index, query)
+            broadcaster.broadcast(
+                "grid", grid.decompressed().decode("utf-8"), version, scope=query
+            )
+        logger.info(f"Pushed dataset version {version} to {sent} subscribers")
+    except Exception as e:
+        logger.error(f"Error publishing trends: {str(e)}", exc_info=True)
+
+
+@app.get("/api/trends/filter")
+async def filter_trends(request: Request, query: TrendQuery = Depends(filter_query)):
+    """Filter trends by categories, countries and metric ranges.
+
+    Repeat ``category``, ``country``, ``level2`` or ``level3`` to match any
+    of several values, and add ``where`` range filters (see
+    ``filter_query``).
+    """
+    trends_index = await fetch_trend_index()
+    version = trends_index.table.version
+    return render_fragment(
+        request,
+        "trends_filter.html",
+        version,
+        (query,),
+        lambda: {
+            **grid_context(trends_index, query),
+            **stream_context(query, version),
+        },
+    )
+
+
+def home_context(trends_index: PartitionIndex) -> Dict[str, Any]:
+    """Context of the home page's default grid, filters and ticker."""
+    trends_data = trends_index.table
+    query = TrendQuery.create({"campaign_country": ["US"]})
+    return {
+        **grid_context(trends_index, query),
+        **stream_context(query, trends_data.version),
+        **ticker_context(trend_top(trends_data)),
+        "categories": trends_data.distinct("product_category_level_1"),
+        "countries": trends_data.distinct("campaign_country"),
+    }
+
+
 @app.get("/api/trends/ticker")
 async def get_ticker_updates(request: Request):
-    trends_data = await fetch_trends()
+    trends_top = await fetch_trend_top()
+    return fragment_response(request, ticker_fragment(trends_top))
 
-    # Split into gainers and losers
-    gainers = sorted(
-        [t for t in trends_data if t["revenue_weekly_change"] > 0],
-        key=lambda x: x["revenue_weekly_change"],
-        reverse=True,
-    )[:5]  # Top 5 gainers
 
-    losers = sorted(
-        [t for t in trends_data if t["revenue_weekly_change"] < 0],
-        key=lambda x: x["revenue_weekly_change"],
-    )[:5]  # Top 5 losers
+@app.get("/api/trends/top")
+async def get_top_trends(
+    metric: str = "revenue_weekly_change",
+    k: int = Query(5, ge=1, le=settings.top_k_max),
+    country: Optional[str] = None,
+    category: Optional[str] = None,
+):
+    """Get the k largest gains and losses of a change metric or the score.
 
-    # Combine and shuffle to mix gainers and losers
-    significant_trends = gainers + losers
+    Args:
+        metric: One of the six ``*_change`` columns or ``trend_score``
+        k: Rows to return on each side
+        country: Only rows for this campaign country (default: all)
+        category: Only rows in this level 1 category (default: all)
+    """
+    rankable = METRIC_COLUMNS + (SCORE_COLUMN,)
+    if metric not in rankable:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"metric must be one of: {', '.join(rankable)}",
+        )
+    trends_top = await fetch_trend_top()
+    if metric in trends_top.table.metrics:
+        with timing.phase("filter"):
+            gainers, losers = trends_top.top(
+                metric, k, country=country, category=category
+            )
+    else:
+        # Nothing was loaded, so nothing was scored either
+        gainers, losers = [], []
+    return {
+        "metric": metric,
+        "k": k,
+        "country": country,
+        "category": category,
+        "version": trends_top.table.version,
+        "gainers": [dict(row) for row in gainers],
+        "losers": [dict(row) for row in losers],
+    }
 
-    return templates.TemplateResponse(
-        "ticker.html", {"request": request, "trends": significant_trends}
+
+@app.get("/api/trends/cube")
+async def get_trend_cube(
+    country: str = ALL_CATEGORIES,
+    level1: str = ALL_CATEGORIES,
+    level2: str = ALL_CATEGORIES,
+    level3: str = ALL_CATEGORIES,
+):
+    """Get the mean changes of a country and category node and its children.
+
+    Any level can be "all" to roll it up, as long as the levels below it
+    are rolled up too. Children are one category level down, best ranked
+    first; every node is precomputed at refresh time.
+
+    Args:
+        country: Campaign country, or "all" for every country
+        level1: Level 1 product category, or "all"
+        level2: Level 2 product category, or "all"
+        level3: Level 3 product category, or "all"
+    """
+    levels = [level1, level2, level3]
+    if any(
+        upper == ALL_CATEGORIES and lower != ALL_CATEGORIES
+        for upper, lower in zip(levels, levels[1:])
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="A category level can only be set if the levels above it are",
+        )
+    trends_cube = await fetch_trend_cube()
+    try:
+        with timing.phase("filter"):
+            node, children = trends_cube.drill_down((country, level1, level2, level3))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="No trends under this node")
+    return {
+        "event_date": trends_cube.event_date,
+        "ranked_by": trends_cube.rank_metric,
+        "node": node,
+        "children": children,
+    }
+
+
+@app.get("/api/trends/history")
+async def get_trend_history(
+    request: Request,
+    country: str,
+    level1: str,
+    level2: str,
+    level3: str,
+    metric: str = "revenue_weekly_change",
+    days: int = Query(30, ge=1, le=settings.history_retention_days),
+    points: int = Query(30, ge=2, le=365),
+    format: Literal["json", "svg"] = "json",
+):
+    """Get the recent daily history of one category's change metric.
+
+    The series is downsampled on the server to at most ``points`` bucket
+    averages, so a trend card can chart it without any further queries.
+
+    Args:
+        country: Campaign country
+        level1: Level 1 product category
+        level2: Level 2 product category
+        level3: Level 3 product category
+        metric: One of the six ``*_change`` columns
+        days: Days of history up to the latest recorded day
+        points: Most values to return
+        format: "json" for the values or "svg" for a sparkline image
+    """
+    if metric not in METRIC_COLUMNS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"metric must be one of: {', '.join(METRIC_COLUMNS)}",
+        )
+    # Records the current dataset version if it has not been yet
+    await fetch_trends()
+    try:
+        dates, values = history.series((country, level1, level2, level3), metric, days)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="No history for this category")
+    ends, means = downsample(values, points)
+
+    if format == "svg":
+        present = means[~np.isnan(means)]
+        return templates.TemplateResponse(
+            "components/charts/sparkline.svg",
+            {
+                "request": request,
+                "width": 120,
+                "height": 32,
+                "title": f"{level3} {metric} over {days} days",
+                "path": sparkline_path(means, 120, 32),
+                "trend": float(present[-1]) if len(present) else 0.0,
+            },
+            media_type="image/svg+xml",
+            headers={"Cache-Control": "max-age=300"},
+        )
+    return {
+        "country": country,
+        "level1": level1,
+        "level2": level2,
+        "level3": level3,
+        "metric": metric,
+        "dates": [dates[end].isoformat() for end in ends.tolist()],
+        # Stored as float32, so more digits would only be noise
+        "values": [None if np.isnan(v) else float(f"{v:.7g}") for v in means.tolist()],
+    }
+
+
+@app.get("/api/trends/stream")
+async def stream_trends(
+    request: Request,
+    query: TrendQuery = Depends(filter_query),
+    version: str = "",
+):
+    """Stream ticker and grid fragments as server-sent events.
+
+    An event is sent once per new dataset version. Clients that connect
+    with an older version (the ``version`` the page was rendered from, or
+    Last-Event-ID on reconnect) get the current fragments straight away.
+    """
+    if not settings.push_enabled:
+        raise HTTPException(status_code=404, detail="Push updates are disabled")
+    try:
+        subscriber = broadcaster.subscribe(query)
+    except BroadcasterFull:
+        # The page keeps polling while it has no stream
+        return Response(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": str(int(settings.push_check_seconds))},
+        )
+
+    try:
+        trends_index = await fetch_trend_index()
+        trends_top = await fetch_trend_top()
+    except BaseException:
+        broadcaster.unsubscribe(subscriber)
+        raise
+    current = trends_index.table.version
+    if (request.headers.get("last-event-id") or version) != current:
+        ticker = ticker_fragment(trends_top)
+        grid = grid_fragment(trends_index, query)
+        for name, fragment in (("ticker", ticker), ("grid", grid)):
+            html = fragment.decompressed().decode("utf-8")
+            subscriber.offer(name, encode_event(name, html, event_id=current))
+
+    async def events() -> AsyncIterator[bytes]:
+        try:
+            # Ask browsers to wait a while before reconnecting after a drop
+            yield f"retry: {int(settings.push_check_seconds * 1000)}\n\n".encode()
+            while True:
+                messages = await subscriber.next(settings.push_heartbeat_seconds)
+                # Comment lines keep proxies from timing out an idle stream
+                yield b"".join(messages) or b": keep-alive\n\n"
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Tells GZipMiddleware and nginx not to buffer the stream
+            "Content-Encoding": "identity",
+            "X-Accel-Buffering": "no",
+        },
     )
 
 
@@ -316,9 +1093,12 @@ async def get_ticker_updates(request: Request):
 async def get_countries(request: Request):
     """Get unique countries from trends data."""
     trends_data = await fetch_trends()
-    countries = sorted(set(t["campaign_country"] for t in trends_data))
-    return templates.TemplateResponse(
-        "countries.html", {"request": request, "countries": countries}
+    return render_fragment(
+        request,
+        "countries.html",
+        trends_data.version,
+        (),
+        lambda: {"countries": trends_data.distinct("campaign_country")},
     )
 
 
@@ -0,0 +1,136 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Sub-millisecond lookups up to minute-long warehouse reads
+PHASE_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)  # fmt: skip
+
+# Exposed on /metrics alongside the instrumentator's HTTP metrics
+CACHE_REQUESTS = Counter(
+    "trend_cache_requests_total",
+    "Trend data lookups by outcome: hit, stale or miss",
+    ["result"],
+)
+CACHE_AGE = Gauge(
+    "trend_cache_age_seconds",
+    "Seconds since the cached trend data was loaded",
+)
+CACHE_RECORDS = Gauge(
+    "trend_cache_records",
+    "Rows in the cached trend data",
+)
+FRAGMENT_CACHE_REQUESTS = Counter(
+    "trend_fragment_cache_requests_total",
+    "Rendered fragment lookups by outcome: hit or miss",
+    ["result"],
+)
+INGEST_SHARDS = Counter(
+    "trend_ingest_shards_total",
+    "Shards of a sharded source by outcome of a load: parsed, unchanged "
+    "(skipped) or failed",
+    ["result"],
+)
+REFRESH_PHASE_SECONDS = Histogram(
+    "trend_refresh_phase_seconds",
+    "Time spent in each phase of loading and caching the trends",
+    ["phase"],
+    buckets=PHASE_BUCKETS,
+)
+REQUEST_PHASE_SECONDS = Histogram(
+    "trend_request_phase_seconds",
+    "Time spent in each phase of handling a request, per endpoint",
+    ["endpoint", "phase"],
+    buckets=PHASE_BUCKETS,
+)
+STARTUP_SECONDS = Gauge(
+    "trend_startup_seconds",
+    "Seconds this worker took at boot until it could serve trends",
+    ["start"],
+)
+STALE_SERVES = Counter(
+    "trend_cache_stale_serves_total",
+    "Requests answered with expired trend data while a refresh ran",
+)
+REFRESHES_COALESCED = Counter(
+    "trend_cache_refreshes_coalesced_total",
+    "Refresh requests that joined a refresh already in flight",
+)
+REFRESH_FAILURES = Counter(
+    "trend_cache_refresh_failures_total",
+    "Background trend refreshes that raised an error",
+)
+REFRESH_SECONDS = Histogram(
+    "trend_refresh_seconds",
+    "Duration of coordinated refreshes by trigger (scheduled or manual) and "
+    "result (success or failure)",
+    ["trigger", "result"],
+    buckets=PHASE_BUCKETS,
+)
+REFRESH_RETRIES = Counter(
+    "trend_refresh_retries_total",
+    "Failed refresh attempts retried after a backoff, by trigger",
+    ["trigger"],
+)
+REFRESH_LEADER = Gauge(
+    "trend_refresh_leader",
+    "1 if this worker is the one running scheduled refreshes",
+)
+REFRESH_LAST_SUCCESS = Gauge(
+    "trend_refresh_last_success_timestamp_seconds",
+    "When this worker last refreshed to, or followed, a new dataset version",
+)
+REFRESH_VERSION = Gauge(
+    "trend_refresh_version_info",
+    "Dataset version this worker last refreshed to or followed (always 1)",
+    ["version"],
+)
+
+ADMISSION_IN_FLIGHT = Gauge(
+    "trend_admission_in_flight",
+    "Requests holding an admission slot, per endpoint class",
+    ["lane"],
+)
+ADMISSION_WAITING = Gauge(
+    "trend_admission_waiting",
+    "Requests waiting for an admission slot, per endpoint class",
+    ["lane"],
+)
+ADMISSION_QUEUED_TOTAL = Counter(
+    "trend_admission_queued_total",
+    "Requests that had to wait for an admission slot, per endpoint class",
+    ["lane"],
+)
+ADMISSION_SHED = Counter(
+    "trend_admission_shed_total",
+    "Requests rejected by admission control, by endpoint class and reason: "
+    "rate_limited (429), queue_full or queue_timeout (503)",
+    ["lane", "reason"],
+)
+
+EXPORT_REQUESTS = Counter(
+    "trend_export_requests_total",
+    "Trend exports by format and outcome: hit (sent from the export cache), "
+    "miss (encoded while streaming) or not_modified (304)",
+    ["format", "result"],
+)
+
+STATIC_RESPONSES = Counter(
+    "trend_static_responses_total",
+    "Static asset responses by content encoding and where the body came "
+    "from: memory, disk or not_modified (304)",
+    ["encoding", "source"],
+)
+
+PUSH_SUBSCRIBERS = Gauge(
+    "trend_push_subscribers",
+    "Clients connected to the trend update stream in this worker",
+)
+PUSH_EVENTS = Counter(
+    "trend_push_events_total",
+    "Server-sent events queued for delivery to subscribers",
+)
+PUSH_SUPERSEDED = Counter(
+    "trend_push_superseded_total",
+    "Undelivered events replaced by a newer one for a slow subscriber",
+)
@@ -0,0 +1,120 @@
+from typing import Dict, Generic, Hashable, List, Optional, Set, TypeVar
+import asyncio
+import logging
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+# What subscribers are grouped by, e.g. the grid filter they are showing
+Scope = TypeVar("Scope", bound=Hashable)
+
+
+class BroadcasterFull(Exception):
+    """Raised when a worker already has its maximum number of subscribers."""
+
+
+def encode_event(name: str, data: str, event_id: Optional[str] = None) -> bytes:
+    """Encode one server-sent event."""
+    lines = [f"event: {name}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.extend(f"data: {line}" for line in data.splitlines() or [""])
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+class Subscriber(Generic[Scope]):
+    """A connected client with at most one pending message per event name.
+
+    A newer message replaces an undelivered one of the same name, so a slow
+    client skips straight to the latest version instead of queueing every
+    update in between.
+    """
+
+    def __init__(self, scope: Scope):
+        self.scope = scope
+        self._pending: Dict[str, bytes] = {}
+        self._ready = asyncio.Event()
+
+    def offer(self, name: str, message: bytes) -> None:
+        """Queue a message, replacing any undelivered one with the same name."""
+        if name in self._pending:
+            metrics.PUSH_SUPERSEDED.inc()
+        self._pending[name] = message
+        self._ready.set()
+
+    async def next(self, timeout: float) -> List[bytes]:
+        """Wait up to ``timeout`` seconds and take every pending message."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        messages = list(self._pending.values())
+        self._pending.clear()
+        self._ready.clear()
+        return messages
+
+
+class Broadcaster(Generic[Scope]):
+    """Fans dataset updates out to the subscribers connected to this worker.
+
+    Subscribers are grouped by scope (the grid filter they are showing), so
+    a scoped event is encoded once and handed to every subscriber in the
+    scope without rendering or encoding it again per connection.
+    """
+
+    def __init__(self, max_subscribers: int = 1000):
+        self.max_subscribers = max_subscribers
+        self.version: Optional[str] = None
+        self._scopes: Dict[Scope, Set[Subscriber[Scope]]] = {}
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def scopes(self) -> List[Scope]:
+        """Scopes with at least one subscriber."""
+        return list(self._scopes)
+
+    def subscribe(self, scope: Scope) -> Subscriber[Scope]:
+        """Register a new subscriber.
+
+        Raises:
+            BroadcasterFull: If ``max_subscribers`` are already connected
+        """
+        if self._count >= self.max_subscribers:
+            raise BroadcasterFull(f"{self._count} subscribers already connected")
+        subscriber = Subscriber(scope)
+        self._scopes.setdefault(scope, set()).add(subscriber)
+        self._count += 1
+        metrics.PUSH_SUBSCRIBERS.inc()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber[Scope]) -> None:
+        """Remove a subscriber, e.g. once its client disconnected."""
+        members = self._scopes.get(subscriber.scope)
+        if members is None or subscriber not in members:
+            return
+        members.discard(subscriber)
+        if not members:
+            del self._scopes[subscriber.scope]
+        self._count -= 1
+        metrics.PUSH_SUBSCRIBERS.dec()
+
+    def broadcast(
+        self, name: str, data: str, version: str, scope: Optional[Scope] = None
+    ) -> int:
+        """Send an event to every subscriber, or only those in ``scope``.
+
+        Returns:
+            The number of subscribers the event was queued for
+        """
+        message = encode_event(name, data, event_id=version)
+        if scope is None:
+            targets = [s for members in self._scopes.values() for s in members]
+        else:
+            targets = list(self._scopes.get(scope, ()))
+        for subscriber in targets:
+            subscriber.offer(name, message)
+        metrics.PUSH_EVENTS.inc(len(targets))
+        return len(targets)
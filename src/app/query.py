@@ -0,0 +1,267 @@
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+import operator
+import re
+
+import numpy as np
+
+from app.index import ALL_CATEGORIES, RANK_METRIC
+from app.scoring import SCORE_COLUMN
+from app.store import DIMENSION_COLUMNS, METRIC_COLUMNS, TrendRow, TrendTable
+
+# Columns a range filter or sort can use; the score only once it is computed
+QUERY_METRICS: Tuple[str, ...] = METRIC_COLUMNS + (SCORE_COLUMN,)
+
+# Values on more than 1/32 of the rows are stored as bitmaps (n / 8 bytes),
+# the rest as row number arrays (4 bytes a row), whichever is smaller
+DENSE_FRACTION = 32
+
+COMPARISONS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "=": operator.eq,
+}
+_RANGE = re.compile(r"^\s*(\w+)\s*(>=|<=|>|<|=)\s*([-+0-9.eE]+)(%?)\s*$")
+
+
+@dataclass(frozen=True, order=True)
+class Range:
+    """Numeric predicate on a metric column, e.g. ``revenue_weekly_change > 0.2``."""
+
+    column: str
+    op: str
+    value: float
+
+    def __str__(self) -> str:
+        return f"{self.column}{self.op}{self.value!r}"
+
+
+def parse_range(expression: str) -> Range:
+    """Parse ``<metric><op><number>``, ``op`` one of > >= < <= =.
+
+    A trailing ``%`` divides the number by 100, as the changes are stored
+    as fractions: ``revenue_weekly_change>20%`` is ``>0.2``.
+
+    Raises:
+        ValueError: If the expression or its metric is not valid
+    """
+    match = _RANGE.match(expression)
+    if match is None:
+        raise ValueError(
+            f"Invalid filter: {expression}; expected e.g. revenue_weekly_change>0.2"
+        )
+    column, op, number, percent = match.groups()
+    if column not in QUERY_METRICS:
+        raise ValueError(
+            f"Unknown metric: {column}; choose from {', '.join(QUERY_METRICS)}"
+        )
+    try:
+        value = float(number)
+    except ValueError:
+        raise ValueError(f"Invalid number in filter: {expression}") from None
+    return Range(column, op, value / 100 if percent else value)
+
+
+def parse_sort(sort: Optional[str]) -> Tuple[Optional[str], bool]:
+    """Metric and direction of a ``sort`` parameter: ``metric`` or ``-metric``.
+
+    Raises:
+        ValueError: If the metric is not sortable
+    """
+    if not sort:
+        return None, False
+    descending = sort.startswith("-")
+    column = sort.lstrip("-+")
+    if column not in QUERY_METRICS:
+        raise ValueError(
+            f"Unknown sort metric: {column}; choose from {', '.join(QUERY_METRICS)}"
+        )
+    return column, descending
+
+
+@dataclass(frozen=True)
+class TrendQuery:
+    """Filters and ordering of an ad-hoc trend query.
+
+    A dimension matches any of its listed values, and a row must match every
+    listed dimension and every range. Hashable, and equal for equivalent
+    queries, so it can key fragment caches and push subscriptions.
+    """
+
+    equals: Tuple[Tuple[str, Tuple[str, ...]], ...] = ()
+    ranges: Tuple[Range, ...] = ()
+    sort: Optional[str] = None
+    descending: bool = False
+
+    @classmethod
+    def create(
+        cls,
+        equals: Optional[Mapping[str, Sequence[str]]] = None,
+        ranges: Sequence[Range] = (),
+        sort: Optional[str] = None,
+        descending: bool = False,
+    ) -> "TrendQuery":
+        """Build a query in canonical form.
+
+        "all" in a dimension's values lifts that filter, as do empty lists.
+
+        Raises:
+            ValueError: If a column is not a dimension
+        """
+        selected = []
+        for column, values in (equals or {}).items():
+            if column not in DIMENSION_COLUMNS:
+                raise ValueError(f"Unknown dimension: {column}")
+            if values and ALL_CATEGORIES not in values:
+                selected.append((column, tuple(sorted(set(values)))))
+        return cls(
+            equals=tuple(sorted(selected)),
+            ranges=tuple(sorted(set(ranges))),
+            sort=sort,
+            descending=descending,
+        )
+
+    def values(self, column: str) -> Tuple[str, ...]:
+        """Values ``column`` is restricted to, empty if it is not filtered."""
+        return dict(self.equals).get(column, ())
+
+    def partition(self) -> Optional[Tuple[str, str]]:
+        """(category or "all", country) if a ``PartitionIndex`` can answer this.
+
+        That is, at most one level 1 category, exactly one country and no
+        other filters.
+        """
+        filtered = dict(self.equals)
+        categories = filtered.pop("product_category_level_1", (ALL_CATEGORIES,))
+        countries = filtered.pop("campaign_country", ())
+        if filtered or self.ranges or len(categories) != 1 or len(countries) != 1:
+            return None
+        return categories[0], countries[0]
+
+
+class BitmapIndex:
+    """Per-value row sets of every dimension column, built once per refresh.
+
+    Frequent values are kept as packed bitmaps and rare ones as sorted row
+    numbers, so memory stays within a few bytes per row and column. A query
+    ORs the sets of each dimension's values, ANDs the dimensions and the
+    vectorized range comparisons together, and only then looks at rows.
+    """
+
+    def __init__(
+        self,
+        table: TrendTable,
+        bitmaps: Dict[str, Dict[int, np.ndarray]],
+        row_lists: Dict[str, Dict[int, np.ndarray]],
+    ):
+        self.table = table
+        self.bitmaps = bitmaps
+        self.row_lists = row_lists
+
+    @classmethod
+    def build(
+        cls, table: TrendTable, columns: Sequence[str] = DIMENSION_COLUMNS
+    ) -> "BitmapIndex":
+        """Group the rows of each column by value with one stable sort."""
+        length = len(table)
+        bitmaps: Dict[str, Dict[int, np.ndarray]] = {}
+        row_lists: Dict[str, Dict[int, np.ndarray]] = {}
+        for column in columns:
+            codes = table.dimensions[column].codes
+            cardinality = len(table.dimensions[column].values)
+            if cardinality <= np.iinfo(np.int16).max:
+                # numpy sorts 16-bit integers stably with a radix sort
+                codes = codes.astype(np.int16)
+            order = np.argsort(codes, kind="stable").astype(np.int32)
+            counts = np.bincount(codes, minlength=cardinality)
+            bitmaps[column], row_lists[column] = {}, {}
+            for code, rows in enumerate(np.split(order, np.cumsum(counts)[:-1])):
+                if not len(rows):
+                    continue
+                if len(rows) * DENSE_FRACTION > length:
+                    bitmaps[column][code] = _pack(rows, length)
+                else:
+                    row_lists[column][code] = rows
+        return cls(table, bitmaps, row_lists)
+
+    def bitmap(self, column: str, value: str) -> np.ndarray:
+        """Packed bitmap of the rows where ``column`` equals ``value``."""
+        code = self.table.dimensions[column].code_of(value)
+        bitmap = self.bitmaps[column].get(code)
+        if bitmap is not None:
+            return bitmap
+        rows = self.row_lists[column].get(code, np.empty(0, dtype=np.int32))
+        return _pack(rows, len(self.table))
+
+    def match(self, query: TrendQuery) -> np.ndarray:
+        """Packed bitmap of the rows matching every filter of ``query``."""
+        length = len(self.table)
+        result: Optional[np.ndarray] = None
+        for column, values in query.equals:
+            selected = self.bitmap(column, values[0])
+            for value in values[1:]:
+                selected = selected | self.bitmap(column, value)
+            result = selected if result is None else result & selected
+        for predicate in query.ranges:
+            metric = self.table.metrics.get(predicate.column)
+            if metric is None:
+                matched = np.zeros(length, dtype=bool)
+            else:
+                matched = COMPARISONS[predicate.op](metric, predicate.value)
+            packed = np.packbits(matched)
+            result = packed if result is None else result & packed
+        if result is None:
+            return np.packbits(np.ones(length, dtype=bool))
+        return result
+
+    def rows(self, query: TrendQuery, where: Optional[np.ndarray] = None) -> np.ndarray:
+        """Row indices matching ``query``, in its sort order.
+
+        Without a sort, rows keep the table's order. ``where`` is an extra
+        boolean mask the rows must be set in.
+        """
+        matched = np.unpackbits(self.match(query), count=len(self.table)).view(bool)
+        if where is not None:
+            matched &= where
+        rows = np.flatnonzero(matched)
+        if query.sort is None:
+            return rows
+        values = self.table.metrics.get(query.sort)
+        if values is None:
+            return rows
+        picked = values[rows]
+        order = np.argsort(-picked if query.descending else picked, kind="stable")
+        return rows[order]
+
+    def count(self, query: TrendQuery) -> int:
+        """Number of rows matching ``query``."""
+        return int(np.unpackbits(self.match(query), count=len(self.table)).sum())
+
+    def ranked(
+        self, query: TrendQuery, ascending: bool, metric: Optional[str] = None
+    ) -> List[TrendRow]:
+        """Losers (ascending) or gainers matching ``query``, like ``PartitionIndex``.
+
+        Ranks by ``trend_score`` when the table has been scored, otherwise
+        by the raw weekly revenue change.
+        """
+        if metric is None:
+            metric = SCORE_COLUMN if SCORE_COLUMN in self.table.metrics else RANK_METRIC
+        values = self.table.metric(metric)
+        ranked = TrendQuery(
+            equals=query.equals,
+            ranges=query.ranges,
+            sort=metric,
+            descending=not ascending,
+        )
+        return self.table.rows(
+            self.rows(ranked, where=values < 0 if ascending else values > 0)
+        )
+
+
+def _pack(rows: np.ndarray, length: int) -> np.ndarray:
+    selected = np.zeros(length, dtype=bool)
+    selected[rows] = True
+    return np.packbits(selected)
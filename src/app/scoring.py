@@ -0,0 +1,83 @@
+from dataclasses import dataclass
+from typing import Any, FrozenSet, Tuple
+import numpy as np
+
+from app.store import TrendTable
+
+# Metric column added to scored tables
+SCORE_COLUMN = "trend_score"
+
+# Category levels checked against the excluded categories
+CATEGORY_COLUMNS: Tuple[str, ...] = (
+    "product_category_level_1",
+    "product_category_level_2",
+    "product_category_level_3",
+)
+
+
+@dataclass(frozen=True)
+class ScoringRules:
+    """Weights, clamps and exclusions used to score trends."""
+
+    daily_weight: float = 0.1
+    weekly_weight: float = 0.9
+    max_daily_change: float = 300.0
+    max_weekly_change: float = 300.0
+    min_weekly_change: float = 0.01
+    excluded_categories: FrozenSet[str] = frozenset()
+
+    @classmethod
+    def from_settings(cls, settings: Any) -> "ScoringRules":
+        """Read the rules from the application settings."""
+        return cls(
+            daily_weight=settings.daily_change_weight,
+            weekly_weight=settings.weekly_change_weight,
+            max_daily_change=settings.max_daily_change,
+            max_weekly_change=settings.max_weekly_change,
+            min_weekly_change=settings.min_weekly_change,
+            excluded_categories=frozenset(
+                category.casefold() for category in settings.excluded_categories
+            ),
+        )
+
+
+def excluded_rows(table: TrendTable, categories: FrozenSet[str]) -> np.ndarray:
+    """Boolean mask of rows with an excluded category at any level."""
+    excluded = np.zeros(len(table), dtype=bool)
+    if not categories:
+        return excluded
+    for name in CATEGORY_COLUMNS:
+        column = table.dimensions[name]
+        matches = np.array(
+            [value.casefold() in categories for value in column.values], dtype=bool
+        )
+        if matches.any():
+            excluded |= matches[column.codes]
+    return excluded
+
+
+def score_trends(table: TrendTable, rules: ScoringRules) -> TrendTable:
+    """Drop excluded categories and add a weighted ``trend_score`` column.
+
+    The score is the weighted sum of the daily and weekly revenue changes,
+    each clamped to its maximum magnitude first so a single outlier cannot
+    dominate the ranking. Rows whose weekly change is smaller than
+    ``min_weekly_change`` score 0, so they are neither gainers nor losers.
+    Scoring is row by row, so a delta can be scored on its own before it
+    is merged.
+    """
+    daily = table.metric("revenue_daily_change")
+    weekly = table.metric("revenue_weekly_change")
+    score = rules.daily_weight * np.clip(
+        daily, -rules.max_daily_change, rules.max_daily_change
+    )
+    score += rules.weekly_weight * np.clip(
+        weekly, -rules.max_weekly_change, rules.max_weekly_change
+    )
+    score[np.abs(weekly) < rules.min_weekly_change] = 0.0
+
+    scored = TrendTable(table.dimensions, {**table.metrics, SCORE_COLUMN: score})
+    excluded = excluded_rows(table, rules.excluded_categories)
+    if excluded.any():
+        scored = scored.select(~excluded)
+    return scored
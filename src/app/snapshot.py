@@ -0,0 +1,279 @@
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import zlib
+import numpy as np
+
+from app.store import DictionaryColumn, TrendTable
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"TRNDSNAP"
+FORMAT_VERSION = 3
+# magic, format version, header length
+PREAMBLE = struct.Struct("<8sII")
+ALIGNMENT = 64
+
+
+class SnapshotError(ValueError):
+    """Raised when a snapshot file is missing, truncated or malformed."""
+
+
+@dataclass(frozen=True)
+class SnapshotInfo:
+    """Metadata stored in a snapshot header."""
+
+    version: str
+    created: datetime
+    rows: int
+    # CRC-32 of the header (without this field) and the column data
+    checksum: str = ""
+    # Fingerprint of the source the data was loaded from, if it has one
+    source: Optional[str] = None
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _layout(table: TrendTable) -> Tuple[Dict[str, Any], List[np.ndarray]]:
+    """Describe where each column lives and collect the arrays to write."""
+    columns: List[Dict[str, Any]] = []
+    arrays: List[np.ndarray] = []
+    for name, dimension in table.dimensions.items():
+        codes = np.ascontiguousarray(dimension.codes, dtype="<i4")
+        columns.append({"name": name, "kind": "dimension", "values": dimension.values})
+        arrays.append(codes)
+    for name, values in table.metrics.items():
+        columns.append({"name": name, "kind": "metric"})
+        arrays.append(np.ascontiguousarray(values, dtype="<f8"))
+    for column, array in zip(columns, arrays):
+        column["dtype"] = array.dtype.str
+        column["nbytes"] = array.nbytes
+    return {"columns": columns}, arrays
+
+
+def _checksum(header: Dict[str, Any], arrays: List[np.ndarray]) -> str:
+    # The header holds the dimension values, so a corrupt one relabels rows
+    fields = {key: value for key, value in header.items() if key != "checksum"}
+    checksum = zlib.crc32(json.dumps(fields, sort_keys=True).encode("utf-8"))
+    for array in arrays:
+        checksum = zlib.crc32(memoryview(array).cast("B"), checksum)
+    return f"{checksum:08x}"
+
+
+def write_snapshot(
+    table: TrendTable, path: str, source: Optional[str] = None
+) -> SnapshotInfo:
+    """Write ``table`` to ``path`` and atomically swap it into place.
+
+    The file is written next to ``path`` and renamed over it, so readers
+    either see the previous complete snapshot or the new one.
+
+    Args:
+        table: Trends to write
+        path: Snapshot file to replace
+        source: Fingerprint of the source ``table`` was loaded from
+    """
+    header, arrays = _layout(table)
+    created = datetime.now()
+    header.update(
+        version=table.version,
+        created=created.isoformat(),
+        rows=len(table),
+        # Placeholder of the checksum's length, filled in once offsets are set
+        checksum=_checksum({}, []),
+        source=source,
+    )
+
+    # Column offsets depend on the header length, which depends on the
+    # offsets, so grow the data start until the header fits before it
+    data_start = 0
+    while True:
+        offset = data_start
+        for column in header["columns"]:
+            column["offset"] = offset
+            offset = _align(offset + column["nbytes"])
+        encoded = json.dumps(header).encode("utf-8")
+        needed = _align(PREAMBLE.size + len(encoded))
+        if needed <= data_start:
+            break
+        data_start = needed
+    header["checksum"] = _checksum(header, arrays)
+    encoded = json.dumps(header).encode("utf-8")
+    info = SnapshotInfo(
+        version=table.version,
+        created=created,
+        rows=len(table),
+        checksum=header["checksum"],
+        source=source,
+    )
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "wb") as out:
+            out.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(encoded)))
+            out.write(encoded)
+            for column, array in zip(header["columns"], arrays):
+                out.seek(column["offset"])
+                out.write(memoryview(array).cast("B"))
+            out.truncate(max(offset, out.tell()))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return info
+
+
+def read_snapshot(path: str, verify: bool = False) -> Tuple[TrendTable, SnapshotInfo]:
+    """Map a snapshot file and return a table backed by it without copying.
+
+    Args:
+        path: Snapshot file to map
+        verify: Check the header and column data against the stored
+            checksum, which reads every page of the file
+
+    Raises:
+        SnapshotError: If the file is not a valid snapshot
+    """
+    with open(path, "rb") as snapshot_file:
+        size = os.fstat(snapshot_file.fileno()).st_size
+        if size < PREAMBLE.size:
+            raise SnapshotError(f"Snapshot {path} is truncated")
+        buffer = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, format_version, header_length = PREAMBLE.unpack_from(buffer, 0)
+    if magic != MAGIC or format_version != FORMAT_VERSION:
+        raise SnapshotError(f"{path} is not a version {FORMAT_VERSION} snapshot")
+    try:
+        header = json.loads(
+            buffer[PREAMBLE.size : PREAMBLE.size + header_length].decode("utf-8")
+        )
+    except (UnicodeDecodeError, ValueError) as e:
+        raise SnapshotError(f"Snapshot {path} has a corrupt header") from e
+
+    dimensions: Dict[str, DictionaryColumn] = {}
+    metrics: Dict[str, np.ndarray] = {}
+    arrays: List[np.ndarray] = []
+    try:
+        for column in header["columns"]:
+            dtype = np.dtype(column["dtype"])
+            if column["offset"] + column["nbytes"] > size:
+                raise SnapshotError(f"Snapshot {path} is truncated")
+            array = np.frombuffer(
+                buffer,
+                dtype=dtype,
+                count=column["nbytes"] // dtype.itemsize,
+                offset=min(column["offset"], size),
+            )
+            arrays.append(array)
+            if column["kind"] == "dimension":
+                dimensions[column["name"]] = DictionaryColumn(
+                    codes=array, values=tuple(column["values"])
+                )
+            else:
+                metrics[column["name"]] = array
+
+        info = SnapshotInfo(
+            version=header["version"],
+            created=datetime.fromisoformat(header["created"]),
+            rows=header["rows"],
+            checksum=header["checksum"],
+            source=header["source"],
+        )
+    except SnapshotError:
+        raise
+    except (KeyError, TypeError, ValueError) as e:
+        # Valid JSON, but not the header a snapshot is written with
+        raise SnapshotError(f"Snapshot {path} has a corrupt header: {str(e)}") from e
+    if verify and _checksum(header, arrays) != info.checksum:
+        raise SnapshotError(f"Snapshot {path} does not match its checksum")
+    return TrendTable(dimensions, metrics, version=info.version), info
+
+
+class SharedSnapshot:
+    """A snapshot file shared by every worker on the host.
+
+    One worker publishes a refreshed dataset by writing a new file and
+    renaming it over the old one. Every worker memory-maps the current
+    file, so the page cache holds a single copy of the data, and re-attaches
+    when ``poll`` sees that the file has been swapped.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # Metadata of the snapshot last attached to
+        self.info: Optional[SnapshotInfo] = None
+        self._identity: Optional[Tuple[int, int, int]] = None
+
+    def _stat(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def changed(self) -> bool:
+        """Whether the file was swapped since the last attach; only a stat."""
+        identity = self._stat()
+        return identity is not None and identity != self._identity
+
+    def poll(self, verify: bool = False) -> Optional[Tuple[TrendTable, SnapshotInfo]]:
+        """Attach to the snapshot if it changed since the last attach.
+
+        Args:
+            verify: Check the snapshot's checksum, e.g. for a file left
+                behind by a previous run
+        """
+        identity = self._stat()
+        if identity is None or identity == self._identity:
+            return None
+        try:
+            attached = read_snapshot(self.path, verify=verify)
+        except (OSError, SnapshotError) as e:
+            logger.warning(f"Ignoring unreadable snapshot {self.path}: {str(e)}")
+            return None
+        self._identity = identity
+        self.info = attached[1]
+        logger.info(
+            f"Attached snapshot {attached[1].version} with {attached[1].rows} rows"
+        )
+        return attached
+
+    def publish(
+        self, table: TrendTable, source: Optional[str] = None
+    ) -> Tuple[TrendTable, SnapshotInfo]:
+        """Write ``table`` as the new shared snapshot and attach to it.
+
+        Args:
+            table: Trends to publish
+            source: Fingerprint of the source ``table`` was loaded from
+        """
+        write_snapshot(table, self.path, source=source)
+        attached = self.poll()
+        if attached is None:
+            # Already attached, e.g. the same file was re-published
+            attached = read_snapshot(self.path)
+            self.info = attached[1]
+        return attached
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        """Hold an exclusive inter-process lock for refreshing the snapshot."""
+        with open(f"{self.path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,726 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from datetime import date
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Protocol,
+    Sequence,
+    Tuple,
+)
+import asyncio
+import glob
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from app import metrics
+from app.config import Settings
+from app.ingest import (
+    DEFAULT_MAX_ERRORS,
+    IngestError,
+    IngestResult,
+    IngestSchemaError,
+    TrendTableBuilder,
+    log_ingest,
+    read_trend_csv,
+    read_trend_rows,
+)
+from app.store import COLUMNS, DIMENSION_COLUMNS, METRIC_COLUMNS, TrendTable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CSV_PATH = os.path.join(os.path.dirname(__file__), "data", "example_data.csv")
+DEFAULT_PAGE_SIZE = 50_000
+DEFAULT_POOL_SIZE = 2
+DEFAULT_QUERY_TIMEOUT = 60.0
+
+# A page of result rows, each with its values in ``COLUMNS`` order
+Page = Sequence[Sequence[Any]]
+
+
+class SourceError(RuntimeError):
+    """Raised when a data source cannot be read."""
+
+
+class SourceTimeout(SourceError, TimeoutError):
+    """Raised when a query or a pool checkout takes longer than allowed."""
+
+
+class TrendSource(ABC):
+    """Somewhere trend rows can be loaded from."""
+
+    name = "source"
+
+    @abstractmethod
+    def load(self, max_errors: int = DEFAULT_MAX_ERRORS) -> IngestResult:
+        """Read every trend row into a table, blocking until done."""
+
+    def load_since(
+        self,
+        watermark: str,
+        max_errors: int = DEFAULT_MAX_ERRORS,
+        basis: Optional[str] = None,
+    ) -> IngestResult:
+        """Read the rows whose ``event_date`` is on or after ``watermark``.
+
+        File sources have no index to seek with, so by default the whole
+        source is read and filtered; SQL sources push the filter into the
+        query.
+
+        Args:
+            watermark: Latest ``event_date`` of the data being merged into
+            max_errors: Maximum number of rejected rows reported in detail
+            basis: Fingerprint of the source that data was loaded from, if
+                known; a source that tracks its own loads reads everything
+                when it is not the last one it loaded
+        """
+        result = self.load(max_errors)
+        table = result.table
+        return replace(
+            result,
+            table=table.select(table.dimensions["event_date"].mask_from(watermark)),
+        )
+
+    def fingerprint(self) -> Optional[str]:
+        """Cheaply identify the source's current contents, or None if unknown.
+
+        Equal fingerprints mean the source has not changed, so data loaded
+        from it is still current.
+        """
+        return None
+
+    async def fetch(self, max_errors: int = DEFAULT_MAX_ERRORS) -> IngestResult:
+        """Load in a worker thread without blocking the event loop."""
+        return await asyncio.to_thread(self.load, max_errors)
+
+    def close(self) -> None:
+        """Release any connections held by the source."""
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.name!r})"
+
+
+def file_fingerprint(*paths: str) -> Optional[str]:
+    """Size and modification time of each existing file, None if none exist."""
+    parts = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        parts.append(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}")
+    return ";".join(parts) or None
+
+
+def append_page(builder: TrendTableBuilder, page: Page, first_row: int) -> int:
+    """Append rows in ``COLUMNS`` order to a builder and return how many."""
+    if not page:
+        return 0
+    columns = list(zip(*page))
+    width = len(DIMENSION_COLUMNS)
+    dimensions = [
+        list(map(str, column))
+        if None not in column
+        else ["" if value is None else str(value) for value in column]
+        for column in columns[:width]
+    ]
+    builder.append_columns(
+        dimensions, columns[width:], range(first_row, first_row + len(page))
+    )
+    return len(page)
+
+
+class CSVSource(TrendSource):
+    """Trend CSV export on local disk."""
+
+    def __init__(self, path: str = DEFAULT_CSV_PATH):
+        self.path = self.name = path
+
+    def load(self, max_errors: int = DEFAULT_MAX_ERRORS) -> IngestResult:
+        return read_trend_csv(self.path, max_errors=max_errors)
+
+    def fingerprint(self) -> Optional[str]:
+        return file_fingerprint(self.path)
+
+
+class ParquetSource(TrendSource):
+    """Parquet file read batch by batch (requires the optional pyarrow)."""
+
+    def __init__(self, path: str, batch_size: int = DEFAULT_PAGE_SIZE):
+        self.path = self.name = path
+        self.batch_size = batch_size
+
+    def fingerprint(self) -> Optional[str]:
+        return file_fingerprint(self.path)
+
+    def load(self, max_errors: int = DEFAULT_MAX_ERRORS) -> IngestResult:
+        try:
+            import pyarrow as pa  # type: ignore
+            import pyarrow.compute as pc  # type: ignore
+            import pyarrow.parquet as pq  # type: ignore
+        except ImportError as e:
+            raise SourceError(
+                "Reading Parquet requires pyarrow: pip install 'app[parquet]'"
+            ) from e
+
+        parquet_file = pq.ParquetFile(self.path)
+        names = parquet_file.schema_arrow.names
+        missing = [column for column in COLUMNS if column not in names]
+        if missing:
+            raise IngestSchemaError(f"Missing required columns: {', '.join(missing)}")
+
+        builder = TrendTableBuilder(max_errors=max_errors)
+        first_row = 1
+        for batch in parquet_file.iter_batches(
+            batch_size=self.batch_size, columns=list(COLUMNS)
+        ):
+            if not batch.num_rows:
+                continue
+            dimensions = [
+                pc.fill_null(batch.column(name).cast(pa.string()), "").to_pylist()
+                for name in DIMENSION_COLUMNS
+            ]
+            # Nulls become NaN and are rejected like any non-finite value
+            metrics = [
+                batch.column(name).cast(pa.float64()).to_numpy(zero_copy_only=False)
+                for name in METRIC_COLUMNS
+            ]
+            builder.append_columns(
+                dimensions, metrics, range(first_row, first_row + batch.num_rows)
+            )
+            first_row += batch.num_rows
+
+        result = builder.result()
+        log_ingest(self.path, result)
+        return result
+
+
+# Shard files picked up from a directory, and how each is read
+SHARD_SUFFIXES = (".csv", ".parquet")
+
+
+def discover_shards(pattern: str) -> List[str]:
+    """Shard files in a directory (recursively) or matching a glob, sorted."""
+    if os.path.isdir(pattern):
+        paths = [
+            os.path.join(root, name)
+            for root, _, names in os.walk(pattern)
+            for name in names
+            if name.endswith(SHARD_SUFFIXES)
+        ]
+    else:
+        paths = [
+            path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path)
+        ]
+    return sorted(paths)
+
+
+def read_shard(path: str, max_errors: int = DEFAULT_MAX_ERRORS) -> IngestResult:
+    """Read one shard file, by its extension; runs in a pool process."""
+    if path.endswith(".parquet"):
+        return ParquetSource(path).load(max_errors)
+    with open(path, "r", newline="") as csvfile:
+        return read_trend_rows(csvfile, max_errors=max_errors)
+
+
+def _process_pool(workers: int) -> ProcessPoolExecutor:
+    # Forking a process that runs threads (the refresh runs in one) is
+    # unsafe, so children come from a fork server that preloads the parser
+    context: multiprocessing.context.BaseContext
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        forkserver = multiprocessing.get_context("forkserver")
+        forkserver.set_forkserver_preload(["app.sources"])
+        context = forkserver
+    else:
+        context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+
+@dataclass
+class _Shard:
+    """What a shard contributed to the last load.
+
+    ``keys`` holds the dimension columns of its rows, but not the rows
+    themselves, so their changes can be applied without keeping a copy.
+    """
+
+    fingerprint: Optional[str]
+    keys: TrendTable
+    failed: bool = False
+
+
+def _shard_keys(table: TrendTable) -> TrendTable:
+    return TrendTable(dict(table.dimensions), {})
+
+
+def _combined_fingerprint(fingerprints: Dict[str, Optional[str]]) -> str:
+    # Shards in different directories may share a file name
+    digest = hashlib.blake2b(digest_size=8)
+    for path, fingerprint in sorted(fingerprints.items()):
+        digest.update(f"{path}={fingerprint}\n".encode())
+    return digest.hexdigest()
+
+
+class ShardedSource(TrendSource):
+    """Directory or glob of CSV / Parquet shards, e.g. one per country and date.
+
+    Shards are parsed in parallel in a process pool and stacked into one
+    table. The source remembers which rows each shard held, so an
+    incremental load parses only the shards that changed, whatever their
+    dates, and reports the rows they and any deleted shards held before as
+    ``removed``. Rejected rows are reported per shard; a shard that cannot
+    be read at all is reported, and an incremental merge keeps its
+    previously loaded rows.
+    """
+
+    def __init__(self, pattern: str, workers: int = 0):
+        self.pattern = self.name = pattern
+        self.workers = workers or default_workers()
+        self._shards: Dict[str, _Shard] = {}
+        # Fingerprint of the shards as last loaded
+        self._loaded: Optional[str] = None
+
+    def fingerprint(self) -> Optional[str]:
+        paths = discover_shards(self.pattern)
+        if not paths:
+            return None
+        return _combined_fingerprint({path: file_fingerprint(path) for path in paths})
+
+    def load(self, max_errors: int = DEFAULT_MAX_ERRORS) -> IngestResult:
+        return self._load(max_errors, incremental=False)
+
+    def load_since(
+        self,
+        watermark: str,
+        max_errors: int = DEFAULT_MAX_ERRORS,
+        basis: Optional[str] = None,
+    ) -> IngestResult:
+        """Read the shards changed since the last load (see the class).
+
+        Everything is read, and the result marked complete, if nothing was
+        loaded yet or ``basis`` shows the data being merged into came from
+        another load, e.g. by another worker.
+        """
+        incremental = self._loaded is not None and basis in (None, self._loaded)
+        return self._load(max_errors, incremental)
+
+    def _load(self, max_errors: int, incremental: bool) -> IngestResult:
+        start_time = time.perf_counter()
+        paths = discover_shards(self.pattern)
+        if not paths:
+            raise SourceError(f"No shards found in {self.pattern}")
+        fingerprints = {path: file_fingerprint(path) for path in paths}
+        previous = self._shards if incremental else {}
+        changed = [
+            path
+            for path in paths
+            if path not in previous
+            or previous[path].failed
+            or previous[path].fingerprint != fingerprints[path]
+        ]
+
+        parse_start = time.perf_counter()
+        results, failures = self._read(changed, max_errors)
+        parse_seconds = time.perf_counter() - parse_start
+
+        errors = [failures[path] for path in changed if path in failures]
+        tables, removed = [], []
+        shards: Dict[str, _Shard] = {}
+        for path in paths:
+            result = results.get(path)
+            old = previous.get(path)
+            if result is not None:
+                log_ingest(path, result)
+                tables.append(result.table)
+                errors.extend(replace(error, source=path) for error in result.errors)
+                if old is not None:
+                    removed.append(old.keys)
+                shards[path] = _Shard(fingerprints[path], _shard_keys(result.table))
+                metrics.INGEST_SHARDS.labels("parsed").inc()
+            elif path in failures:
+                # Retried next time; until then a merge keeps the rows it had
+                keys = old.keys if old else _shard_keys(TrendTable.empty())
+                shards[path] = _Shard(fingerprints[path], keys, failed=True)
+            elif old is not None:
+                shards[path] = old
+                metrics.INGEST_SHARDS.labels("unchanged").inc()
+        # Shards deleted since the last load
+        removed.extend(old.keys for path, old in previous.items() if path not in shards)
+
+        table = TrendTable.concat(tables)
+        self._shards = shards
+        self._loaded = _combined_fingerprint(fingerprints)
+        result = IngestResult(
+            table=table,
+            rows_read=sum(result.rows_read for result in results.values()),
+            error_count=len(failures)
+            + sum(result.error_count for result in results.values()),
+            errors=errors[:max_errors],
+            parse_seconds=parse_seconds,
+            removed=TrendTable.concat(removed) if incremental else None,
+            complete=not incremental,
+        )
+        logger.info(
+            f"Loaded {len(table)} rows from {len(results)} of {len(paths)} shards "
+            f"in {self.pattern} ({len(results)} parsed by "
+            f"{min(self.workers, max(len(changed), 1))} workers, "
+            f"{len(failures)} failed, {len(paths) - len(changed)} unchanged) "
+            f"in {time.perf_counter() - start_time:.3f}s"
+        )
+        return result
+
+    def _read(
+        self, paths: List[str], max_errors: int
+    ) -> Tuple[Dict[str, IngestResult], Dict[str, IngestError]]:
+        """Parse shards, in a process pool if there are several and cores to spare.
+
+        Returns the results of the shards that could be read and an error
+        for each that could not.
+        """
+        results: Dict[str, IngestResult] = {}
+        failures: Dict[str, IngestError] = {}
+
+        def failed(path: str, e: Exception) -> None:
+            logger.error(f"Could not read shard {path}: {str(e)}")
+            metrics.INGEST_SHARDS.labels("failed").inc()
+            failures[path] = IngestError(row=0, reason=str(e), source=path)
+
+        workers = min(self.workers, len(paths))
+        if workers <= 1:
+            for path in paths:
+                try:
+                    results[path] = read_shard(path, max_errors)
+                except (OSError, ValueError, SourceError) as e:
+                    failed(path, e)
+            return results, failures
+
+        with _process_pool(workers) as pool:
+            futures = {
+                pool.submit(read_shard, path, max_errors): path for path in paths
+            }
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    results[path] = future.result()
+                except (OSError, ValueError, SourceError) as e:
+                    failed(path, e)
+        return results, failures
+
+
+def default_workers() -> int:
+    """CPU cores this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class WarehouseClient(Protocol):
+    """Connection to a SQL warehouse that returns results in pages."""
+
+    def query_pages(
+        self,
+        sql: str,
+        page_size: int,
+        timeout: float,
+        params: Optional[Dict[str, str]] = None,
+    ) -> Iterator[Page]:
+        """Run ``sql`` with named ``params`` and yield its rows a page at a time.
+
+        Raises:
+            SourceTimeout: If the result is not fully read within ``timeout``
+        """
+        ...
+
+    def placeholder(self, name: str) -> str:
+        """How ``sql`` refers to the named parameter ``name``."""
+        ...
+
+    def close(self) -> None: ...
+
+
+class ClientPool:
+    """Bounded pool of warehouse clients.
+
+    Clients are created on first use and kept for later refreshes, so a
+    refresh does not pay for authentication and connection setup again. A
+    client whose query raised is closed instead of being returned.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], WarehouseClient],
+        size: int = DEFAULT_POOL_SIZE,
+    ):
+        self.size = size
+        self._factory = factory
+        self._idle: "queue.LifoQueue[WarehouseClient]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def client(self, timeout: Optional[float] = None) -> Iterator[WarehouseClient]:
+        """Check out a client, waiting at most ``timeout`` seconds for one."""
+        if not self._slots.acquire(timeout=timeout):
+            raise SourceTimeout(f"No warehouse client free within {timeout}s")
+        try:
+            try:
+                client = self._idle.get_nowait()
+            except queue.Empty:
+                client = self._factory()
+            try:
+                yield client
+            except BaseException:
+                client.close()
+                raise
+            self._idle.put(client)
+        finally:
+            self._slots.release()
+
+    def close(self) -> None:
+        """Close every idle client."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class SQLiteClient:
+    """Warehouse client over a SQLite database.
+
+    Stands in for the production warehouse in local development, tests and
+    benchmarks.
+    """
+
+    def __init__(self, path: str):
+        # Pooled clients are used from whichever thread runs the refresh
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+
+    def query_pages(
+        self,
+        sql: str,
+        page_size: int,
+        timeout: float,
+        params: Optional[Dict[str, str]] = None,
+    ) -> Iterator[Page]:
+        deadline = time.monotonic() + timeout
+        # A non-zero return from the handler interrupts the running query
+        self._connection.set_progress_handler(
+            lambda: time.monotonic() > deadline, 10_000
+        )
+        try:
+            cursor = self._connection.execute(sql, params or {})
+            while True:
+                page = cursor.fetchmany(page_size)
+                if not page:
+                    return
+                yield page
+        except sqlite3.OperationalError as e:
+            if time.monotonic() > deadline:
+                raise SourceTimeout(f"Query exceeded {timeout}s") from e
+            raise SourceError(str(e)) from e
+        finally:
+            self._connection.set_progress_handler(None, 0)
+
+    def placeholder(self, name: str) -> str:
+        return f":{name}"
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+def _bigquery_credentials() -> Any:
+    """Find service account credentials for BigQuery, or None for the default."""
+    from google.oauth2 import service_account  # type: ignore
+
+    # First try Heroku-style environment credentials
+    if "BQ_CREDENTIALS" in os.environ:
+        credentials_info = json.loads(os.environ["BQ_CREDENTIALS"])
+        return service_account.Credentials.from_service_account_info(credentials_info)
+
+    # Then try local file-based credentials
+    if os.path.exists("bq.json"):
+        return service_account.Credentials.from_service_account_file("bq.json")
+
+    # Finally let the client library use GOOGLE_APPLICATION_CREDENTIALS
+    return None
+
+
+class BigQueryClient:
+    """Warehouse client for Google BigQuery."""
+
+    def __init__(self, project: Optional[str] = None):
+        from google.cloud import bigquery  # type: ignore
+
+        credentials = _bigquery_credentials()
+        if credentials is not None:
+            project = project or credentials.project_id
+        self._bigquery = bigquery
+        self._client = bigquery.Client(credentials=credentials, project=project)
+
+    def _parameter(self, name: str, value: str) -> Any:
+        # Dates compare as DATE so the warehouse can prune date partitions
+        try:
+            return self._bigquery.ScalarQueryParameter(
+                name, "DATE", date.fromisoformat(value)
+            )
+        except ValueError:
+            return self._bigquery.ScalarQueryParameter(name, "STRING", value)
+
+    def query_pages(
+        self,
+        sql: str,
+        page_size: int,
+        timeout: float,
+        params: Optional[Dict[str, str]] = None,
+    ) -> Iterator[Page]:
+        # The job timeout stops the query server-side; the request timeouts
+        # bound each API call made while waiting for and paging the result
+        job_config = self._bigquery.QueryJobConfig(
+            job_timeout_ms=int(timeout * 1000),
+            query_parameters=[
+                self._parameter(name, value) for name, value in (params or {}).items()
+            ],
+        )
+        try:
+            job = self._client.query(sql, job_config=job_config, timeout=timeout)
+            rows = job.result(page_size=page_size, timeout=timeout)
+            for page in rows.pages:
+                yield [row.values() for row in page]
+        except TimeoutError as e:
+            raise SourceTimeout(f"Query exceeded {timeout}s") from e
+
+    def placeholder(self, name: str) -> str:
+        return f"@{name}"
+
+    def close(self) -> None:
+        self._client.close()
+
+
+class WarehouseSource(TrendSource):
+    """Trend table in a SQL warehouse, streamed page by page into the builder.
+
+    Each page is appended to the column buffers as it arrives, so only one
+    page of row tuples is held in memory at a time.
+    """
+
+    def __init__(
+        self,
+        pool: ClientPool,
+        table: str,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        timeout: float = DEFAULT_QUERY_TIMEOUT,
+        name: Optional[str] = None,
+    ):
+        self.pool = pool
+        self.table = table
+        self.page_size = page_size
+        self.timeout = timeout
+        self.name = name or table
+        self.query = f"SELECT {', '.join(COLUMNS)} FROM {table}"
+
+    def load(self, max_errors: int = DEFAULT_MAX_ERRORS) -> IngestResult:
+        return self._run(max_errors)
+
+    def load_since(
+        self,
+        watermark: str,
+        max_errors: int = DEFAULT_MAX_ERRORS,
+        basis: Optional[str] = None,
+    ) -> IngestResult:
+        return self._run(max_errors, watermark=watermark)
+
+    def _run(self, max_errors: int, watermark: Optional[str] = None) -> IngestResult:
+        start_time = time.perf_counter()
+        builder = TrendTableBuilder(max_errors=max_errors)
+        with self.pool.client(timeout=self.timeout) as client:
+            query, params = self.query, {}
+            if watermark is not None:
+                query += f" WHERE event_date >= {client.placeholder('watermark')}"
+                params["watermark"] = watermark
+            first_row = 1
+            for page in client.query_pages(query, self.page_size, self.timeout, params):
+                first_row += append_page(builder, page, first_row)
+
+        result = builder.result()
+        log_ingest(self.name, result)
+        logger.info(
+            f"Fetched {result.rows_read} rows from {self.name} "
+            f"in {time.perf_counter() - start_time:.3f}s"
+        )
+        return result
+
+    def close(self) -> None:
+        self.pool.close()
+
+
+class SQLiteSource(WarehouseSource):
+    """Trend table in a local SQLite database."""
+
+    def __init__(
+        self,
+        path: str,
+        table: str = "trends",
+        page_size: int = DEFAULT_PAGE_SIZE,
+        timeout: float = DEFAULT_QUERY_TIMEOUT,
+        pool_size: int = 1,
+    ):
+        super().__init__(
+            ClientPool(lambda: SQLiteClient(path), size=pool_size),
+            table,
+            page_size=page_size,
+            timeout=timeout,
+            name=f"{path}:{table}",
+        )
+        self.path = path
+
+    def fingerprint(self) -> Optional[str]:
+        # Committed writes may still be in the write-ahead log
+        return file_fingerprint(self.path, f"{self.path}-wal")
+
+
+def create_source(settings: Settings) -> TrendSource:
+    """Build the trend source selected by ``settings.data_source``.
+
+    Raises:
+        ValueError: If the source type is unknown or needs a missing setting
+    """
+    kind = settings.data_source.lower()
+    if kind == "csv":
+        return CSVSource(settings.data_path or DEFAULT_CSV_PATH)
+    if kind in ("parquet", "sqlite", "shards") and not settings.data_path:
+        raise ValueError(f"DATA_PATH is required for the {kind} data source")
+    if kind == "parquet":
+        return ParquetSource(settings.data_path, batch_size=settings.source_page_size)
+    if kind == "shards":
+        return ShardedSource(settings.data_path, workers=settings.ingest_workers)
+    if kind == "sqlite":
+        return SQLiteSource(
+            settings.data_path,
+            table=settings.data_table,
+            page_size=settings.source_page_size,
+            timeout=settings.source_timeout_seconds,
+        )
+    if kind == "bigquery":
+        project = settings.google_cloud_project
+        return WarehouseSource(
+            ClientPool(lambda: BigQueryClient(project), size=settings.source_pool_size),
+            settings.data_table,
+            page_size=settings.source_page_size,
+            timeout=settings.source_timeout_seconds,
+            name=f"bigquery:{project}.{settings.data_table}",
+        )
+    raise ValueError(f"Unknown data source: {settings.data_source}")
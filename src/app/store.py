@@ -0,0 +1,480 @@
+from dataclasses import dataclass
+from functools import cached_property
+import hashlib
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+import numpy as np
+
+# Dictionary-encoded string columns, in CSV order
+DIMENSION_COLUMNS: Tuple[str, ...] = (
+    "event_date",
+    "campaign_country",
+    "product_category_level_1",
+    "product_category_level_2",
+    "product_category_level_3",
+)
+
+# Float metric columns, in CSV order
+METRIC_COLUMNS: Tuple[str, ...] = (
+    "revenue_daily_change",
+    "revenue_weekly_change",
+    "revenue_monthly_change",
+    "commission_daily_change",
+    "commission_weekly_change",
+    "commission_monthly_change",
+)
+
+COLUMNS: Tuple[str, ...] = DIMENSION_COLUMNS + METRIC_COLUMNS
+
+
+@dataclass(frozen=True)
+class DictionaryColumn:
+    """String column stored as integer codes into a table of distinct values."""
+
+    codes: np.ndarray
+    values: Tuple[str, ...]
+
+    @classmethod
+    def encode(cls, items: Iterable[str]) -> "DictionaryColumn":
+        """Dictionary-encode a sequence of strings, keeping first-seen order."""
+        positions: Dict[str, int] = {}
+        codes = np.fromiter(
+            (positions.setdefault(item, len(positions)) for item in items),
+            dtype=np.int32,
+        )
+        return cls(codes=codes, values=tuple(positions))
+
+    @cached_property
+    def positions(self) -> Dict[str, int]:
+        """Map each distinct value to its code."""
+        return {value: code for code, value in enumerate(self.values)}
+
+    def code_of(self, value: str) -> int:
+        """Return the code for a value, or -1 if it does not occur."""
+        return self.positions.get(value, -1)
+
+    def mask(self, value: str) -> np.ndarray:
+        """Boolean mask of the rows equal to ``value``."""
+        code = self.code_of(value)
+        if code < 0:
+            return np.zeros(len(self.codes), dtype=bool)
+        return self.codes == code
+
+    def mask_from(self, value: str) -> np.ndarray:
+        """Boolean mask of the rows whose value sorts at or after ``value``."""
+        selected = np.array([item >= value for item in self.values], dtype=bool)
+        return selected[self.codes]
+
+    def take(self, indices: np.ndarray) -> "DictionaryColumn":
+        """Select rows, sharing the same dictionary."""
+        return DictionaryColumn(codes=self.codes[indices], values=self.values)
+
+    def distinct(self) -> List[str]:
+        """Sorted distinct values present in the column."""
+        present = np.flatnonzero(np.bincount(self.codes, minlength=len(self.values)))
+        return sorted(self.values[code] for code in present)
+
+    def decode(self) -> List[str]:
+        """Materialize the column as a list of strings."""
+        values = self.values
+        return [values[code] for code in self.codes.tolist()]
+
+    def unify(self, other: "DictionaryColumn") -> Tuple[Tuple[str, ...], np.ndarray]:
+        """Extend this dictionary with ``other``'s values.
+
+        Returns the combined values, which keep this column's codes, and
+        ``other``'s codes translated into them.
+        """
+        positions = dict(self.positions)
+        for value in other.values:
+            positions.setdefault(value, len(positions))
+        remap = np.fromiter(
+            (positions[value] for value in other.values),
+            dtype=np.int32,
+            count=len(other.values),
+        )
+        return tuple(positions), remap[other.codes]
+
+
+def _row_keys(columns: Sequence[np.ndarray]) -> np.ndarray:
+    """Dense integer id for each distinct combination of codes across columns."""
+    keys = np.zeros(len(columns[0]), dtype=np.int64)
+    for codes in columns:
+        distinct, inverse = np.unique(codes, return_inverse=True)
+        # Re-densify after every column so the combined ids never overflow
+        keys = np.unique(keys * len(distinct) + inverse, return_inverse=True)[1]
+    return keys
+
+
+class TrendRow(Mapping[str, Any]):
+    """Read-only, dict-like view of a single row of a ``TrendTable``.
+
+    Supports both ``row["field"]`` and ``row.field`` so templates can use it
+    exactly like the dicts they used to receive.
+    """
+
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table: "TrendTable", index: int):
+        self._table = table
+        self._index = index
+
+    def __getitem__(self, key: str) -> Any:
+        return self._table.value(key, self._index)
+
+    def __getattr__(self, name: str) -> Any:
+        try:
+            return self._table.value(name, self._index)
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._table.columns)
+
+    def __len__(self) -> int:
+        return len(self._table.columns)
+
+    def __repr__(self) -> str:
+        return f"TrendRow({dict(self)!r})"
+
+
+class TrendTable:
+    """Immutable columnar table of trend records.
+
+    Dimension columns are dictionary-encoded and metric columns are float64
+    arrays, so filtering, sorting and distinct-value queries are vectorized.
+    """
+
+    def __init__(
+        self,
+        dimensions: Dict[str, DictionaryColumn],
+        metrics: Dict[str, np.ndarray],
+        version: Optional[str] = None,
+    ):
+        lengths = {len(c.codes) for c in dimensions.values()}
+        lengths |= {len(m) for m in metrics.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"Columns have mismatched lengths: {sorted(lengths)}")
+        self.dimensions = dimensions
+        self.metrics = metrics
+        self.columns: Tuple[str, ...] = tuple(dimensions) + tuple(metrics)
+        self._length = lengths.pop() if lengths else 0
+        self._version = version
+
+    @classmethod
+    def from_records(cls, records: Iterable[Mapping[str, Any]]) -> "TrendTable":
+        """Build a table from dict-like records with the trend schema."""
+        records = list(records)
+        dimensions = {
+            name: DictionaryColumn.encode(str(r.get(name, "")) for r in records)
+            for name in DIMENSION_COLUMNS
+        }
+        metrics = {
+            name: np.fromiter(
+                (r.get(name) or 0.0 for r in records),
+                dtype=np.float64,
+                count=len(records),
+            )
+            for name in METRIC_COLUMNS
+        }
+        return cls(dimensions, metrics)
+
+    @classmethod
+    def empty(cls) -> "TrendTable":
+        """Return a table with the trend schema and no rows."""
+        return cls.from_records([])
+
+    @classmethod
+    def concat(cls, tables: Sequence["TrendTable"]) -> "TrendTable":
+        """Stack tables with the same columns, merging their dictionaries."""
+        if not tables:
+            return cls.empty()
+        dimensions = {}
+        for name in tables[0].dimensions:
+            positions: Dict[str, int] = {}
+            parts = []
+            for table in tables:
+                column = table.dimensions[name]
+                remap = np.fromiter(
+                    (positions.setdefault(v, len(positions)) for v in column.values),
+                    dtype=np.int32,
+                    count=len(column.values),
+                )
+                parts.append(remap[column.codes])
+            dimensions[name] = DictionaryColumn(
+                codes=np.concatenate(parts), values=tuple(positions)
+            )
+        metrics = {
+            name: np.concatenate([table.metrics[name] for table in tables])
+            for name in tables[0].metrics
+        }
+        return cls(dimensions, metrics)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[TrendRow]:
+        return (TrendRow(self, i) for i in range(self._length))
+
+    def __getitem__(self, index: int) -> TrendRow:
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("TrendTable index out of range")
+        return TrendRow(self, index)
+
+    @property
+    def version(self) -> str:
+        """Content fingerprint identifying this dataset version.
+
+        Computed once on first access; identical data parsed by different
+        workers yields the same version.
+        """
+        if self._version is None:
+            digest = hashlib.blake2b(digest_size=8)
+            for name, column in self.dimensions.items():
+                digest.update(name.encode())
+                digest.update("\x1f".join(column.values).encode())
+                digest.update(np.ascontiguousarray(column.codes))
+            for name, values in self.metrics.items():
+                digest.update(name.encode())
+                digest.update(np.ascontiguousarray(values))
+            self._version = digest.hexdigest()
+        return self._version
+
+    def value(self, column: str, index: int) -> Any:
+        """Return a single cell as a plain Python value."""
+        if column in self.metrics:
+            return float(self.metrics[column][index])
+        dimension = self.dimensions[column]
+        return dimension.values[dimension.codes[index]]
+
+    def metric(self, column: str) -> np.ndarray:
+        """Return the float array backing a metric column."""
+        return self.metrics[column]
+
+    def mask(self, **equals: str) -> np.ndarray:
+        """Boolean mask of rows whose dimension columns equal the given values."""
+        result = np.ones(self._length, dtype=bool)
+        for column, value in equals.items():
+            result &= self.dimensions[column].mask(value)
+        return result
+
+    def slice(self, start: int, stop: int) -> "TrendTable":
+        """Rows ``start:stop`` as a table of views, without copying."""
+        return TrendTable(
+            {
+                name: DictionaryColumn(
+                    codes=column.codes[start:stop], values=column.values
+                )
+                for name, column in self.dimensions.items()
+            },
+            {name: values[start:stop] for name, values in self.metrics.items()},
+        )
+
+    def select(self, rows: np.ndarray) -> "TrendTable":
+        """Return a new table with the rows picked by a mask or index array."""
+        indices = np.flatnonzero(rows) if rows.dtype == bool else rows
+        return TrendTable(
+            {name: column.take(indices) for name, column in self.dimensions.items()},
+            {name: values[indices] for name, values in self.metrics.items()},
+        )
+
+    def order_by(
+        self, column: str, descending: bool = False, absolute: bool = False
+    ) -> np.ndarray:
+        """Return row indices sorted (stably) by a metric column."""
+        values = self.metrics[column]
+        if absolute:
+            values = np.abs(values)
+        return np.argsort(-values if descending else values, kind="stable")
+
+    def ranked(
+        self,
+        column: str,
+        ascending: bool = True,
+        where: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """Indices of losers (ascending) or gainers, most extreme change first.
+
+        Only strictly negative (or positive) values are returned, optionally
+        restricted to the rows set in ``where``.
+        """
+        values = self.metrics[column]
+        keep = values < 0 if ascending else values > 0
+        if where is not None:
+            keep &= where
+        selected = np.flatnonzero(keep)
+        picked = values[selected]
+        order = np.argsort(picked if ascending else -picked, kind="stable")
+        return selected[order]
+
+    def distinct(self, column: str) -> List[str]:
+        """Sorted distinct values of a dimension column."""
+        return self.dimensions[column].distinct()
+
+    def upsert(
+        self,
+        delta: "TrendTable",
+        key: Sequence[str] = DIMENSION_COLUMNS,
+        order_by: Optional[str] = None,
+        descending: bool = False,
+        absolute: bool = False,
+    ) -> "TrendTable":
+        """Merge ``delta`` in, replacing the rows that share its ``key`` values.
+
+        With ``order_by``, this table must already be sorted the way
+        ``order_by`` sorts; the delta is sorted and merged into place, so the
+        merge is linear in the table size. Otherwise delta rows are appended.
+
+        The merged table's version chains this version with the delta's,
+        so workers applying the same deltas to the same base agree on it.
+        """
+        if not len(delta):
+            return self
+
+        dimensions: Dict[str, Tuple[Tuple[str, ...], np.ndarray]] = {}
+        for name, column in self.dimensions.items():
+            dimensions[name] = column.unify(delta.dimensions[name])
+
+        shared = self._sharing_keys({name: dimensions[name][1] for name in key}, key)
+        kept = np.flatnonzero(~shared)
+
+        if order_by is None:
+            delta_order = np.arange(len(delta))
+            slots = np.arange(len(kept), len(kept) + len(delta))
+        else:
+            delta_order = delta.order_by(order_by, descending, absolute)
+
+            def sort_key(values: np.ndarray) -> np.ndarray:
+                values = np.abs(values) if absolute else values
+                return -values if descending else values
+
+            # Equal keys go after existing rows, as a stable sort would put them
+            slots = np.searchsorted(
+                sort_key(self.metrics[order_by][kept]),
+                sort_key(delta.metrics[order_by][delta_order]),
+                side="right",
+            ) + np.arange(len(delta))
+        from_delta = np.zeros(len(kept) + len(delta), dtype=bool)
+        from_delta[slots] = True
+
+        def merged(old: np.ndarray, new: np.ndarray) -> np.ndarray:
+            out = np.empty(len(from_delta), dtype=old.dtype)
+            out[~from_delta] = old[kept]
+            out[from_delta] = new[delta_order]
+            return out
+
+        digest = hashlib.blake2b(digest_size=8)
+        digest.update(self.version.encode())
+        digest.update(delta.version.encode())
+        return TrendTable(
+            {
+                name: DictionaryColumn(
+                    codes=merged(self.dimensions[name].codes, codes), values=values
+                )
+                for name, (values, codes) in dimensions.items()
+            },
+            {
+                name: merged(values, delta.metrics[name])
+                for name, values in self.metrics.items()
+            },
+            version=digest.hexdigest(),
+        )
+
+    def without(
+        self, other: "TrendTable", key: Sequence[str] = DIMENSION_COLUMNS
+    ) -> "TrendTable":
+        """This table without the rows sharing their ``key`` values with ``other``.
+
+        Only ``other``'s ``key`` columns are used, so it may hold no metrics.
+        Like ``upsert``, the result's version chains this version with
+        ``other``'s.
+        """
+        if not len(other) or not self._length:
+            return self
+        codes = {
+            name: self.dimensions[name].unify(other.dimensions[name])[1] for name in key
+        }
+        keep = ~self._sharing_keys(codes, key)
+        if keep.all():
+            return self
+        digest = hashlib.blake2b(digest_size=8)
+        digest.update(self.version.encode())
+        digest.update(b"-")
+        digest.update(other.version.encode())
+        indices = np.flatnonzero(keep)
+        return TrendTable(
+            {name: column.take(indices) for name, column in self.dimensions.items()},
+            {name: values[indices] for name, values in self.metrics.items()},
+            version=digest.hexdigest(),
+        )
+
+    def _sharing_keys(
+        self, codes: Mapping[str, np.ndarray], key: Sequence[str]
+    ) -> np.ndarray:
+        """Mask of the rows whose ``key`` codes equal those of any row in ``codes``.
+
+        ``codes`` are another table's key columns, translated into this
+        table's dictionaries.
+        """
+        # Only rows sharing the first key value can match
+        first = key[0]
+        candidates = np.flatnonzero(np.isin(self.dimensions[first].codes, codes[first]))
+        keys = _row_keys(
+            [
+                np.concatenate([self.dimensions[name].codes[candidates], codes[name]])
+                for name in key
+            ]
+        )
+        own_keys, other_keys = np.split(keys, [len(candidates)])
+        shared = np.zeros(self._length, dtype=bool)
+        shared[candidates[np.isin(own_keys, other_keys)]] = True
+        return shared
+
+    def rows(
+        self, indices: Optional[Union[Sequence[int], np.ndarray]] = None
+    ) -> List[TrendRow]:
+        """Row views for the given indices (all rows by default)."""
+        if indices is None:
+            return list(self)
+        return [TrendRow(self, int(i)) for i in indices]
+
+    def to_records(
+        self,
+        columns: Optional[Sequence[str]] = None,
+        start: int = 0,
+        stop: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Materialize rows ``start:stop`` as plain dicts.
+
+        Args:
+            columns: Columns to include, in order (default: all)
+            start: First row to include
+            stop: Row to stop before (default: the end of the table)
+
+        Raises:
+            KeyError: If a column does not exist
+        """
+        names = self.columns if columns is None else tuple(columns)
+        rows = slice(start, stop)
+        values: List[List[Any]] = []
+        for name in names:
+            if name in self.dimensions:
+                column = self.dimensions[name]
+                values.append(
+                    list(map(column.values.__getitem__, column.codes[rows].tolist()))
+                )
+            else:
+                values.append(self.metrics[name][rows].tolist())
+        return [dict(zip(names, row)) for row in zip(*values)]
@@ -0,0 +1,67 @@
+from typing import Optional, Sequence
+import argparse
+import logging
+import os
+import time
+
+from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Relative to the working directory, like the static files
+TEMPLATE_DIR = "src/app/templates"
+
+
+def create_templates(
+    directory: str = TEMPLATE_DIR, cache_dir: Optional[str] = None
+) -> Jinja2Templates:
+    """Templates that load compiled bytecode from ``cache_dir``, if set.
+
+    Workers sharing the directory compile each template once between them;
+    ``precompile`` fills it ahead of time, e.g. when building the image.
+    """
+    templates = Jinja2Templates(directory=directory)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        templates.env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+    return templates
+
+
+def precompile(templates: Jinja2Templates) -> int:
+    """Load every template now rather than on first use; return how many.
+
+    Templates missing from the bytecode cache are compiled and written to it.
+    """
+    names = templates.env.list_templates()
+    for name in names:
+        templates.env.get_template(name)
+    return len(names)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Compile the Jinja templates into a bytecode cache directory"
+    )
+    parser.add_argument("--directory", default=TEMPLATE_DIR)
+    parser.add_argument(
+        "--cache-dir",
+        default=settings.template_cache_dir,
+        help="Default: TEMPLATE_CACHE_DIR",
+    )
+    args = parser.parse_args(argv)
+    if not args.cache_dir:
+        parser.error("--cache-dir or TEMPLATE_CACHE_DIR is required")
+
+    start_time = time.perf_counter()
+    count = precompile(create_templates(args.directory, args.cache_dir))
+    print(
+        f"Compiled {count} templates into {args.cache_dir} "
+        f"in {time.perf_counter() - start_time:.3f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
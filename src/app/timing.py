@@ -0,0 +1,57 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+import time
+
+from prometheus_client import Histogram
+
+# Phases measured while handling the current request, if one is being timed
+Phases = List[Tuple[str, float]]
+_phases: ContextVar[Optional[Phases]] = ContextVar("request_phases", default=None)
+
+
+def start_request() -> Phases:
+    """Start collecting the phases of the current request.
+
+    Tasks and threads started from here on (e.g. a refresh the request
+    waits for) copy the context and so record into the same list.
+    """
+    phases: Phases = []
+    _phases.set(phases)
+    return phases
+
+
+def observe(name: str, seconds: float, histogram: Optional[Histogram] = None) -> None:
+    """Record a phase for the current request and in ``histogram``.
+
+    ``histogram`` must have a single ``phase`` label.
+    """
+    phases = _phases.get()
+    if phases is not None:
+        phases.append((name, seconds))
+    if histogram is not None:
+        histogram.labels(name).observe(seconds)
+
+
+@contextmanager
+def phase(name: str, histogram: Optional[Histogram] = None) -> Iterator[None]:
+    """Time a block with the monotonic high-resolution clock (see ``observe``)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, histogram)
+
+
+def server_timing(phases: Phases, total: float) -> str:
+    """Format phases as a ``Server-Timing`` header, durations in milliseconds.
+
+    Repeated phases are summed, keeping the order they first ran in.
+    """
+    durations: Dict[str, float] = {}
+    for name, seconds in phases:
+        durations[name] = durations.get(name, 0.0) + seconds
+    durations["total"] = total
+    return ", ".join(
+        f"{name};dur={seconds * 1000:.3f}" for name, seconds in durations.items()
+    )
@@ -0,0 +1,98 @@
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from app.store import TrendRow, TrendTable
+
+DEFAULT_MAX_K = 50
+
+# (metric, country, category); None means every country or category
+ScopeKey = Tuple[str, Optional[str], Optional[str]]
+
+
+def top_indices(
+    values: np.ndarray, k: int, largest: bool, where: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Indices of the ``k`` most extreme strictly positive (or negative) values.
+
+    Uses partial selection rather than a full sort, so the cost is linear in
+    the number of rows. The result is ordered most extreme first with ties
+    in row order, exactly like ``TrendTable.ranked(...)[:k]``.
+    """
+    keep = values > 0 if largest else values < 0
+    if where is not None:
+        keep &= where
+    candidates = np.flatnonzero(keep)
+    picked = values[candidates] if largest else -values[candidates]
+    if len(candidates) > k:
+        # Keep everything tied with the k-th value so ties resolve by row
+        kth = np.partition(picked, len(picked) - k)[len(picked) - k]
+        selected = picked >= kth
+        candidates, picked = candidates[selected], picked[selected]
+    order = np.argsort(-picked, kind="stable")[:k]
+    return candidates[order]
+
+
+_NO_SELECTION = (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp))
+
+
+class TopK:
+    """Top and bottom rows of each metric, per country and category.
+
+    Built with each dataset version. The all-countries, all-categories
+    selections (what the ticker shows) are computed up front for every
+    metric; scoped selections are computed on first use and kept for the
+    lifetime of the version, so repeat queries only slice a short array.
+    Only values in the table's dictionaries are kept, so made-up scopes
+    cannot grow the selections.
+    """
+
+    def __init__(self, table: TrendTable, max_k: int = DEFAULT_MAX_K):
+        self.table = table
+        self.max_k = max_k
+        self._selections: Dict[ScopeKey, Tuple[np.ndarray, np.ndarray]] = {}
+        for metric in table.metrics:
+            self._select(metric, None, None)
+
+    def _select(
+        self, metric: str, country: Optional[str], category: Optional[str]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        key = (metric, country, category)
+        selection = self._selections.get(key)
+        if selection is None:
+            equals = {}
+            if country is not None:
+                equals["campaign_country"] = country
+            if category is not None:
+                equals["product_category_level_1"] = category
+            for name, value in equals.items():
+                if self.table.dimensions[name].code_of(value) < 0:
+                    # No rows, and not cached
+                    return _NO_SELECTION
+            where = self.table.mask(**equals) if equals else None
+            values = self.table.metric(metric)
+            selection = (
+                top_indices(values, self.max_k, largest=True, where=where),
+                top_indices(values, self.max_k, largest=False, where=where),
+            )
+            self._selections[key] = selection
+        return selection
+
+    def top(
+        self,
+        metric: str,
+        k: int,
+        country: Optional[str] = None,
+        category: Optional[str] = None,
+    ) -> Tuple[List[TrendRow], List[TrendRow]]:
+        """Largest gains and largest losses of ``metric``, at most ``k`` each.
+
+        Raises:
+            KeyError: If ``metric`` is not a metric column of the table
+            ValueError: If ``k`` is larger than ``max_k``
+        """
+        if metric not in self.table.metrics:
+            raise KeyError(metric)
+        if k > self.max_k:
+            raise ValueError(f"k must be at most {self.max_k}")
+        gainers, losers = self._select(metric, country, category)
+        return self.table.rows(gainers[:k]), self.table.rows(losers[:k])
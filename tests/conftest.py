@@ -3,6 +3,7 @@
 import pytest
 from typing import List, Dict, Any
 from app.database import cache
+from app.store import TrendTable
 
 
 @pytest.fixture(autouse=True)
@@ -15,36 +16,47 @@ def clear_cache():
 
 @pytest.fixture
 def sample_trends_data() -> List[Dict[str, Any]]:
-    """Sample trends data for testing."""
+    """Sample trends rows with the columns of the real trend export."""
     return [
         {
-            "category": "Electronics",
-            "country": "US",
-            "product_name": "Test Product 1",
-            "weekly_revenue": 1000.0,
-            "weekly_revenue_change": 50.0,
-            "weekly_units_sold": 100,
-            "weekly_units_sold_change": 25.0,
+            "event_date": "2025-02-09",
+            "campaign_country": "US",
+            "product_category_level_1": "electronics",
+            "product_category_level_2": "audio",
+            "product_category_level_3": "headphones",
+            "revenue_daily_change": 0.12,
+            "revenue_weekly_change": 0.5,
+            "revenue_monthly_change": 0.31,
+            "commission_daily_change": 0.08,
+            "commission_weekly_change": 0.44,
+            "commission_monthly_change": 0.27,
         },
         {
-            "category": "Clothing",
-            "country": "UK",
-            "product_name": "Test Product 2",
-            "weekly_revenue": 500.0,
-            "weekly_revenue_change": -20.0,
-            "weekly_units_sold": 50,
-            "weekly_units_sold_change": -10.0,
+            "event_date": "2025-02-09",
+            "campaign_country": "UK",
+            "product_category_level_1": "apparel & accessories",
+            "product_category_level_2": "clothing",
+            "product_category_level_3": "outerwear",
+            "revenue_daily_change": -0.05,
+            "revenue_weekly_change": -0.2,
+            "revenue_monthly_change": -0.12,
+            "commission_daily_change": -0.03,
+            "commission_weekly_change": -0.18,
+            "commission_monthly_change": -0.1,
         },
     ]
 
 
 @pytest.fixture
 def mock_fetch_trends(monkeypatch, sample_trends_data):
-    """Mock the fetch_trends function."""
+    """Serve the sample rows instead of loading the configured source."""
+    table = TrendTable.from_records(sample_trends_data)
 
     async def mock_fetch(*args, **kwargs):
-        return sample_trends_data
+        return table
 
-    from app import database
+    from app import database, main
 
     monkeypatch.setattr(database, "fetch_trends", mock_fetch)
+    monkeypatch.setattr(main, "fetch_trends", mock_fetch)
+    return table
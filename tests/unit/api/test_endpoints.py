@@ -1,8 +1,15 @@
 """Unit tests for the FastAPI endpoints."""
 
+import asyncio
+import io
+import json
 import pytest
 from fastapi.testclient import TestClient
+from app import main
+from app.encoding import encode_cursor
+from app.export import ExportCache
 from app.main import app
+from app.store import COLUMNS
 import os
 
 # Ensure we're using the correct static directory path
@@ -10,8 +17,13 @@ os.environ["STATIC_DIR"] = "src/app/static"
 
 
 @pytest.fixture
-def client():
-    """Create a test client."""
+def client(monkeypatch):
+    """Create a test client, without per-client rate limits.
+
+    Every test request comes from the same address, so the token bucket
+    would otherwise carry over between tests.
+    """
+    monkeypatch.setattr(main.admission, "buckets", None)
     return TestClient(app)
 
 
@@ -58,3 +70,373 @@ def test_get_categories(client):
     response = client.get("/api/trends/categories")
     assert response.status_code == 200
     assert "text/html" in response.headers["content-type"]
+
+
+def test_fragment_etag_not_modified(client):
+    """Test that fragment endpoints honour If-None-Match."""
+    response = client.get("/api/trends/ticker")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    response = client.get("/api/trends/ticker", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+def test_fragment_served_pre_compressed(client):
+    """Test that fragments are sent gzip-encoded and identity when asked."""
+    gzipped = client.get("/api/trends/filter?category=all&country=US")
+    assert gzipped.headers["content-encoding"] == "gzip"
+
+    plain = client.get(
+        "/api/trends/filter?category=all&country=US",
+        headers={"Accept-Encoding": "identity"},
+    )
+    assert "content-encoding" not in plain.headers
+    assert plain.text == gzipped.text
+    assert plain.headers["etag"] != gzipped.headers["etag"]
+
+
+async def read_stream(path, chunks, headers=()):
+    """Read the first body chunks of a streaming response, then disconnect."""
+    received, done = [], asyncio.Event()
+
+    async def receive():
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            received.append(message)
+        elif message.get("body"):
+            received.append(message["body"])
+            if len(received) > chunks:
+                done.set()
+
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"testserver"), *headers],
+        "client": ("127.0.0.1", 1234),
+        "server": ("testserver", 80),
+    }
+    await asyncio.wait_for(app(scope, receive, send), timeout=5)
+    return received[0], received[1:]
+
+
+@pytest.mark.asyncio
+async def test_stream_sends_current_fragments():
+    """A new subscriber gets the current ticker and grid straight away."""
+    start, chunks = await read_stream("/api/trends/stream?country=UK", chunks=2)
+    headers = dict(start["headers"])
+    assert start["status"] == 200
+    assert headers[b"content-type"].startswith(b"text/event-stream")
+    assert headers[b"content-encoding"] == b"identity"
+    assert chunks[0].startswith(b"retry: ")
+    assert b"event: ticker\n" in chunks[1]
+    assert b"event: grid\n" in chunks[1]
+    assert len(main.broadcaster) == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_up_to_date_client_waits_for_next_version(monkeypatch):
+    """Clients that already show the current version only get new ones."""
+    version = (await main.fetch_trends()).version
+    monkeypatch.setattr(main.broadcaster, "version", "older")
+    monkeypatch.setattr(main.settings, "push_heartbeat_seconds", 1.0)
+
+    async def publish_soon():
+        await asyncio.sleep(0.01)
+        await main.publish_trends()
+
+    publisher = asyncio.create_task(publish_soon())
+    _, chunks = await read_stream(
+        "/api/trends/stream",
+        chunks=2,
+        headers=[(b"last-event-id", version.encode())],
+    )
+    await publisher
+    assert chunks[1].startswith(b"event: ticker\nid: " + version.encode())
+    assert b"event: grid\n" in chunks[1]
+
+
+def test_stream_full_returns_503(client, monkeypatch):
+    """Clients beyond the subscriber limit are told to keep polling."""
+    monkeypatch.setattr(main.broadcaster, "max_subscribers", 0)
+    response = client.get("/api/trends/stream")
+    assert response.status_code == 503
+    assert "retry-after" in response.headers
+
+
+def test_filter_includes_stream_connector(client):
+    """Grid responses re-point the push stream at the applied filter."""
+    response = client.get("/api/trends/filter?category=toys&country=UK")
+    assert 'id="trendStream" hx-swap-oob="true"' in response.text
+    assert "/api/trends/stream?category=toys&country=UK&version=" in response.text
+
+
+def test_home_page_is_rendered_with_its_data(client):
+    """The home page is served with its data and needs no further request."""
+    response = client.get("/")
+    assert response.status_code == 200
+    html = response.text
+    assert 'hx-trigger="load' not in html
+    assert "/api/trends/stream?category=all&country=US&version=" in html
+    assert (
+        client.get("/", headers={"If-None-Match": response.headers["etag"]}).status_code
+        == 304
+    )
+
+    # The same fragments the separate endpoints serve
+    grid = client.get("/api/trends/filter?category=all&country=US").text
+    assert grid.split("<!--")[0].strip() in html
+    assert client.get("/api/trends/ticker").text in html
+    assert client.get("/api/trends/countries").text.strip() in html
+
+
+def test_top_trends(client):
+    """Test the top-K endpoint for a scoped metric."""
+    response = client.get(
+        "/api/trends/top?metric=commission_weekly_change&k=3&country=UK"
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["gainers"]) <= 3 and len(data["losers"]) <= 3
+    changes = [row["commission_weekly_change"] for row in data["gainers"]]
+    assert changes == sorted(changes, reverse=True)
+    assert all(row["campaign_country"] == "UK" for row in data["losers"])
+
+    assert client.get("/api/trends/top?metric=event_date").status_code == 422
+    assert client.get("/api/trends/top?k=0").status_code == 422
+
+
+def test_trend_history(client):
+    """Test the downsampled history endpoint and its sparkline."""
+    params = {
+        "country": "UK",
+        "level1": "electronics",
+        "level2": "electronics accessories",
+        "level3": "computer components",
+        "days": 7,
+        "points": 4,
+    }
+    response = client.get("/api/trends/history", params=params)
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["dates"]) == len(data["values"]) == 4
+    assert data["values"][-1] == pytest.approx(0.0031)
+
+    response = client.get("/api/trends/history", params={**params, "format": "svg"})
+    assert response.headers["content-type"] == "image/svg+xml"
+    assert "<path" in response.text
+
+    params["country"] = "nowhere"
+    assert client.get("/api/trends/history", params=params).status_code == 404
+
+
+def test_top_trends_by_score(client):
+    """Test that every trend carries its score and can be ranked by it."""
+    records = client.get("/api/trends").json()
+    assert all("trend_score" in record for record in records)
+
+    data = client.get("/api/trends/top?metric=trend_score&k=5").json()
+    scores = [row["trend_score"] for row in data["gainers"]]
+    assert scores == sorted(scores, reverse=True) and all(s > 0 for s in scores)
+
+
+def test_trend_cube(client, mock_fetch_trends):
+    """Test drilling down from every country into one category."""
+    root = client.get("/api/trends/cube").json()
+    assert root["node"]["country"] == "all" and root["node"]["count"] == 2
+    assert sum(child["count"] for child in root["children"]) == root["node"]["count"]
+
+    level1 = "apparel & accessories"
+    response = client.get(
+        "/api/trends/cube", params={"country": "UK", "level1": level1}
+    )
+    assert response.status_code == 200
+    node = response.json()["node"]
+    assert (node["country"], node["level1"], node["count"]) == ("UK", level1, 1)
+    children = response.json()["children"]
+    assert [child["level2"] for child in children] == ["clothing"]
+
+    assert client.get("/api/trends/cube?level2=lighting").status_code == 422
+    assert client.get("/api/trends/cube?country=nowhere").status_code == 404
+
+
+def test_get_trends_from_mocked_source(client, mock_fetch_trends, sample_trends_data):
+    """Test that the shared fixtures match the real trend schema."""
+    assert set(sample_trends_data[0]) == set(COLUMNS)
+    response = client.get("/api/trends")
+    assert response.json() == sample_trends_data
+
+    response = client.get("/api/trends/filter?category=electronics&country=US")
+    assert "headphones" in response.text
+
+
+def test_server_timing_and_phase_metrics(client):
+    """Test the per-phase breakdown in the header and on /metrics."""
+    response = client.get("/api/trends/filter?category=all&country=US")
+    phases = [
+        part.split(";")[0] for part in response.headers["Server-Timing"].split(", ")
+    ]
+    assert "fetch" in phases and phases[-1] == "total"
+
+    exposed = client.get("/metrics").text
+    assert 'trend_request_phase_seconds_count{endpoint="/api/trends/filter"' in exposed
+    assert "trend_cache_requests_total" in exposed
+    assert "trend_cache_records" in exposed
+
+
+def test_trends_pages_projection_and_ndjson(client):
+    """Test paging through the trends with cursors, fields and NDJSON."""
+    everything = client.get("/api/trends").json()
+    assert client.get("/api/trends").headers["content-encoding"] == "gzip"
+
+    rows, url = [], "/api/trends?fields=campaign_country,revenue_weekly_change&limit=7"
+    while url:
+        response = client.get(url)
+        assert int(response.headers["x-total-count"]) == len(everything)
+        rows += response.json()
+        url = response.links.get("next", {}).get("url")
+    assert rows == [
+        {
+            "campaign_country": row["campaign_country"],
+            "revenue_weekly_change": row["revenue_weekly_change"],
+        }
+        for row in everything
+    ]
+
+    response = client.get("/api/trends?limit=3&format=ndjson")
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == everything[:3]
+    response = client.get("/api/trends", headers={"Accept": "application/x-ndjson"})
+    assert len(response.text.splitlines()) == len(everything)
+
+    assert client.get("/api/trends?fields=nope").status_code == 422
+    assert client.get("/api/trends?cursor=!!").status_code == 400
+    stale = encode_cursor("old-version", 3)
+    assert client.get(f"/api/trends?cursor={stale}").status_code == 410
+
+
+def test_static_assets_are_not_gzipped_per_request(client):
+    """Static assets skip the per-request gzip and revalidate by ETag."""
+    response = client.get("/static/styles.css", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    etag = response.headers["etag"]
+    response = client.get("/static/styles.css", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    html = client.get("/").text
+    assert main.url_for("static_files", path="styles.css") in html
+
+
+def test_query_trends(client):
+    """Multi-valued and range filters, sorted, with pages."""
+    rows = client.get("/api/trends").json()
+    countries = ["US", "UK"]
+    expected = sorted(
+        (
+            row
+            for row in rows
+            if row["campaign_country"] in countries
+            and row["revenue_weekly_change"] > 0.05
+            and row["commission_monthly_change"] < 0
+        ),
+        key=lambda row: -row["revenue_weekly_change"],
+    )
+    params = [
+        ("country", "US"),
+        ("country", "UK"),
+        ("where", "revenue_weekly_change>5%"),
+        ("where", "commission_monthly_change<0"),
+        ("sort", "-revenue_weekly_change"),
+    ]
+    response = client.get("/api/trends/query", params=params)
+    assert response.status_code == 200
+    assert response.json() == expected
+    assert response.headers["x-total-count"] == str(len(expected))
+
+    page = client.get(
+        "/api/trends/query", params=params + [("limit", "2"), ("fields", "event_date")]
+    )
+    assert page.json() == [{"event_date": row["event_date"]} for row in expected[:2]]
+    assert 'rel="next"' in page.headers["link"]
+
+    for invalid in ("revenue_weekly_change>>1", "campaign_country>1"):
+        response = client.get("/api/trends/query", params={"where": invalid})
+        assert response.status_code == 422
+    response = client.get("/api/trends/query", params={"sort": "event_date"})
+    assert response.status_code == 422
+
+
+def test_export_trends(client, monkeypatch, tmp_path):
+    """Filtered CSV and Parquet downloads, sent from the export cache again."""
+    monkeypatch.setattr(main, "export_cache", ExportCache(str(tmp_path), 1 << 20))
+    rows = client.get("/api/trends").json()
+    expected = [row for row in rows if row["campaign_country"] == "UK"]
+
+    params = {"country": "UK", "fields": "campaign_country,revenue_weekly_change"}
+    response = client.get("/api/trends/export", params=params)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert "attachment" in response.headers["content-disposition"]
+    lines = response.text.splitlines()
+    assert lines[0] == "campaign_country,revenue_weekly_change"
+    assert lines[1:] == [f"UK,{row['revenue_weekly_change']!r}" for row in expected]
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert [path.suffix for path in tmp_path.iterdir()] == [".gz"]
+    cached = client.get("/api/trends/export", params=params)
+    assert cached.content == response.content
+    assert cached.headers["etag"] == response.headers["etag"]
+    identity = client.get(
+        "/api/trends/export", params=params, headers={"Accept-Encoding": "identity"}
+    )
+    assert identity.content == response.content
+    assert "content-encoding" not in identity.headers
+    etag = response.headers["etag"]
+    for if_none_match in (etag, f'"other", W/{etag}', "*"):
+        not_modified = client.get(
+            "/api/trends/export",
+            params=params,
+            headers={"If-None-Match": if_none_match},
+        )
+        assert not_modified.status_code == 304
+
+    pq = pytest.importorskip("pyarrow.parquet")
+    response = client.get(
+        "/api/trends/export", params={"country": "UK", "format": "parquet"}
+    )
+    assert response.status_code == 200
+    assert pq.read_table(io.BytesIO(response.content)).to_pylist() == expected
+    assert response.headers["etag"] != cached.headers["etag"]
+
+
+def test_filter_with_several_countries_and_ranges(client):
+    """The grid takes multi-valued and range filters, and streams them."""
+    response = client.get(
+        "/api/trends/filter",
+        params=[
+            ("category", "all"),
+            ("country", "US"),
+            ("country", "UK"),
+            ("where", "revenue_weekly_change>0.1"),
+        ],
+    )
+    assert response.status_code == 200
+    assert (
+        "/api/trends/stream?category=all&country=UK&country=US"
+        "&where=revenue_weekly_change%3E0.1&version=" in response.text
+    )
+    response = client.get("/api/trends/filter", params={"where": "nope"})
+    assert response.status_code == 422
@@ -3,6 +3,8 @@
 import pytest
 from datetime import datetime, timedelta
 from app.database import InMemoryCache, CacheData
+from app.index import PartitionIndex
+from app.store import TrendTable
 
 
 @pytest.fixture
@@ -11,32 +13,62 @@ def cache():
     return InMemoryCache(expiry_hours=0.0833)  # 5 minutes
 
 
+@pytest.fixture
+def test_data():
+    """A one-row trend table."""
+    return TrendTable.from_records(
+        [
+            {
+                "campaign_country": "US",
+                "product_category_level_1": "electronics",
+                "revenue_weekly_change": 0.25,
+            }
+        ]
+    )
+
+
 def test_cache_initialization(cache):
     """Test that cache is properly initialized."""
     assert cache._cache is None
     assert cache.expiry_time == timedelta(hours=0.0833)
 
 
-def test_cache_set_and_get(cache):
+def test_cache_set_and_get(cache, test_data):
     """Test setting and getting cache data."""
-    test_data = [{"test": "data"}]
     cache.set(test_data)
-    assert cache.get() == test_data
+    assert cache.get() is test_data
+
+
+def test_cache_set_builds_index(cache, test_data):
+    """Test that setting data builds a partition index over it."""
+    cache.set(test_data)
+    index = cache.get_index()
+    assert index is not None
+    assert index.table is test_data
+    assert [r.campaign_country for r in index.gainers("electronics", "US")] == ["US"]
 
 
-def test_cache_expiration(cache):
+def test_cache_expiration(cache, test_data):
     """Test that cache properly expires."""
-    test_data = [{"test": "data"}]
     # Set cache with expired timestamp
     cache._cache = CacheData(
-        data=test_data, timestamp=datetime.now() - timedelta(hours=1)
+        data=test_data,
+        timestamp=datetime.now() - timedelta(hours=1),
+        index=PartitionIndex.build(test_data),
     )
     assert cache.get() is None
+    assert cache.get_index() is None
 
 
-def test_cache_clear(cache):
+def test_cache_clear(cache, test_data):
     """Test clearing the cache."""
-    test_data = [{"test": "data"}]
     cache.set(test_data)
     cache.clear()
     assert cache._cache is None
+    assert cache.get_index() is None
+
+
+def test_cache_set_with_timestamp(cache, test_data):
+    """Data attached from a snapshot expires relative to its creation time."""
+    cache.set(test_data, timestamp=datetime.now() - timedelta(minutes=10))
+    assert cache.get() is None
@@ -0,0 +1,151 @@
+"""Unit tests for leader election and version announcements between workers."""
+
+import pytest
+from prometheus_client import REGISTRY
+from app import database
+from app.coordination import (
+    LeaderLock,
+    RefreshCoordinator,
+    VersionFile,
+    backoff_delays,
+)
+from app.database import cache
+from app.snapshot import SharedSnapshot
+from app.sources import CSVSource
+from app.store import COLUMNS, TrendTable
+
+
+def sample(name: str, **labels: str) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def make_table(change: float) -> TrendTable:
+    return TrendTable.from_records(
+        [{"campaign_country": "US", "revenue_weekly_change": change}]
+    )
+
+
+class Worker:
+    """A coordinator with a fake refresh, standing in for one gunicorn worker."""
+
+    def __init__(self, path, failures=0):
+        self.refreshes = []
+        self.followed = []
+        self.sleeps = []
+        self.failures = failures
+
+        async def refresh(force, incremental):
+            self.refreshes.append(force)
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError("warehouse unavailable")
+            return make_table(0.5)
+
+        async def follow(stamp):
+            self.followed.append(stamp.version)
+
+        async def sleep(seconds):
+            self.sleeps.append(seconds)
+
+        self.coordinator = RefreshCoordinator(
+            path, refresh, follow, retries=3, backoff=1.0, backoff_max=3.0, sleep=sleep
+        )
+
+
+def test_leader_lock_is_exclusive(tmp_path):
+    """One lock holder at a time; the lead passes on when it is released."""
+    path = str(tmp_path / "trends.leader")
+    first, second = LeaderLock(path), LeaderLock(path)
+    assert first.try_acquire() and first.try_acquire()
+    assert not second.try_acquire() and not second.is_leader
+    first.release()
+    assert second.try_acquire()
+    second.release()
+
+
+def test_version_file_announces_new_versions(tmp_path):
+    """Readers see each written version once; the writer does not see its own."""
+    path = str(tmp_path / "trends.version")
+    writer, reader = VersionFile(path), VersionFile(path)
+    assert reader.poll() is None
+
+    table = make_table(0.5)
+    stamp = writer.write(table)
+    assert writer.poll() is None
+    assert reader.poll() == stamp
+    assert stamp.version == table.version and stamp.rows == 1
+    assert reader.poll() is None
+
+
+def test_backoff_delays_double_up_to_cap():
+    """Delays double from the base up to the cap, scaled by the jitter."""
+    assert backoff_delays(4, 1.0, 5.0, uniform=lambda: 1.0) == [1.0, 2.0, 4.0, 5.0]
+    assert backoff_delays(2, 1.0, 5.0, uniform=lambda: 0.5) == [0.5, 1.0]
+    assert backoff_delays(0, 1.0, 5.0) == []
+
+
+@pytest.mark.asyncio
+async def test_only_the_leader_refreshes_and_followers_follow(tmp_path):
+    """A scheduled refresh runs once per host and the others get its version."""
+    path = str(tmp_path / "trends")
+    leader, follower = Worker(path), Worker(path)
+    assert leader.coordinator.elect()
+    assert not follower.coordinator.elect()
+
+    table = await leader.coordinator.scheduled_refresh()
+    assert await follower.coordinator.scheduled_refresh() is None
+    assert leader.refreshes == [True] and follower.refreshes == []
+    assert sample("trend_refresh_version_info", version=table.version) == 1
+
+    await follower.coordinator.tick()
+    await follower.coordinator.tick()
+    assert follower.followed == [table.version]
+
+    # The leader exits; the next follower to tick takes over
+    leader.coordinator.resign()
+    await follower.coordinator.tick()
+    assert follower.coordinator.is_leader
+    follower.coordinator.resign()
+
+
+@pytest.mark.asyncio
+async def test_failed_refresh_is_retried_with_backoff(tmp_path):
+    """Failures are retried after growing delays until one attempt succeeds."""
+    worker = Worker(str(tmp_path / "trends"), failures=2)
+    retries = sample("trend_refresh_retries_total", trigger="scheduled")
+
+    assert await worker.coordinator.scheduled_refresh()
+    assert len(worker.refreshes) == 3
+    assert len(worker.sleeps) == 2
+    assert 0 <= worker.sleeps[0] <= 1.0 and 0 <= worker.sleeps[1] <= 2.0
+    assert sample("trend_refresh_retries_total", trigger="scheduled") == retries + 2
+
+    # Out of retries: the scheduled run logs and gives up until the next one
+    worker.failures = 10
+    assert await worker.coordinator.scheduled_refresh() is None
+    assert worker.failures == 6
+    with pytest.raises(RuntimeError):
+        await worker.coordinator.refresh("manual")
+    worker.coordinator.resign()
+
+
+@pytest.mark.asyncio
+async def test_follower_attaches_to_the_leaders_snapshot(tmp_path, monkeypatch):
+    """Following an announced version maps the snapshot instead of reloading."""
+    path = tmp_path / "trends.csv"
+    path.write_text(",".join(COLUMNS) + "\n" + f"2025-02-09,US,toys,,{',0.1' * 6}\n")
+    monkeypatch.setattr(database, "source", CSVSource(str(path)))
+    snapshot_path = str(tmp_path / "trends.snapshot")
+    monkeypatch.setattr(database, "shared_snapshot", SharedSnapshot(snapshot_path))
+    monkeypatch.setattr(database, "_refresh", None)
+    published = database.refresh_trends(force_refresh=True)
+    stamp = VersionFile(str(tmp_path / "trends.version")).write(published)
+
+    # Another worker, with older data cached
+    monkeypatch.setattr(database, "shared_snapshot", SharedSnapshot(snapshot_path))
+    cache.set(make_table(0.25))
+    loads = []
+    monkeypatch.setattr(database, "load_trends", lambda: loads.append(1))
+    await database.follow_version(stamp)
+    assert cache.latest().version == published.version
+    assert loads == []
@@ -0,0 +1,99 @@
+"""Unit tests for the country and category cube."""
+
+import numpy as np
+import pytest
+from app.cube import CategoryCube
+from app.store import TrendTable
+
+ALL = "all"
+
+
+def make_record(day, country, level_1, level_2, level_3, weekly):
+    return {
+        "event_date": day,
+        "campaign_country": country,
+        "product_category_level_1": level_1,
+        "product_category_level_2": level_2,
+        "product_category_level_3": level_3,
+        "revenue_weekly_change": weekly,
+    }
+
+
+@pytest.fixture
+def table():
+    return TrendTable.from_records(
+        [
+            make_record("2025-02-09", "US", "home", "lighting", "lamps", 0.4),
+            make_record("2025-02-09", "UK", "home", "lighting", "lamps", -0.2),
+            make_record("2025-02-09", "UK", "home", "lighting", "bulbs", 0.6),
+            make_record("2025-02-09", "UK", "home", "decor", "rugs", -0.5),
+            make_record("2025-02-09", "UK", "toys", "games", "puzzles", 0.1),
+            # Older day, left out of the aggregates
+            make_record("2025-02-08", "UK", "toys", "games", "puzzles", 9.0),
+        ]
+    )
+
+
+def test_roll_ups(table):
+    """Every roll-up averages the rows of the latest day beneath it."""
+    cube = CategoryCube.build(table)
+    assert cube.event_date == "2025-02-09"
+
+    root = cube.node((ALL, ALL, ALL, ALL))
+    assert root["count"] == 5 and root["gainers"] == 3 and root["losers"] == 2
+    assert root["mean"]["revenue_weekly_change"] == pytest.approx(0.08)
+
+    uk_home = cube.node(("UK", "home", ALL, ALL))
+    assert uk_home["count"] == 3
+    assert uk_home["mean"]["revenue_weekly_change"] == pytest.approx(-0.1 / 3)
+
+    lighting = cube.node((ALL, "home", "lighting", ALL))
+    assert lighting["mean"]["revenue_weekly_change"] == pytest.approx(0.8 / 3)
+    assert cube.node(("US", "home", "lighting", "lamps"))["count"] == 1
+
+    with pytest.raises(KeyError):
+        cube.node(("US", "toys", ALL, ALL))
+
+
+def test_drill_down(table):
+    """Children are one level down and ranked best first."""
+    cube = CategoryCube.build(table)
+    node, children = cube.drill_down(("UK", "home", ALL, ALL))
+    assert node["level1"] == "home"
+    assert [child["level2"] for child in children] == ["lighting", "decor"]
+
+    _, leaves = cube.drill_down(("UK", "home", "lighting", ALL))
+    assert [leaf["level3"] for leaf in leaves] == ["bulbs", "lamps"]
+    assert cube.drill_down(("UK", "home", "lighting", "bulbs"))[1] == []
+
+    # toys averages 0.1 and home 0.075
+    _, top_level = cube.drill_down((ALL, ALL, ALL, ALL))
+    assert [child["level1"] for child in top_level] == ["toys", "home"]
+
+
+def test_matches_full_scan(table):
+    """Each node's mean equals a direct filter over the latest day."""
+    cube = CategoryCube.build(table)
+    latest = table.mask(event_date="2025-02-09")
+    weekly = table.metric("revenue_weekly_change")
+    for key in cube.keys:
+        where = latest.copy()
+        for column, value in zip(
+            (
+                "campaign_country",
+                "product_category_level_1",
+                "product_category_level_2",
+                "product_category_level_3",
+            ),
+            key,
+        ):
+            if value != ALL:
+                where &= table.mask(**{column: value})
+        assert cube.node(key)["count"] == where.sum()
+        assert np.isclose(
+            cube.node(key)["mean"]["revenue_weekly_change"], weekly[where].mean()
+        )
+
+
+def test_empty_table():
+    assert len(CategoryCube.build(TrendTable.empty())) == 0
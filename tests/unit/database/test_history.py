@@ -0,0 +1,103 @@
+"""Unit tests for the per-category history store."""
+
+import numpy as np
+import pytest
+from datetime import date
+from app.history import HistoryStore, downsample, sparkline_path
+from app.store import TrendTable
+
+KEY = ("US", "toys", "games", "puzzles")
+
+
+def day_table(day: str, change: float, **dimensions: str) -> TrendTable:
+    return TrendTable.from_records(
+        [
+            {
+                "event_date": day,
+                "campaign_country": dimensions.get("country", "US"),
+                "product_category_level_1": "toys",
+                "product_category_level_2": "games",
+                "product_category_level_3": "puzzles",
+                "revenue_weekly_change": change,
+            }
+        ]
+    )
+
+
+def test_record_and_series():
+    """Days are stored per key and missing days read as NaN."""
+    store = HistoryStore(retention_days=7)
+    store.record(day_table("2025-02-01", 0.1))
+    store.record(day_table("2025-02-03", 0.3))
+    store.record(day_table("2025-02-03", 0.2, country="UK"))
+
+    dates, values = store.series(KEY, "revenue_weekly_change", days=3)
+    assert dates == [date(2025, 2, 1), date(2025, 2, 2), date(2025, 2, 3)]
+    assert np.allclose(values, [0.1, np.nan, 0.3], equal_nan=True)
+    assert store.series(("UK",) + KEY[1:], "revenue_weekly_change", 1)[1][0] == (
+        pytest.approx(0.2)
+    )
+    with pytest.raises(KeyError):
+        store.series(("FR",) + KEY[1:], "revenue_weekly_change")
+    with pytest.raises(KeyError):
+        store.series(KEY, "event_date")
+
+
+def test_rows_without_an_iso_date_are_skipped():
+    """Rows whose event_date is not a date are not stored at a bogus day."""
+    store = HistoryStore(retention_days=7)
+    assert store.record(day_table("last week", 0.1)) == 0
+    assert store.latest_day is None
+    with pytest.raises(KeyError):
+        store.series(KEY, "revenue_weekly_change")
+
+    store.record(
+        TrendTable.concat([day_table("2025-02-03", 0.3), day_table("n/a", 0.9)])
+    )
+    dates, values = store.series(KEY, "revenue_weekly_change", days=1)
+    assert dates == [date(2025, 2, 3)] and np.allclose(values, [0.3])
+
+
+def test_ring_buffer_drops_days_outside_retention():
+    """Slots are reused once their day leaves the retention window."""
+    store = HistoryStore(retention_days=3)
+    for day in range(1, 6):
+        store.record(day_table(f"2025-02-0{day}", day / 10))
+    # Too old to keep
+    assert store.record(day_table("2025-02-01", 9.0)) == 0
+
+    dates, values = store.series(KEY, "revenue_weekly_change", days=10)
+    assert dates[0] == date(2025, 2, 3) and store.latest_day == date(2025, 2, 5)
+    assert np.allclose(values, [0.3, 0.4, 0.5])
+
+
+def test_save_and_open(tmp_path):
+    """A saved store is reopened memory-mapped and can keep recording."""
+    path = str(tmp_path / "history")
+    store = HistoryStore(retention_days=5)
+    store.record(day_table("2025-02-01", 0.1))
+    store.save(path)
+
+    reopened = HistoryStore.open(path, retention_days=5)
+    assert reopened.keys == store.keys
+    reopened.record(day_table("2025-02-02", 0.2, country="UK"))
+    assert np.allclose(
+        reopened.series(KEY, "revenue_weekly_change", 2)[1],
+        [0.1, np.nan],
+        equal_nan=True,
+    )
+    # Recording is copy-on-write until the store is saved again
+    assert len(HistoryStore.open(path, retention_days=5)) == 1
+    assert len(HistoryStore.open(path, retention_days=9)) == 0
+    assert len(HistoryStore.open(str(tmp_path / "missing"))) == 0
+
+
+def test_downsample_and_sparkline():
+    values = np.array([1.0, 3.0, np.nan, np.nan, 5.0, 7.0])
+    ends, means = downsample(values, 3)
+    assert ends.tolist() == [1, 3, 5]
+    assert np.allclose(means, [2.0, np.nan, 6.0], equal_nan=True)
+    assert downsample(values, 10)[1] is values
+
+    assert sparkline_path(means, 100, 10) == "M0.0,10.0 l0,0 M100.0,0.0 l0,0"
+    assert sparkline_path(np.array([np.nan]), 100, 10) == ""
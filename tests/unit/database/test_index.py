@@ -0,0 +1,76 @@
+"""Unit tests for the (category, country) partition index."""
+
+import pytest
+from app.index import PartitionIndex
+from app.store import TrendTable
+
+
+def make_record(country, level_1, weekly, level_3):
+    return {
+        "campaign_country": country,
+        "product_category_level_1": level_1,
+        "product_category_level_3": level_3,
+        "revenue_weekly_change": weekly,
+    }
+
+
+@pytest.fixture
+def index():
+    table = TrendTable.from_records(
+        [
+            make_record("US", "electronics", 0.2, "a"),
+            make_record("US", "toys", 0.9, "b"),
+            make_record("US", "electronics", -0.4, "c"),
+            make_record("UK", "electronics", 0.5, "d"),
+            make_record("US", "electronics", 0.6, "e"),
+            make_record("US", "toys", -0.1, "f"),
+            make_record("US", "toys", 0.0, "g"),
+        ]
+    )
+    return PartitionIndex.build(table)
+
+
+def leaves(rows):
+    return [r.product_category_level_3 for r in rows]
+
+
+def test_category_partitions(index):
+    assert leaves(index.gainers("electronics", "US")) == ["e", "a"]
+    assert leaves(index.losers("electronics", "US")) == ["c"]
+    assert leaves(index.gainers("electronics", "UK")) == ["d"]
+    assert leaves(index.losers("electronics", "UK")) == []
+
+
+def test_all_categories_partition(index):
+    assert leaves(index.gainers("all", "US")) == ["b", "e", "a"]
+    assert leaves(index.losers("all", "US")) == ["c", "f"]
+
+
+def test_limit(index):
+    assert leaves(index.gainers("all", "US", limit=1)) == ["b"]
+
+
+def test_matches_full_scan(index):
+    table = index.table
+    for category in ["all", "electronics", "toys"]:
+        for country in ["US", "UK"]:
+            where = table.mask(campaign_country=country)
+            if category != "all":
+                where &= table.mask(product_category_level_1=category)
+            for ascending in (True, False):
+                expected = table.ranked(
+                    "revenue_weekly_change", ascending=ascending, where=where
+                )
+                partition = index.lookup(category, country)
+                found = partition.losers if ascending else partition.gainers
+                assert found.tolist() == expected.tolist()
+
+
+def test_unknown_pair_is_empty(index):
+    assert index.gainers("garden", "US") == []
+    assert index.losers("all", "FR") == []
+
+
+def test_empty_table():
+    index = PartitionIndex.build(TrendTable.empty())
+    assert index.gainers("all", "US") == []
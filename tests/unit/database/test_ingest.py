@@ -0,0 +1,128 @@
+"""Unit tests for streaming CSV ingestion."""
+
+import io
+import pytest
+from app.ingest import IngestSchemaError, read_trend_rows
+from app.store import COLUMNS
+
+HEADER = ",".join(COLUMNS)
+
+
+def csv_text(*rows):
+    return io.StringIO("\n".join([HEADER, *rows]) + "\n")
+
+
+def test_parses_typed_columns():
+    result = read_trend_rows(
+        csv_text(
+            "2025-02-09,US,electronics,audio,headphones,0.1,0.2,0.3,0.4,0.5,0.6",
+            "2025-02-09,UK,electronics,audio,speakers,-1,-2,-3,-4,-5,-6",
+        )
+    )
+    table = result.table
+    assert result.rows_read == result.rows_loaded == 2
+    assert result.error_count == 0
+    assert table.dimensions["product_category_level_1"].values == ("electronics",)
+    assert table.metric("commission_monthly_change").tolist() == [0.6, -6.0]
+    assert table[1].campaign_country == "UK"
+
+
+def test_reports_malformed_rows_instead_of_zero():
+    result = read_trend_rows(
+        csv_text(
+            "2025-02-09,US,electronics,audio,headphones,0.1,0.2,0.3,0.4,0.5,0.6",
+            "2025-02-09,US,electronics,audio,speakers,oops,0.2,0.3,0.4,0.5,0.6",
+            "2025-02-09,US,electronics,audio,radios,0.1,,0.3,0.4,0.5,0.6",
+            "2025-02-09,US,electronics,audio,tapes,0.1,0.2,nan,0.4,0.5,0.6",
+            "2025-02-09,US,too,short",
+            "",
+            "2025-02-09,US,electronics,audio,cables,1,2,3,4,5,6",
+        ),
+        chunk_size=3,
+    )
+    assert result.rows_read == 6
+    assert result.rows_loaded == 2
+    assert [r.product_category_level_3 for r in result.table] == [
+        "headphones",
+        "cables",
+    ]
+    errors = sorted(result.errors, key=lambda e: e.row)
+    assert [(e.row, e.column, e.value) for e in errors] == [
+        (2, "revenue_daily_change", "oops"),
+        (3, "revenue_weekly_change", ""),
+        (4, "revenue_monthly_change", "nan"),
+        (5, None, None),
+    ]
+    assert errors[-1].reason == "expected 11 fields, found 4"
+
+
+def test_quoted_fields():
+    result = read_trend_rows(
+        csv_text(
+            '2025-02-09,US,bags,"handbags, wallets",wallets,1,2,3,4,5,6',
+            '2025-02-09,US,bags,"say ""hi""","multi\nline",1,2,3,4,5,6\r',
+            "2025-02-09,US,bags,handbags,wallets,1,2,3,4,5,6",
+        ),
+        chunk_size=1,
+    )
+    assert result.error_count == 0
+    level_2 = result.table.dimensions["product_category_level_2"]
+    assert level_2.values == ("handbags, wallets", 'say "hi"', "handbags")
+    assert result.table[1].product_category_level_3 == "multi\nline"
+
+
+def test_long_and_short_rows_do_not_shift_columns():
+    """A row with an extra field and one missing a field are both rejected."""
+    result = read_trend_rows(
+        csv_text(
+            "2025-02-09,US,electronics,audio,headphones,0.1,0.2,0.3,0.4,0.5,0.6,7",
+            "2025-02-09,US,electronics,audio,0.1,0.2,0.3,0.4,0.5,0.6",
+            "2025-02-09,UK,electronics,audio,speakers,1,2,3,4,5,6",
+        )
+    )
+    assert result.error_count == 2
+    assert [e.row for e in result.errors] == [1, 2]
+    assert [row.event_date for row in result.table] == ["2025-02-09"]
+
+
+def test_row_numbers_count_records_not_lines():
+    """A quoted newline in a rejected block does not skew later row numbers."""
+    result = read_trend_rows(
+        csv_text(
+            "2025-02-09,US,too,short",
+            '2025-02-09,US,bags,"multi\nline",wallets,1,2,3,4,5,6',
+            "2025-02-09,US,bags,handbags,wallets,1,2,3,4,5,6",
+            "2025-02-09,US,bags,handbags,wallets,x,2,3,4,5,6",
+        ),
+        chunk_size=2,
+    )
+    assert result.rows_read == 4
+    assert [e.row for e in result.errors] == [1, 4]
+
+
+def test_error_details_are_capped():
+    bad_row = "2025-02-09,US,a,b,c,x,0,0,0,0,0"
+    result = read_trend_rows(csv_text(*[bad_row] * 5), max_errors=2)
+    assert result.error_count == 5
+    assert len(result.errors) == 2
+
+
+def test_column_order_follows_header():
+    columns = list(reversed(COLUMNS))
+    values = {c: "1.5" for c in COLUMNS}
+    values.update(event_date="2025-02-09", campaign_country="US")
+    text = ",".join(columns) + "\n" + ",".join(values[c] for c in columns) + "\n"
+    table = read_trend_rows(io.StringIO(text)).table
+    assert table[0].campaign_country == "US"
+    assert table[0].revenue_daily_change == 1.5
+
+
+def test_missing_columns_raise():
+    with pytest.raises(IngestSchemaError, match="revenue_daily_change"):
+        read_trend_rows(io.StringIO("event_date,campaign_country\n"))
+
+
+def test_empty_input():
+    result = read_trend_rows(csv_text())
+    assert result.rows_read == 0
+    assert len(result.table) == 0
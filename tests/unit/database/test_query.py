@@ -0,0 +1,184 @@
+"""Unit tests for the bitmap-indexed trend query engine."""
+
+import numpy as np
+import pytest
+
+from app.index import PartitionIndex
+from app.query import (
+    DENSE_FRACTION,
+    BitmapIndex,
+    Range,
+    TrendQuery,
+    parse_range,
+    parse_sort,
+)
+from app.store import TrendTable
+
+
+def make_record(country, level_1, level_2, weekly, commission, leaf):
+    return {
+        "campaign_country": country,
+        "product_category_level_1": level_1,
+        "product_category_level_2": level_2,
+        "product_category_level_3": leaf,
+        "revenue_weekly_change": weekly,
+        "commission_monthly_change": commission,
+    }
+
+
+@pytest.fixture
+def bitmaps():
+    table = TrendTable.from_records(
+        [
+            make_record("US", "electronics", "phones", 0.3, -0.1, "a"),
+            make_record("UK", "electronics", "phones", 0.25, 0.2, "b"),
+            make_record("DE", "toys", "games", 0.5, -0.3, "c"),
+            make_record("US", "toys", "games", -0.2, -0.1, "d"),
+            make_record("UK", "electronics", "laptops", 0.1, -0.5, "e"),
+            make_record("FR", "electronics", "laptops", -0.4, 0.1, "f"),
+        ]
+    )
+    return BitmapIndex.build(table)
+
+
+def leaves(table, rows):
+    return [table.value("product_category_level_3", int(row)) for row in rows]
+
+
+def test_parse_range():
+    assert parse_range("revenue_weekly_change>0.2") == Range(
+        "revenue_weekly_change", ">", 0.2
+    )
+    assert parse_range(" commission_monthly_change <= -5% ").value == -0.05
+    assert str(parse_range("trend_score=1")) == "trend_score=1.0"
+    for invalid in ("revenue_weekly_change>", "event_date>1", "x>1", "a>>1"):
+        with pytest.raises(ValueError):
+            parse_range(invalid)
+
+
+def test_parse_sort():
+    assert parse_sort(None) == (None, False)
+    assert parse_sort("-revenue_weekly_change") == ("revenue_weekly_change", True)
+    assert parse_sort("trend_score") == ("trend_score", False)
+    with pytest.raises(ValueError):
+        parse_sort("campaign_country")
+
+
+def test_query_is_canonical():
+    query = TrendQuery.create(
+        {"campaign_country": ["UK", "US", "UK"], "product_category_level_1": ["all"]}
+    )
+    assert query == TrendQuery.create({"campaign_country": ["US", "UK"]})
+    assert query.values("campaign_country") == ("UK", "US")
+    assert hash(query) == hash(TrendQuery.create({"campaign_country": ["US", "UK"]}))
+    with pytest.raises(ValueError):
+        TrendQuery.create({"revenue_weekly_change": ["1"]})
+
+
+def test_partition():
+    assert TrendQuery.create({"campaign_country": ["US"]}).partition() == ("all", "US")
+    assert TrendQuery.create(
+        {"campaign_country": ["US"], "product_category_level_1": ["toys"]}
+    ).partition() == ("toys", "US")
+    assert TrendQuery.create({"campaign_country": ["US", "UK"]}).partition() is None
+    assert TrendQuery.create({}).partition() is None
+    assert (
+        TrendQuery.create(
+            {"campaign_country": ["US"]}, [parse_range("revenue_weekly_change>0")]
+        ).partition()
+        is None
+    )
+
+
+def test_multi_valued_and_range_filters(bitmaps):
+    table = bitmaps.table
+    query = TrendQuery.create(
+        {"campaign_country": ["US", "UK"], "product_category_level_1": ["electronics"]},
+        [
+            parse_range("revenue_weekly_change>20%"),
+            parse_range("commission_monthly_change<0"),
+        ],
+    )
+    assert leaves(table, bitmaps.rows(query)) == ["a"]
+    assert bitmaps.count(query) == 1
+
+    query = TrendQuery.create({"product_category_level_2": ["laptops", "games"]})
+    assert leaves(table, bitmaps.rows(query)) == ["c", "d", "e", "f"]
+    assert leaves(table, bitmaps.rows(TrendQuery())) == list("abcdef")
+    assert bitmaps.rows(TrendQuery.create({"campaign_country": ["JP"]})).size == 0
+
+
+def test_sort(bitmaps):
+    table = bitmaps.table
+    query = TrendQuery.create(
+        {"product_category_level_1": ["electronics"]},
+        sort="revenue_weekly_change",
+        descending=True,
+    )
+    assert leaves(table, bitmaps.rows(query)) == ["a", "b", "e", "f"]
+    query = TrendQuery.create(sort="commission_monthly_change")
+    assert leaves(table, bitmaps.rows(query)) == ["e", "c", "a", "d", "f", "b"]
+
+
+def test_matches_full_scan():
+    rng = np.random.default_rng(7)
+    countries = ["US", "UK", "DE", "FR"]
+    categories = [f"c{i}" for i in range(40)]
+    table = TrendTable.from_records(
+        make_record(
+            rng.choice(countries),
+            rng.choice(categories),
+            "x",
+            rng.normal(),
+            rng.normal(),
+            str(i),
+        )
+        for i in range(2000)
+    )
+    bitmaps = BitmapIndex.build(table)
+    # Both representations are in use: dense countries, sparse categories
+    assert bitmaps.bitmaps["campaign_country"]
+    assert bitmaps.row_lists["product_category_level_1"]
+    assert all(
+        len(rows) * DENSE_FRACTION <= len(table)
+        for rows in bitmaps.row_lists["product_category_level_1"].values()
+    )
+
+    query = TrendQuery.create(
+        {
+            "campaign_country": ["US", "FR"],
+            "product_category_level_1": categories[:5],
+        },
+        [parse_range("revenue_weekly_change>=0.1")],
+    )
+    where = (
+        np.isin(table.dimensions["campaign_country"].decode(), ["US", "FR"])
+        & np.isin(table.dimensions["product_category_level_1"].decode(), categories[:5])
+        & (table.metric("revenue_weekly_change") >= 0.1)
+    )
+    assert bitmaps.rows(query).tolist() == np.flatnonzero(where).tolist()
+
+
+def test_ranked_matches_partition_index(bitmaps):
+    index = PartitionIndex.build(bitmaps.table)
+    for category in ("all", "electronics", "toys"):
+        for country in ("US", "UK", "DE"):
+            query = TrendQuery.create(
+                {"product_category_level_1": [category], "campaign_country": [country]}
+            )
+            for ascending, expected in (
+                (False, index.gainers(category, country)),
+                (True, index.losers(category, country)),
+            ):
+                assert [r.product_category_level_3 for r in expected] == [
+                    r.product_category_level_3
+                    for r in bitmaps.ranked(query, ascending=ascending)
+                ]
+
+
+def test_empty_table():
+    bitmaps = BitmapIndex.build(TrendTable.empty())
+    query = TrendQuery.create(
+        {"campaign_country": ["US"]}, [parse_range("trend_score>0")], "trend_score"
+    )
+    assert bitmaps.rows(query).size == 0
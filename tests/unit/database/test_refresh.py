@@ -0,0 +1,236 @@
+"""Unit tests for stale-while-revalidate and single-flight refreshes."""
+
+import asyncio
+import sqlite3
+import threading
+import pytest
+from datetime import datetime, timedelta
+from prometheus_client import REGISTRY
+from app import database
+from app.database import cache, fetch_trends
+from app.snapshot import SharedSnapshot
+from app.sources import CSVSource, ShardedSource, SQLiteSource
+from app.store import COLUMNS, TrendTable
+
+
+def sample(name: str) -> float:
+    return REGISTRY.get_sample_value(name) or 0.0
+
+
+def make_table(change: float) -> TrendTable:
+    return TrendTable.from_records(
+        [{"campaign_country": "US", "revenue_weekly_change": change}]
+    )
+
+
+@pytest.fixture
+def slow_refresh(monkeypatch):
+    """Replace the source reload with one that blocks until released."""
+    release = threading.Event()
+    calls = []
+    fresh = make_table(0.5)
+
+    def refresh(force_refresh: bool = False, incremental: bool = False) -> TrendTable:
+        calls.append(force_refresh)
+        release.wait(5)
+        cache.set(fresh)
+        return fresh
+
+    monkeypatch.setattr(database, "refresh_trends", refresh)
+    monkeypatch.setattr(database, "_refresh", None)
+    return release, calls, fresh
+
+
+@pytest.mark.asyncio
+async def test_stale_data_served_during_single_refresh(slow_refresh):
+    """Concurrent requests get expired data while one refresh runs."""
+    release, calls, fresh = slow_refresh
+    stale = make_table(0.25)
+    cache.set(stale, timestamp=datetime.now() - cache.expiry_time - timedelta(1e-3))
+    stale_serves = sample("trend_cache_stale_serves_total")
+    coalesced = sample("trend_cache_refreshes_coalesced_total")
+
+    results = await asyncio.gather(*(fetch_trends() for _ in range(10)))
+
+    assert all(result is stale for result in results)
+    assert sample("trend_cache_stale_serves_total") == stale_serves + 10
+    assert sample("trend_cache_refreshes_coalesced_total") == coalesced + 9
+
+    release.set()
+    task = database._refresh[0]
+    await task
+    assert calls == [False]
+    assert await fetch_trends() is fresh
+
+
+@pytest.mark.asyncio
+async def test_requests_wait_past_hard_staleness_limit(slow_refresh, monkeypatch):
+    """Data older than the hard limit is not served; callers share a refresh."""
+    release, calls, fresh = slow_refresh
+    monkeypatch.setattr(database.settings, "max_stale_seconds", 60.0)
+    cache.set(make_table(0.25), timestamp=datetime.now() - timedelta(hours=1))
+
+    waiting = asyncio.gather(*(fetch_trends() for _ in range(3)))
+    await asyncio.sleep(0.05)
+    release.set()
+
+    assert all(result is fresh for result in await waiting)
+    assert calls == [False]
+
+
+@pytest.mark.asyncio
+async def test_forced_refresh_does_not_join_unforced(slow_refresh):
+    """A forced refresh re-reads the source after an unforced one finishes."""
+    release, calls, fresh = slow_refresh
+
+    unforced = asyncio.create_task(fetch_trends())
+    await asyncio.sleep(0.05)
+    forced = asyncio.create_task(fetch_trends(force_refresh=True))
+    await asyncio.sleep(0.05)
+    release.set()
+
+    assert await unforced is fresh
+    assert await forced is fresh
+    assert calls == [False, True]
+
+
+def test_incremental_refresh_merges_rows_since_watermark(tmp_path, monkeypatch):
+    """Only rows from the latest cached day onwards are read and merged."""
+    path = str(tmp_path / "trends.db")
+    connection = sqlite3.connect(path)
+    connection.execute(f"CREATE TABLE trends ({', '.join(COLUMNS)})")
+
+    def insert(day, country, change):
+        record = dict.fromkeys(COLUMNS, 0.0)
+        record.update(event_date=day, campaign_country=country)
+        record.update(product_category_level_1="toys", revenue_weekly_change=change)
+        record.update(product_category_level_2="", product_category_level_3="")
+        connection.execute(
+            f"INSERT INTO trends VALUES ({', '.join('?' * len(COLUMNS))})",
+            tuple(record.values()),
+        )
+        connection.commit()
+
+    insert("2025-02-08", "US", 0.1)
+    insert("2025-02-09", "US", 0.2)
+    source = SQLiteSource(path)
+    monkeypatch.setattr(database, "source", source)
+    monkeypatch.setattr(database, "shared_snapshot", None)
+    base = database.refresh_trends(incremental=True)  # Nothing cached: full load
+    assert len(base) == 2
+
+    loaded = []
+    load_since = source.load_since
+    monkeypatch.setattr(
+        source, "load_since", lambda w, **kw: loaded.append(w) or load_since(w, **kw)
+    )
+    connection.execute("UPDATE trends SET revenue_weekly_change = -0.5")
+    insert("2025-02-10", "UK", 0.3)
+
+    merged = database.refresh_trends(incremental=True)
+    assert loaded == ["2025-02-09"]
+    records = [(r.event_date, r.revenue_weekly_change) for r in merged]
+    # The older day keeps its cached value; the latest day is re-read
+    assert records == [("2025-02-09", -0.5), ("2025-02-10", 0.3), ("2025-02-08", 0.1)]
+    assert merged.version != base.version
+    assert cache.get() is merged
+    assert cache.index_for(merged).gainers("all", "UK")[0].revenue_weekly_change == 0.3
+    connection.close()
+    source.close()
+
+
+def test_incremental_refresh_applies_changed_and_deleted_shards(tmp_path, monkeypatch):
+    """Shards changed or deleted are applied whatever the dates of their rows."""
+
+    def write_shard(country, *rows):
+        path = tmp_path / country / "trends.csv"
+        path.parent.mkdir(exist_ok=True)
+        lines = [f"{day},{country},toys,,,0,{change},0,0,0,0" for day, change in rows]
+        path.write_text("\n".join([",".join(COLUMNS), *lines]) + "\n")
+        return path
+
+    write_shard("US", ("2025-02-09", 0.2))
+    write_shard("DE", ("2025-02-07", 0.1))
+    uk = write_shard("UK", ("2025-02-08", 0.3))
+    monkeypatch.setattr(database, "source", ShardedSource(str(tmp_path), workers=1))
+    monkeypatch.setattr(database, "shared_snapshot", None)
+    cache.clear()
+    assert len(database.refresh_trends(incremental=True)) == 3
+
+    write_shard("DE", ("2025-02-07", -0.4), ("2025-02-06", 0.05))
+    uk.unlink()
+    merged = database.refresh_trends(incremental=True)
+    records = [(r.campaign_country, r.revenue_weekly_change) for r in merged]
+    assert records == [("DE", -0.4), ("US", 0.2), ("DE", 0.05)]
+
+
+def test_warm_start_revalidates_against_source(tmp_path, monkeypatch):
+    """A restarted worker serves the snapshot, reloading only if the source changed."""
+    path = tmp_path / "trends.csv"
+
+    def write_rows(*countries: str) -> None:
+        rows = [f"2025-02-09,{country},toys,,{',0.1' * 6}" for country in countries]
+        path.write_text("\n".join([",".join(COLUMNS), *rows]) + "\n")
+
+    write_rows("US")
+    monkeypatch.setattr(database, "source", CSVSource(str(path)))
+    snapshot_path = str(tmp_path / "trends.snapshot")
+    monkeypatch.setattr(database, "shared_snapshot", SharedSnapshot(snapshot_path))
+    cache.clear()
+    assert not database.warm_start()
+    published = database.refresh_trends(force_refresh=True)
+
+    # A new worker on the same host, after a restart
+    monkeypatch.setattr(database, "shared_snapshot", SharedSnapshot(snapshot_path))
+    cache.clear()
+    booted = datetime.now()
+    assert database.warm_start()
+    assert cache.get().version == published.version
+    loads = []
+    load_trends = database.load_trends
+    monkeypatch.setattr(
+        database, "load_trends", lambda: loads.append(1) or load_trends()
+    )
+    database.revalidate_trends(booted)
+    assert loads == []
+
+    write_rows("US", "UK")
+    assert len(database.revalidate_trends(booted)) == 2
+    assert loads == [1]
+    # Published with the new fingerprint, so it is current from now on
+    database.revalidate_trends(booted)
+    assert loads == [1]
+    cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_published_snapshot_is_attached_off_the_event_loop(tmp_path, monkeypatch):
+    """A worker indexes another's snapshot in a thread, serving its data meanwhile."""
+    path = tmp_path / "trends.csv"
+    path.write_text(",".join(COLUMNS) + "\n" + f"2025-02-09,US,toys,,{',0.1' * 6}\n")
+    monkeypatch.setattr(database, "source", CSVSource(str(path)))
+    snapshot_path = str(tmp_path / "trends.snapshot")
+    monkeypatch.setattr(database, "shared_snapshot", SharedSnapshot(snapshot_path))
+    monkeypatch.setattr(database, "_refresh", None)
+    published = database.refresh_trends(force_refresh=True)
+
+    # Another worker, with valid older data cached
+    monkeypatch.setattr(database, "shared_snapshot", SharedSnapshot(snapshot_path))
+    monkeypatch.setattr(database, "_attach", None)
+    cached = make_table(0.25)
+    cache.set(cached)
+    threads = []
+    cache_trends = database.cache_trends
+
+    def record_thread(table, timestamp=None):
+        threads.append(threading.current_thread())
+        cache_trends(table, timestamp)
+
+    monkeypatch.setattr(database, "cache_trends", record_thread)
+    results = await asyncio.gather(*(fetch_trends() for _ in range(3)))
+    assert all(result is cached for result in results)
+
+    await database._attach
+    assert len(threads) == 1 and threads[0] is not threading.main_thread()
+    assert (await fetch_trends()).version == published.version
+    cache.clear()
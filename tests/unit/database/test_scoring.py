@@ -0,0 +1,82 @@
+"""Unit tests for trend scoring."""
+
+import pytest
+from app.config import Settings
+from app.index import PartitionIndex
+from app.scoring import SCORE_COLUMN, ScoringRules, score_trends
+from app.store import TrendTable
+
+
+@pytest.fixture
+def table():
+    def row(level_3: str, daily: float, weekly: float, level_2: str = "games"):
+        return {
+            "campaign_country": "US",
+            "product_category_level_1": "toys",
+            "product_category_level_2": level_2,
+            "product_category_level_3": level_3,
+            "revenue_daily_change": daily,
+            "revenue_weekly_change": weekly,
+        }
+
+    return TrendTable.from_records(
+        [
+            row("puzzles", 1.0, 0.5),
+            row("dolls", 0.2, -0.4),
+            row("kites", 500.0, 0.1),
+            row("yoyos", 2.0, 0.001),
+            row("rosaries", 3.0, 0.9, level_2="Religious & Ceremonial"),
+        ]
+    )
+
+
+def test_rules_from_settings():
+    rules = ScoringRules.from_settings(
+        Settings(daily_change_weight=0.3, excluded_categories=["Toys"])
+    )
+    assert rules.daily_weight == 0.3 and rules.weekly_weight == 0.9
+    assert rules.excluded_categories == {"toys"}
+
+
+def test_score_trends(table):
+    """Scores are weighted, clamped and zeroed below the weekly minimum."""
+    rules = ScoringRules(
+        max_daily_change=100.0,
+        excluded_categories=frozenset({"religious & ceremonial"}),
+    )
+    scored = score_trends(table, rules)
+
+    assert scored.distinct("product_category_level_3") == [
+        "dolls",
+        "kites",
+        "puzzles",
+        "yoyos",
+    ]
+    scores = dict(
+        zip(
+            scored.dimensions["product_category_level_3"].decode(),
+            scored.metric(SCORE_COLUMN),
+        )
+    )
+    assert scores["puzzles"] == pytest.approx(0.1 * 1.0 + 0.9 * 0.5)
+    assert scores["dolls"] == pytest.approx(0.1 * 0.2 - 0.9 * 0.4)
+    assert scores["kites"] == pytest.approx(0.1 * 100.0 + 0.9 * 0.1)
+    assert scores["yoyos"] == 0.0
+    # Raw metrics are kept as loaded
+    assert scored.metric("revenue_daily_change").max() == 500.0
+
+
+def test_index_ranks_by_score(table):
+    """A scored table is ranked by score, an unscored one by weekly change."""
+    scored = score_trends(table, ScoringRules())
+    ranked = PartitionIndex.build(scored).gainers("all", "US")
+    assert [row.product_category_level_3 for row in ranked] == [
+        "kites",
+        "rosaries",
+        "puzzles",
+    ]
+    assert [row.trend_score for row in ranked] == sorted(
+        (row.trend_score for row in ranked), reverse=True
+    )
+    unscored = PartitionIndex.build(table).gainers("all", "US")
+    assert unscored[0].product_category_level_3 == "rosaries"
@@ -0,0 +1,146 @@
+"""Unit tests for the shared memory-mapped dataset snapshot."""
+
+import os
+import struct
+import pytest
+from app.snapshot import (
+    FORMAT_VERSION,
+    MAGIC,
+    PREAMBLE,
+    SharedSnapshot,
+    SnapshotError,
+    read_snapshot,
+    write_snapshot,
+)
+from app.store import TrendTable
+
+
+@pytest.fixture
+def table():
+    """A small trend table."""
+    return TrendTable.from_records(
+        [
+            {
+                "event_date": "2025-02-09",
+                "campaign_country": country,
+                "product_category_level_1": category,
+                "revenue_weekly_change": change,
+                "commission_daily_change": -change / 2,
+            }
+            for country, category, change in [
+                ("US", "Electronics", 0.25),
+                ("GB", "Toys", -0.5),
+                ("US", "Toys", 0.125),
+            ]
+        ]
+    )
+
+
+@pytest.fixture
+def path(tmp_path):
+    """Location for the snapshot file."""
+    return str(tmp_path / "trends.snapshot")
+
+
+def test_snapshot_round_trip(table, path):
+    """A read snapshot has the same rows and version as the written table."""
+    info = write_snapshot(table, path)
+    attached, read_info = read_snapshot(path)
+
+    assert attached.to_records() == table.to_records()
+    assert attached.version == table.version == info.version
+    assert read_info.rows == 3
+    assert read_info.created == info.created
+
+
+def test_snapshot_arrays_are_zero_copy(table, path):
+    """Columns are read-only views into the mapped file."""
+    write_snapshot(table, path)
+    attached, _ = read_snapshot(path)
+
+    metric = attached.metric("revenue_weekly_change")
+    assert not metric.flags.writeable
+    assert not metric.flags.owndata
+    assert not attached.dimensions["campaign_country"].codes.flags.writeable
+
+
+def test_empty_snapshot(path):
+    """An empty table can be published and attached."""
+    write_snapshot(TrendTable.empty(), path)
+    attached, info = read_snapshot(path)
+    assert len(attached) == 0
+    assert info.rows == 0
+
+
+def test_invalid_snapshot_raises(table, path):
+    """Bad magic and truncated files are rejected."""
+    with open(path, "wb") as f:
+        f.write(b"not a snapshot at all")
+    with pytest.raises(SnapshotError):
+        read_snapshot(path)
+
+    write_snapshot(table, path)
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 64)
+    with pytest.raises(SnapshotError):
+        read_snapshot(path)
+
+
+def test_malformed_header_is_ignored_by_poll(path):
+    """A header that parses but lacks fields is a SnapshotError, not a crash."""
+    header = b'{"columns": [{"name": "campaign_country"}]}'
+    with open(path, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)) + header)
+    with pytest.raises(SnapshotError, match="corrupt header"):
+        read_snapshot(path)
+    assert SharedSnapshot(path).poll() is None
+
+
+def test_poll_reattaches_after_publish(table, path):
+    """Workers attach once and pick up newly published snapshots."""
+    publisher, reader = SharedSnapshot(path), SharedSnapshot(path)
+    assert reader.poll() is None
+
+    with publisher.lock():
+        publisher.publish(table)
+    first, _ = reader.poll()
+    assert first.version == table.version
+    assert reader.poll() is None
+
+    smaller = table.select(table.mask(campaign_country="US"))
+    publisher.publish(smaller)
+    attached, info = reader.poll()
+    assert info.rows == 2
+    assert attached.version == smaller.version
+    # The previously attached table stays readable after the swap
+    assert first.to_records() == table.to_records()
+
+
+def test_snapshot_checksum_detects_corruption(table, path):
+    """Verified reads reject column data that no longer matches the header."""
+    info = write_snapshot(table, path, source="trends.csv:10:1")
+    _, read_info = read_snapshot(path, verify=True)
+    assert read_info.checksum == info.checksum
+    assert read_info.source == "trends.csv:10:1"
+
+    with open(path, "r+b") as f:
+        contents = f.read()
+        f.seek(contents.index(struct.pack("<d", 0.25)))
+        f.write(struct.pack("<d", 0.75))
+    read_snapshot(path)
+    with pytest.raises(SnapshotError):
+        read_snapshot(path, verify=True)
+    assert SharedSnapshot(path).poll(verify=True) is None
+
+
+def test_snapshot_checksum_covers_dimension_values(table, path):
+    """A corrupt dictionary value in the header fails verification."""
+    write_snapshot(table, path)
+    with open(path, "r+b") as f:
+        contents = f.read()
+        f.seek(contents.index(b'"Electronics"'))
+        f.write(b'"Electronicz"')
+    table, _ = read_snapshot(path)
+    assert "Electronicz" in table.distinct("product_category_level_1")
+    with pytest.raises(SnapshotError):
+        read_snapshot(path, verify=True)
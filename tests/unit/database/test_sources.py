@@ -0,0 +1,285 @@
+"""Unit tests for the pluggable trend data sources."""
+
+import csv
+import sqlite3
+import pytest
+from app import sources
+from app.config import Settings
+from app.ingest import read_trend_csv
+from app.sources import (
+    DEFAULT_CSV_PATH,
+    ClientPool,
+    CSVSource,
+    ParquetSource,
+    SQLiteClient,
+    ShardedSource,
+    SourceError,
+    SQLiteSource,
+    SourceTimeout,
+    create_source,
+    discover_shards,
+)
+from app.store import COLUMNS
+
+
+@pytest.fixture(scope="module")
+def example():
+    """The bundled example export as a table."""
+    return read_trend_csv(DEFAULT_CSV_PATH).table
+
+
+@pytest.fixture
+def sqlite_path(tmp_path, example):
+    """The example export loaded into a SQLite stand-in warehouse."""
+    path = str(tmp_path / "trends.db")
+    with sqlite3.connect(path) as connection:
+        connection.execute(f"CREATE TABLE trends ({', '.join(COLUMNS)})")
+        connection.executemany(
+            f"INSERT INTO trends VALUES ({', '.join('?' * len(COLUMNS))})",
+            [tuple(record.values()) for record in example.to_records()],
+        )
+    connection.close()
+    return path
+
+
+def test_csv_source(example):
+    """The CSV source reads the bundled export by default."""
+    result = CSVSource().load()
+    assert result.table.to_records() == example.to_records()
+
+
+def test_source_fingerprint_tracks_file_changes(tmp_path, sqlite_path):
+    """File fingerprints change when the file does; unknown sources have none."""
+    path = tmp_path / "trends.csv"
+    path.write_text("a\n")
+    source = CSVSource(str(path))
+    before = source.fingerprint()
+    assert before == source.fingerprint()
+    path.write_text("a\nb\n")
+    assert source.fingerprint() != before
+    assert CSVSource(str(tmp_path / "missing.csv")).fingerprint() is None
+
+    sqlite_source = SQLiteSource(sqlite_path)
+    before = sqlite_source.fingerprint()
+    with sqlite3.connect(sqlite_path) as connection:
+        connection.execute("DELETE FROM trends WHERE campaign_country = 'US'")
+    connection.close()
+    assert sqlite_source.fingerprint() != before
+    sqlite_source.close()
+
+
+def test_sqlite_source_streams_pages(sqlite_path, example):
+    """Rows paged out of SQLite build the same table as the CSV."""
+    source = SQLiteSource(sqlite_path, page_size=7)
+    result = source.load()
+    assert result.error_count == 0
+    assert result.table.to_records() == example.to_records()
+    assert result.table.version == example.version
+    source.close()
+
+
+def test_sqlite_source_rejects_null_metrics(sqlite_path):
+    """NULL metrics are reported with their row instead of loaded as zero."""
+    with sqlite3.connect(sqlite_path) as connection:
+        connection.execute(
+            "UPDATE trends SET revenue_daily_change = NULL WHERE rowid = 3"
+        )
+    connection.close()
+
+    result = SQLiteSource(sqlite_path, page_size=2).load()
+    assert result.error_count == 1
+    assert result.errors[0].row == 3
+    assert result.errors[0].column == "revenue_daily_change"
+
+
+def test_load_since_watermark(sqlite_path):
+    """Only rows on or after the watermark date are loaded."""
+    with sqlite3.connect(sqlite_path) as connection:
+        connection.execute(
+            "UPDATE trends SET event_date = '2025-02-10' WHERE rowid IN (2, 5)"
+        )
+    connection.close()
+
+    for source in (SQLiteSource(sqlite_path), CSVSource()):
+        result = source.load_since("2025-02-10")
+        expected = 2 if isinstance(source, SQLiteSource) else 0
+        assert len(result.table) == expected
+    assert len(CSVSource().load_since("2025-02-09").table) > 0
+
+
+def test_parquet_source(tmp_path, example):
+    """Parquet files are read batch by batch."""
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = str(tmp_path / "trends.parquet")
+    pq.write_table(pa.Table.from_pylist(example.to_records()), path)
+
+    result = ParquetSource(path, batch_size=10).load()
+    assert result.table.to_records() == example.to_records()
+
+
+def write_shards(directory, table, key="campaign_country"):
+    """Split a table into one CSV shard per value of ``key``."""
+    shards = {}
+    for record in table.to_records():
+        shards.setdefault(record[key], []).append(record)
+    for value, records in shards.items():
+        path = directory / value / "trends.csv"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(records)
+    return sorted(str(directory / value / "trends.csv") for value in shards)
+
+
+def test_discover_shards(tmp_path, example):
+    """Directories are searched recursively; globs are matched as given."""
+    paths = write_shards(tmp_path, example)
+    (tmp_path / "README.md").write_text("not a shard")
+    assert discover_shards(str(tmp_path)) == paths
+    assert discover_shards(str(tmp_path / "**" / "*.csv")) == paths
+    assert discover_shards(str(tmp_path / "US" / "*.csv")) == [paths[-1]]
+    assert discover_shards(str(tmp_path / "missing")) == []
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_sharded_source_merges_shards(tmp_path, example, workers):
+    """Shards parsed in parallel merge into the rows of the whole export."""
+    write_shards(tmp_path, example)
+    result = ShardedSource(str(tmp_path), workers=workers).load()
+    assert result.error_count == 0
+
+    def key(record):
+        return tuple(record.values())
+
+    assert sorted(result.table.to_records(), key=key) == sorted(
+        example.to_records(), key=key
+    )
+
+
+def test_sharded_source_skips_unchanged_shards(tmp_path, example, monkeypatch):
+    """Incremental loads parse only changed shards and report their old rows."""
+    paths = write_shards(tmp_path, example)
+    source = ShardedSource(str(tmp_path), workers=1)
+    first = source.load()
+    assert first.complete
+    fingerprint = source.fingerprint()
+
+    parsed = []
+    read_shard = sources.read_shard
+    monkeypatch.setattr(
+        sources,
+        "read_shard",
+        lambda path, *args: parsed.append(path) or read_shard(path, *args),
+    )
+    result = source.load_since("2025-02-10")
+    assert parsed == []
+    assert len(result.table) == 0 and len(result.removed) == 0
+
+    with open(paths[0], "a") as f:
+        f.write("2025-01-01,XX,a,b,c,1,2,3,4,5,6\n")
+    assert source.fingerprint() != fingerprint
+    result = source.load_since("2025-02-10")
+    assert parsed == [paths[0]]
+    assert not result.complete
+    # The shard's rows, including the one older than the watermark
+    assert len(result.table) == len(result.removed) + 1
+    assert "2025-01-01" in result.table.distinct("event_date")
+
+    # Loaded by someone else: everything is read again
+    parsed.clear()
+    result = source.load_since("2025-02-10", basis="other")
+    assert result.complete and len(parsed) == len(paths)
+    assert len(result.table) == len(first.table) + 1
+
+
+def test_sharded_source_reports_errors_per_shard(tmp_path, example):
+    """Rejected rows name their shard; an unreadable shard keeps its old rows."""
+    paths = write_shards(tmp_path, example)
+    source = ShardedSource(str(tmp_path), workers=1)
+    source.load()
+
+    with open(paths[1], "a") as f:
+        f.write("2025-02-10,XX,a,b,c,oops,2,3,4,5,6\n")
+    result = source.load_since("2025-02-10")
+    assert result.error_count == 1
+    assert result.errors[0].source == paths[1]
+    assert result.errors[0].row > 0
+
+    with open(paths[0], "w") as f:
+        f.write("event_date,campaign_country\n")
+    result = source.load_since("2025-02-10")
+    # Nothing to apply until the shard can be read again
+    assert len(result.table) == len(result.removed) == 0
+    assert [error.source for error in result.errors] == [paths[0]]
+    assert result.errors[0].row == 0
+
+    result = source.load()
+    assert [error.source for error in result.errors] == [paths[0], paths[1]]
+
+    with pytest.raises(SourceError):
+        ShardedSource(str(tmp_path / "missing")).load()
+
+
+def test_client_pool_reuses_and_discards_clients():
+    """Clients are reused after success and closed after a failure."""
+    created, closed = [], []
+
+    class Client:
+        def close(self):
+            closed.append(self)
+
+    def factory():
+        created.append(Client())
+        return created[-1]
+
+    pool = ClientPool(factory, size=1)
+    with pool.client() as first:
+        pass
+    with pool.client() as second:
+        assert second is first
+        with pytest.raises(SourceTimeout):
+            with pool.client(timeout=0.01):
+                pass
+    with pytest.raises(RuntimeError):
+        with pool.client():
+            raise RuntimeError("query failed")
+    assert closed == [first]
+    with pool.client() as third:
+        assert third is not first
+    assert len(created) == 2
+
+
+def test_sqlite_query_timeout(tmp_path):
+    """Queries running past their timeout are interrupted."""
+    client = SQLiteClient(str(tmp_path / "empty.db"))
+    slow = (
+        "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) "
+        "SELECT count(*) FROM n"
+    )
+    with pytest.raises(SourceTimeout):
+        list(client.query_pages(slow, page_size=10, timeout=0.05))
+    client.close()
+
+
+@pytest.mark.asyncio
+async def test_source_fetch_runs_off_loop():
+    """The async interface loads in a worker thread."""
+    result = await CSVSource().fetch()
+    assert result.rows_loaded > 0
+
+
+def test_create_source(sqlite_path):
+    """Settings select the source type."""
+    assert isinstance(create_source(Settings()), CSVSource)
+    source = create_source(Settings(data_source="sqlite", data_path=sqlite_path))
+    assert isinstance(source, SQLiteSource)
+    source = create_source(
+        Settings(data_source="shards", data_path="/data", ingest_workers=3)
+    )
+    assert isinstance(source, ShardedSource) and source.workers == 3
+    with pytest.raises(ValueError):
+        create_source(Settings(data_source="parquet"))
+    with pytest.raises(ValueError):
+        create_source(Settings(data_source="ftp"))
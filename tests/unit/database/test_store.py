@@ -0,0 +1,175 @@
+"""Unit tests for the columnar trend table."""
+
+import pytest
+import numpy as np
+from app.store import DictionaryColumn, TrendTable, COLUMNS
+
+
+def make_record(country, level_1, weekly, level_3="leaf"):
+    return {
+        "event_date": "2025-02-09",
+        "campaign_country": country,
+        "product_category_level_1": level_1,
+        "product_category_level_2": f"{level_1} sub",
+        "product_category_level_3": level_3,
+        "revenue_daily_change": 0.1,
+        "revenue_weekly_change": weekly,
+        "revenue_monthly_change": -0.2,
+        "commission_daily_change": 0.3,
+        "commission_weekly_change": 0.4,
+        "commission_monthly_change": -0.5,
+    }
+
+
+@pytest.fixture
+def table():
+    return TrendTable.from_records(
+        [
+            make_record("US", "electronics", 0.5, "a"),
+            make_record("UK", "electronics", -0.2, "b"),
+            make_record("US", "home & garden", -0.7, "c"),
+            make_record("US", "electronics", 0.9, "d"),
+            make_record("US", "toys", 0.0, "e"),
+        ]
+    )
+
+
+def test_dictionary_encoding():
+    column = DictionaryColumn.encode(["US", "UK", "US", "AUSTRALIA"])
+    assert column.values == ("US", "UK", "AUSTRALIA")
+    assert column.codes.tolist() == [0, 1, 0, 2]
+    assert column.code_of("missing") == -1
+    assert column.distinct() == ["AUSTRALIA", "UK", "US"]
+
+
+def test_rows_behave_like_dicts(table):
+    row = table[0]
+    assert row["campaign_country"] == "US"
+    assert row.product_category_level_3 == "a"
+    assert row.revenue_weekly_change == 0.5
+    assert list(row) == list(COLUMNS)
+    assert dict(row) == make_record("US", "electronics", 0.5, "a")
+    with pytest.raises(AttributeError):
+        _ = row.not_a_column
+
+
+def test_to_records_round_trip(table):
+    records = table.to_records()
+    assert TrendTable.from_records(records).to_records() == records
+
+
+def test_to_records_projection_and_slice(table):
+    records = table.to_records()
+    projected = table.to_records(["revenue_weekly_change", "campaign_country"], 1, 3)
+    assert projected == [
+        {
+            "revenue_weekly_change": r["revenue_weekly_change"],
+            "campaign_country": r["campaign_country"],
+        }
+        for r in records[1:3]
+    ]
+    assert list(projected[0]) == ["revenue_weekly_change", "campaign_country"]
+    assert len(records) == len(table) == 5
+
+
+def test_mask_and_select(table):
+    mask = table.mask(campaign_country="US", product_category_level_1="electronics")
+    subset = table.select(mask)
+    assert [r.product_category_level_3 for r in subset] == ["a", "d"]
+    assert not table.mask(campaign_country="FR").any()
+
+
+def test_ranked_excludes_zero_and_orders_by_magnitude(table):
+    gainers = table.ranked("revenue_weekly_change", ascending=False)
+    losers = table.ranked("revenue_weekly_change", ascending=True)
+    assert [table[i].product_category_level_3 for i in gainers] == ["d", "a"]
+    assert [table[i].product_category_level_3 for i in losers] == ["c", "b"]
+
+
+def test_order_by_absolute_is_stable():
+    table = TrendTable.from_records(
+        [make_record("US", "x", w, str(i)) for i, w in enumerate([0.1, -0.3, 0.3])]
+    )
+    order = table.order_by("revenue_weekly_change", descending=True, absolute=True)
+    assert order.tolist() == [1, 2, 0]
+
+
+def test_distinct_ignores_unused_dictionary_values(table):
+    subset = table.select(table.mask(campaign_country="UK"))
+    assert subset.distinct("product_category_level_1") == ["electronics"]
+    assert table.distinct("campaign_country") == ["UK", "US"]
+
+
+def test_empty_table():
+    table = TrendTable.empty()
+    assert len(table) == 0
+    assert not table
+    assert table.to_records() == []
+    assert table.ranked("revenue_weekly_change").size == 0
+    assert isinstance(table.metric("revenue_daily_change"), np.ndarray)
+
+
+def test_upsert_replaces_and_merges_in_order(table):
+    ordered = table.select(
+        table.order_by("revenue_weekly_change", descending=True, absolute=True)
+    )
+    delta = TrendTable.from_records(
+        [
+            make_record("US", "electronics", -0.6, "a"),  # replaces 0.5
+            dict(make_record("FR", "toys", 0.3, "f"), event_date="2025-02-10"),
+        ]
+    )
+    merged = ordered.upsert(
+        delta, order_by="revenue_weekly_change", descending=True, absolute=True
+    )
+    assert [r.product_category_level_3 for r in merged] == [
+        "d",
+        "c",
+        "a",
+        "f",
+        "b",
+        "e",
+    ]
+    assert merged[2].revenue_weekly_change == -0.6
+    assert merged.distinct("campaign_country") == ["FR", "UK", "US"]
+    assert merged.version not in (ordered.version, delta.version)
+    assert ordered.upsert(TrendTable.empty()) is ordered
+
+
+def test_upsert_without_order_appends(table):
+    delta = TrendTable.from_records([make_record("UK", "electronics", 0.1, "b")])
+    merged = table.upsert(delta)
+    assert [r.product_category_level_3 for r in merged] == ["a", "c", "d", "e", "b"]
+    assert merged[4].revenue_weekly_change == 0.1
+
+
+def test_without_drops_rows_sharing_keys(table):
+    """Only the key columns of the other table are matched, not its metrics."""
+    other = TrendTable.from_records(
+        [make_record("US", "electronics", 0.9, "a"), make_record("DE", "toys", 0.1)]
+    )
+    keys = TrendTable(dict(other.dimensions), {})
+    rest = table.without(keys)
+    assert rest.to_records() == table.to_records()[1:]
+    assert rest.version != table.version
+    assert table.without(TrendTable.empty()) is table
+
+
+def test_concat_merges_dictionaries(table):
+    """Concatenated tables re-encode dimensions against one dictionary."""
+    other = TrendTable.from_records(
+        [make_record("DE", "toys", 0.9), make_record("US", "electronics", 0.1)]
+    )
+    merged = TrendTable.concat([table, other])
+    assert merged.to_records() == table.to_records() + other.to_records()
+    assert merged.dimensions["campaign_country"].values.count("US") == 1
+    assert TrendTable.concat([]).to_records() == []
+
+
+def test_slice_is_a_view(table):
+    """Slices share the parent's arrays and keep its dictionaries."""
+    part = table.slice(1, 3)
+    assert part.to_records() == table.to_records()[1:3]
+    assert np.shares_memory(
+        part.metrics["revenue_weekly_change"], table.metrics["revenue_weekly_change"]
+    )
@@ -0,0 +1,63 @@
+"""Unit tests for the top-K selection engine."""
+
+import numpy as np
+import pytest
+from app.store import METRIC_COLUMNS, TrendTable
+from app.topk import TopK, top_indices
+
+
+@pytest.fixture
+def table():
+    """Random table with many tied and zero values."""
+    rng = np.random.default_rng(7)
+    return TrendTable.from_records(
+        {
+            "campaign_country": ["US", "UK", "FR"][i % 3],
+            "product_category_level_1": ["toys", "electronics"][i % 2],
+            **{m: float(rng.integers(-5, 6)) for m in METRIC_COLUMNS},
+        }
+        for i in range(500)
+    )
+
+
+@pytest.mark.parametrize("k", [1, 5, 40, 1000])
+def test_top_indices_matches_full_ranking(table, k):
+    """Partial selection returns exactly the head of the full ranking."""
+    for metric in METRIC_COLUMNS:
+        values = table.metric(metric)
+        for largest in (True, False):
+            expected = table.ranked(metric, ascending=not largest)[:k]
+            assert top_indices(values, k, largest).tolist() == expected.tolist()
+
+
+def test_scoped_top(table):
+    """Selections can be scoped by country and category."""
+    top = TopK(table, max_k=10)
+    gainers, losers = top.top(
+        "commission_daily_change", 3, country="UK", category="toys"
+    )
+    where = table.mask(campaign_country="UK", product_category_level_1="toys")
+    expected = table.ranked("commission_daily_change", ascending=False, where=where)
+    assert [dict(r) for r in gainers] == [dict(table[i]) for i in expected[:3]]
+    assert all(r.campaign_country == "UK" for r in gainers + losers)
+    assert all(r.commission_daily_change < 0 for r in losers)
+    assert top.top("revenue_daily_change", 5, country="nowhere") == ([], [])
+
+
+def test_unknown_scopes_are_not_cached(table):
+    """Values missing from the table's dictionaries do not grow the cache."""
+    top = TopK(table, max_k=10)
+    cached = len(top._selections)
+    for value in ("nowhere", "elsewhere"):
+        assert top.top("revenue_daily_change", 5, category=value) == ([], [])
+    assert len(top._selections) == cached
+    top.top("revenue_daily_change", 5, country="UK")
+    assert len(top._selections) == cached + 1
+
+
+def test_top_rejects_bad_arguments(table):
+    top = TopK(table, max_k=10)
+    with pytest.raises(KeyError):
+        top.top("event_date", 5)
+    with pytest.raises(ValueError):
+        top.top("revenue_daily_change", 11)
@@ -0,0 +1,138 @@
+"""Tests for admission control: lanes, token buckets and the middleware."""
+
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from app.admission import (
+    AdmissionController,
+    AdmissionMiddleware,
+    Lane,
+    TokenBuckets,
+    client_address,
+)
+from app.main import app as trends_app
+
+
+def test_token_bucket_refills_at_rate():
+    buckets = TokenBuckets(rate=2.0, burst=2.0)
+    assert buckets.take("a", now=0.0) == 0
+    assert buckets.take("a", now=0.0) == 0
+    assert buckets.take("a", now=0.0) == pytest.approx(0.5)
+    assert buckets.take("b", now=0.0) == 0
+    assert buckets.take("a", now=1.0) == 0
+
+
+def test_token_bucket_forgets_least_recent_clients():
+    buckets = TokenBuckets(rate=1.0, burst=1.0, max_clients=2)
+    buckets.take("a", now=0.0)
+    buckets.take("b", now=0.0)
+    buckets.take("c", now=0.0)
+    assert buckets.take("a", now=0.0) == 0
+    assert buckets.take("c", now=0.0) > 0
+
+
+def test_client_address_trusts_only_the_proxy_hops():
+    """Behind a proxy, the entry it appended is used, not what the client sent."""
+    scope = {
+        "client": ("10.1.2.3", 4321),
+        "headers": [
+            (b"x-forwarded-for", b"6.6.6.6, 203.0.113.7"),
+            (b"x-forwarded-for", b"198.51.100.2"),
+        ],
+    }
+    assert client_address(scope) == "10.1.2.3"
+    assert client_address(scope, forwarded_hops=1) == "198.51.100.2"
+    assert client_address(scope, forwarded_hops=2) == "203.0.113.7"
+    assert client_address({"client": ("10.1.2.3", 1)}, forwarded_hops=1) == "10.1.2.3"
+    assert client_address({}, forwarded_hops=1) == "unknown"
+
+
+@pytest.mark.asyncio
+async def test_lane_queues_then_sheds():
+    lane = Lane("api", concurrency=1, queue_depth=1, queue_timeout=5.0)
+    assert await lane.acquire() is None
+    waiting = asyncio.create_task(lane.acquire())
+    await asyncio.sleep(0)
+    assert lane.queued == 1
+    assert await lane.acquire() == "queue_full"
+
+    lane.release()
+    assert await waiting is None
+    assert lane.in_flight == 1 and lane.queued == 0
+    lane.release()
+    assert lane.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_lane_wait_times_out():
+    lane = Lane("api", concurrency=1, queue_depth=4, queue_timeout=0.01)
+    await lane.acquire()
+    assert await lane.acquire() == "queue_timeout"
+    assert lane.queued == 0
+    lane.release()
+    assert lane.in_flight == 0
+
+
+@pytest.fixture
+def controller():
+    return AdmissionController(
+        lanes={
+            "api": Lane("api", 1, 0, 1.0),
+            "fragment": Lane("fragment", 1, 0, 1.0),
+        },
+        buckets=TokenBuckets(rate=1.0, burst=3.0),
+        retry_after=3.0,
+    )
+
+
+def test_middleware_sheds_by_lane_and_client(controller):
+    """Saturated lanes get 503, fast clients 429, and /health neither."""
+    release = asyncio.Event()
+
+    async def slow(request):
+        await release.wait()
+        return PlainTextResponse("slow")
+
+    async def fast(request):
+        return PlainTextResponse("ok")
+
+    app = Starlette(
+        routes=[
+            Route("/api/trends", slow),
+            Route("/api/trends/filter", fast),
+            Route("/health", fast),
+        ]
+    )
+    app.add_middleware(AdmissionMiddleware, controller=controller)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as c:
+            blocked = asyncio.create_task(c.get("/api/trends"))
+            await asyncio.sleep(0.01)
+            shed = await c.get("/api/trends")
+            # The fragment lane is separate from the saturated API lane
+            fragment = await c.get("/api/trends/filter")
+            limited = await c.get("/api/trends/filter")
+            health = [await c.get("/health") for _ in range(5)]
+            release.set()
+            return shed, fragment, limited, health, await blocked
+
+    shed, fragment, limited, health, blocked = asyncio.run(scenario())
+    assert shed.status_code == 503 and shed.headers["retry-after"] == "3"
+    assert fragment.status_code == 200
+    assert limited.status_code == 429 and limited.headers["retry-after"] == "1"
+    assert all(response.status_code == 200 for response in health)
+    assert blocked.status_code == 200
+    assert controller.lanes["api"].in_flight == 0
+
+
+def test_app_exposes_admission_metrics():
+    exposed = TestClient(trends_app).get("/metrics").text
+    assert "trend_admission_shed_total" in exposed
@@ -0,0 +1,133 @@
+"""Tests for the fingerprinted, precompressed static assets."""
+
+import gzip
+import json
+import os
+
+import brotli
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+from app.assets import (
+    IMMUTABLE_CACHE_CONTROL,
+    REVALIDATE_CACHE_CONTROL,
+    StaticAssets,
+    build_assets,
+    main,
+    pick_encoding,
+)
+
+CSS = b"body { color: #333; }\n" * 100
+
+
+@pytest.fixture
+def source_dir(tmp_path):
+    source = tmp_path / "static"
+    (source / "img").mkdir(parents=True)
+    (source / "styles.css").write_bytes(CSS)
+    (source / "img" / "logo.png").write_bytes(b"\x89PNG" + bytes(range(256)) * 8)
+    return str(source)
+
+
+def client_for(assets: StaticAssets) -> TestClient:
+    return TestClient(Starlette(routes=[Mount("/static", assets)]))
+
+
+def test_build_fingerprints_and_precompresses(source_dir, tmp_path):
+    out_dir = str(tmp_path / "build")
+    manifest = build_assets(source_dir, out_dir)
+
+    css = manifest["styles.css"]
+    assert css.startswith("styles.") and css.endswith(".css") and css != "styles.css"
+    with open(os.path.join(out_dir, "manifest.json")) as f:
+        assert json.load(f) == manifest
+    with open(os.path.join(out_dir, css + ".br"), "rb") as f:
+        assert brotli.decompress(f.read()) == CSS
+    with open(os.path.join(out_dir, css + ".gz"), "rb") as f:
+        assert gzip.decompress(f.read()) == CSS
+    # Images are copied but never compressed again
+    png = manifest["img/logo.png"]
+    assert os.path.exists(os.path.join(out_dir, png))
+    assert not os.path.exists(os.path.join(out_dir, png + ".gz"))
+
+    # Unchanged content keeps its name between builds
+    assert build_assets(source_dir, str(tmp_path / "again")) == manifest
+
+
+def test_pick_encoding():
+    available = ("br", "gzip")
+    assert pick_encoding("gzip, deflate, br", available) == "br"
+    assert pick_encoding("gzip", available) == "gzip"
+    assert pick_encoding("br;q=0, gzip;q=0.5", available) == "gzip"
+    assert pick_encoding("*", available) == "br"
+    assert pick_encoding("identity", available) is None
+    assert pick_encoding("", available) is None
+
+
+def test_serves_precompressed_variants(source_dir, tmp_path):
+    out_dir = str(tmp_path / "build")
+    manifest = build_assets(source_dir, out_dir)
+    assets = StaticAssets(source_dir, build_dir=out_dir)
+    client = client_for(assets)
+    url = f"/static/{assets.url('styles.css')}"
+    assert url == f"/static/{manifest['styles.css']}"
+
+    response = client.get(url, headers={"Accept-Encoding": "br, gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "br"
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["content-type"].startswith("text/css")
+    assert response.content == CSS
+
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.content == CSS
+
+    response = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.content == CSS
+
+    # The plain name still works, but is revalidated rather than immutable
+    response = client.get("/static/styles.css", headers={"Accept-Encoding": "br"})
+    assert response.headers["cache-control"] == REVALIDATE_CACHE_CONTROL
+    etag = response.headers["etag"]
+    response = client.get(
+        "/static/styles.css", headers={"Accept-Encoding": "br", "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.content == b""
+
+    response = client.head(url, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert int(response.headers["content-length"]) < len(CSS)
+    assert client.get("/static/img/logo.png").headers.get("content-encoding") is None
+
+
+def test_unknown_paths_and_methods(source_dir):
+    client = client_for(StaticAssets(source_dir))
+    assert client.get("/static/missing.css").status_code == 404
+    assert client.get("/static/../assets.py").status_code == 404
+    assert client.post("/static/styles.css").status_code == 405
+    # Without a build the directory is served as is
+    response = client.get("/static/styles.css")
+    assert response.content == CSS
+    assert response.headers["cache-control"] == REVALIDATE_CACHE_CONTROL
+
+
+def test_memory_budget_evicts_least_recently_used(source_dir):
+    assets = StaticAssets(source_dir, memory_bytes=len(CSS) + 10)
+    client = client_for(assets)
+    client.get("/static/styles.css")
+    client.get("/static/img/logo.png")
+    assert list(assets._memory) == [os.path.join(source_dir, "img", "logo.png")]
+    assert assets._memory_used <= assets.memory_bytes
+
+
+def test_cli_requires_out_dir(source_dir, tmp_path):
+    with pytest.raises(SystemExit):
+        main(["--source", source_dir])
+    main(["--source", source_dir, "--out", str(tmp_path / "build")])
+    assert os.path.exists(tmp_path / "build" / "manifest.json")
@@ -0,0 +1,59 @@
+"""Tests for the JSON and NDJSON encoding of trend rows."""
+
+import json
+
+import pytest
+
+from app.encoding import (
+    decode_cursor,
+    encode_cursor,
+    encode_json,
+    iter_ndjson,
+    parse_fields,
+)
+from app.store import COLUMNS, TrendTable
+
+
+@pytest.fixture
+def table():
+    return TrendTable.from_records(
+        [
+            {"campaign_country": country, "revenue_weekly_change": change}
+            for country, change in [("US", 0.5), ("UK", -0.25), ("DE", 0.125)]
+        ]
+    )
+
+
+def test_parse_fields():
+    assert parse_fields(None, COLUMNS) == COLUMNS
+    assert parse_fields(" revenue_daily_change,event_date,event_date", COLUMNS) == (
+        "revenue_daily_change",
+        "event_date",
+    )
+    with pytest.raises(ValueError, match="nope"):
+        parse_fields("event_date,nope", COLUMNS)
+    with pytest.raises(ValueError):
+        parse_fields(",", COLUMNS)
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor("abc123", 5000)) == ("abc123", 5000)
+    for invalid in ("", "!!", encode_cursor("abc", -1), "YWJj"):
+        with pytest.raises(ValueError):
+            decode_cursor(invalid)
+
+
+def test_json_matches_records(table):
+    assert json.loads(encode_json(table)) == table.to_records()
+    assert json.loads(encode_json(table, ["campaign_country"], 1)) == [
+        {"campaign_country": "UK"},
+        {"campaign_country": "DE"},
+    ]
+
+
+def test_ndjson_chunks(table):
+    chunks = list(iter_ndjson(table, ["campaign_country"], start=1, chunk_rows=1))
+    assert chunks == [b'{"campaign_country":"UK"}\n', b'{"campaign_country":"DE"}\n']
+    assert list(iter_ndjson(table, stop=0)) == []
+    lines = b"".join(iter_ndjson(table)).splitlines()
+    assert [json.loads(line) for line in lines] == table.to_records()
@@ -0,0 +1,94 @@
+"""Unit tests for the CSV / Parquet export encoders and the export cache."""
+
+import gzip
+import io
+import os
+import pytest
+from app.export import (
+    ExportCache,
+    csv_quote,
+    export_key,
+    gunzip_chunks,
+    gzip_chunks,
+    iter_csv,
+    iter_parquet,
+)
+from app.ingest import read_trend_csv
+from app.store import TrendTable
+
+
+@pytest.fixture
+def table(sample_trends_data):
+    records = sample_trends_data + [
+        dict(sample_trends_data[0], product_category_level_3='cables, "hdmi"')
+    ]
+    return TrendTable.from_records(records)
+
+
+def test_csv_quote():
+    """Only fields with separators, quotes or newlines are quoted."""
+    assert csv_quote("audio") == "audio"
+    assert csv_quote("home & garden, outdoor") == '"home & garden, outdoor"'
+    assert csv_quote('say "hi"') == '"say ""hi"""'
+
+
+def test_csv_export_round_trips(tmp_path, table):
+    """Chunked CSV reads back as the same rows, header first."""
+    chunks = list(iter_csv(table, chunk_rows=1))
+    assert len(chunks) == len(table) + 1
+    path = tmp_path / "export.csv"
+    path.write_bytes(b"".join(chunks))
+    assert read_trend_csv(str(path)).table.to_records() == table.to_records()
+
+    projected = b"".join(iter_csv(table, ["campaign_country"])).decode()
+    assert projected.splitlines() == ["campaign_country", "US", "UK", "US"]
+
+
+def test_parquet_export_round_trips(table):
+    """Parquet is written one row group per chunk, dimensions as dictionaries."""
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    data = b"".join(iter_parquet(table, row_group_rows=2))
+    parquet_file = pq.ParquetFile(io.BytesIO(data))
+    assert parquet_file.num_row_groups == 2
+    read = parquet_file.read()
+    assert read.to_pylist() == table.to_records()
+    assert pa.types.is_dictionary(read.schema.field("campaign_country").type)
+
+
+def test_gzip_chunks_round_trip(table):
+    """Chunks compressed as one stream decompress back chunk by chunk."""
+    raw = b"".join(iter_csv(table, chunk_rows=1))
+    compressed = b"".join(gzip_chunks(iter_csv(table, chunk_rows=1)))
+    assert gzip.decompress(compressed) == raw
+    halves = [compressed[: len(compressed) // 2], compressed[len(compressed) // 2 :]]
+    assert b"".join(gunzip_chunks(halves)) == raw
+
+
+def test_export_cache_stores_complete_exports(tmp_path):
+    """Exports are cached once fully streamed; cut-short streams leave nothing."""
+    cache = ExportCache(str(tmp_path), max_bytes=10)
+    key = export_key("v1", "US")
+    assert cache.get(key, "csv") is None
+
+    partial = cache.store(key, "csv", iter([b"abc", b"def"]))
+    assert next(partial) == b"abc"
+    partial.close()
+    assert os.listdir(tmp_path) == []
+
+    assert b"".join(cache.store(key, "csv", iter([b"abc", b"def"]))) == b"abcdef"
+    with open(cache.get(key, "csv"), "rb") as f:
+        assert f.read() == b"abcdef"
+
+    # Over budget: the least recently used export goes first
+    other = export_key("v2", "US")
+    b"".join(cache.store(other, "csv", iter([b"123456"])))
+    assert cache.get(key, "csv") is None
+    assert cache.get(other, "csv") is not None
+
+
+def test_export_cache_off_passes_chunks_through(tmp_path):
+    """With no byte budget nothing is written."""
+    cache = ExportCache(str(tmp_path / "exports"), max_bytes=0)
+    assert list(cache.store("key", "csv", iter([b"a", b"b"]))) == [b"a", b"b"]
+    assert not os.path.exists(tmp_path / "exports")
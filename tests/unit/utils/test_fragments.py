@@ -0,0 +1,41 @@
+"""Tests for the rendered fragment cache."""
+
+from app.fragments import Fragment, FragmentCache
+
+
+def test_fragment_round_trip():
+    fragment = Fragment.from_html("<p>hello</p>")
+    assert fragment.decompressed() == b"<p>hello</p>"
+    assert fragment.etag.startswith('"') and fragment.etag.endswith('"')
+    assert Fragment.from_html("<p>hello</p>") == fragment
+
+
+def test_fragment_matches_either_representation():
+    fragment = Fragment.from_html("<p>hello</p>")
+    assert fragment.matches(fragment.etag)
+    assert fragment.matches(f'"other", {fragment.gzip_etag}')
+    assert fragment.matches(f"W/{fragment.etag}")
+    assert fragment.matches("*")
+    assert not fragment.matches('"other"')
+    assert not fragment.matches(None)
+
+
+def test_cache_evicts_least_recently_used():
+    cache = FragmentCache(max_entries=2)
+    first, second, third = (Fragment.from_html(str(i)) for i in range(3))
+    cache.set(("v1", "a"), first)
+    cache.set(("v1", "b"), second)
+    assert cache.get(("v1", "a")) is first
+    cache.set(("v1", "c"), third)
+    assert len(cache) == 2
+    assert cache.get(("v1", "b")) is None
+    assert cache.get(("v1", "a")) is first
+    assert cache.get(("v1", "c")) is third
+    assert cache.hits == 3 and cache.misses == 1
+
+
+def test_cache_clear():
+    cache = FragmentCache()
+    cache.set(("v1",), Fragment.from_html("x"))
+    cache.clear()
+    assert len(cache) == 0
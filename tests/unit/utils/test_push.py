@@ -0,0 +1,55 @@
+"""Tests for the server-sent update broadcaster."""
+
+import asyncio
+import pytest
+from app.push import Broadcaster, BroadcasterFull, encode_event
+
+
+def test_encode_event_multiline():
+    message = encode_event("grid", "<div>\n  a\n</div>", event_id="v1")
+    assert message == b"event: grid\nid: v1\ndata: <div>\ndata:   a\ndata: </div>\n\n"
+
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_gets_latest_only():
+    broadcaster = Broadcaster()
+    subscriber = broadcaster.subscribe(("all", "US"))
+    broadcaster.broadcast("ticker", "old", "v1")
+    broadcaster.broadcast("ticker", "new", "v2")
+    broadcaster.broadcast("grid", "grid", "v2", scope=("all", "US"))
+
+    messages = await subscriber.next(timeout=1)
+    assert messages == [
+        encode_event("ticker", "new", "v2"),
+        encode_event("grid", "grid", "v2"),
+    ]
+    assert await subscriber.next(timeout=0.01) == []
+
+
+@pytest.mark.asyncio
+async def test_scoped_broadcast_and_capacity():
+    broadcaster = Broadcaster(max_subscribers=2)
+    us = broadcaster.subscribe(("all", "US"))
+    uk = broadcaster.subscribe(("all", "UK"))
+    with pytest.raises(BroadcasterFull):
+        broadcaster.subscribe(("all", "US"))
+
+    assert broadcaster.broadcast("grid", "uk", "v1", scope=("all", "UK")) == 1
+    assert await us.next(timeout=0.01) == []
+    assert await uk.next(timeout=0.01) == [encode_event("grid", "uk", "v1")]
+
+    broadcaster.unsubscribe(uk)
+    broadcaster.unsubscribe(uk)
+    assert len(broadcaster) == 1
+    assert broadcaster.scopes() == [("all", "US")]
+    assert broadcaster.subscribe(("toys", "UK")) is not None
+
+
+@pytest.mark.asyncio
+async def test_waiting_subscriber_is_woken():
+    broadcaster = Broadcaster()
+    subscriber = broadcaster.subscribe(None)
+    waiting = asyncio.create_task(subscriber.next(timeout=1))
+    await asyncio.sleep(0)
+    broadcaster.broadcast("ticker", "t", "v1")
+    assert await waiting == [encode_event("ticker", "t", "v1")]
@@ -0,0 +1,31 @@
+"""Tests for the template bytecode cache."""
+
+import os
+
+import pytest
+
+from app.templating import create_templates, main, precompile
+
+
+def test_precompile_fills_bytecode_cache(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    templates = create_templates(cache_dir=cache_dir)
+    count = precompile(templates)
+    assert count == len(templates.env.list_templates()) > 0
+    assert len(os.listdir(cache_dir)) == count
+
+    # Another worker loads the compiled templates and renders the same way
+    other = create_templates(cache_dir=cache_dir)
+    html = other.get_template("ticker.html").render(trends=[])
+    assert html == templates.get_template("ticker.html").render(trends=[])
+
+
+def test_templates_without_cache():
+    assert create_templates().env.bytecode_cache is None
+
+
+def test_cli_requires_cache_dir(tmp_path, capsys):
+    with pytest.raises(SystemExit):
+        main([])
+    main(["--cache-dir", str(tmp_path)])
+    assert "Compiled" in capsys.readouterr().out
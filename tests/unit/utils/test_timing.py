@@ -0,0 +1,41 @@
+"""Tests for per-request phase timing."""
+
+import asyncio
+
+from prometheus_client import CollectorRegistry, Histogram
+
+from app import timing
+
+
+def test_phases_recorded_for_current_request():
+    phases = timing.start_request()
+    with timing.phase("filter"):
+        pass
+    timing.observe("render", 0.25)
+    assert [name for name, _ in phases] == ["filter", "render"]
+    assert phases[1] == ("render", 0.25)
+    assert phases[0][1] >= 0
+
+
+def test_phases_observed_in_histogram():
+    histogram = Histogram(
+        "test_phase_seconds", "", ["phase"], registry=CollectorRegistry()
+    )
+    timing.observe("read", 0.5, histogram)
+    assert histogram.labels("read")._sum.get() == 0.5
+
+
+def test_phases_shared_with_tasks_started_by_request():
+    async def handle() -> timing.Phases:
+        phases = timing.start_request()
+        await asyncio.create_task(asyncio.to_thread(timing.observe, "read", 1.0))
+        return phases
+
+    assert asyncio.run(handle()) == [("read", 1.0)]
+
+
+def test_server_timing_sums_repeated_phases():
+    header = timing.server_timing(
+        [("fetch", 0.001), ("render", 0.0025), ("fetch", 0.002)], 0.01
+    )
+    assert header == "fetch;dur=3.000, render;dur=2.500, total;dur=10.000"